@@ -0,0 +1,408 @@
+import csv
+import hashlib
+import io
+import json
+import os
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from database import init_db, FAST_START
+from db_operations import (
+    save_handover_safe,
+    save_receive_safe,
+    get_dashboard_data,
+    get_dashboard_summary,
+    get_dashboard_changes,
+    dashboard_cursor,
+    get_active_lines,
+    get_pending_handovers,
+    get_missing_handovers,
+    get_handover_by_id,
+    search_handovers,
+    iter_handover_export_rows,
+    is_known_employee
+)
+
+# ===== REST/JSON API =====
+# API cho MES / bảng andon đọc trạng thái bàn giao và tạo giao/nhận ca mà không
+# phải đi qua giao diện Streamlit. Các hàm db_operations là code đồng bộ
+# (SQLAlchemy sync) nên được chạy trong threadpool; event loop không bị chặn.
+#
+# Usage:
+#   python api.py                     (API_HOST/API_PORT, mặc định 127.0.0.1:8000)
+#   uvicorn api:app --workers 4
+
+# Danh sách API key (phân cách bằng dấu phẩy). Ghi dữ liệu và export luôn cần key hợp lệ;
+# nếu có đặt API_KEYS thì các API đọc khác cũng cần key.
+API_KEYS = {key.strip() for key in os.getenv('API_KEYS', '').split(',') if key.strip()}
+
+# Số dòng tối đa của một lần tìm kiếm
+API_SEARCH_MAX_LIMIT = 500
+
+# Các trường bắt buộc khi tạo giao ca / nhận ca (cùng định dạng dict với form Streamlit)
+HANDOVER_REQUIRED_FIELDS = ('ma_nv', 'ten_nv', 'line', 'ca', 'chu_ky', 'ngay')
+RECEIVE_REQUIRED_FIELDS = ('ma_nv', 'ten_nv', 'line', 'ca', 'chu_ky', 'ngay')
+
+# Giá trị hợp lệ: giống các lựa chọn trên form Streamlit
+CATEGORIES = ['5S', 'An Toàn', 'Chất Lượng', 'Thiết Bị', 'Kế Hoạch', 'Khác']
+SHIFT_OPTIONS = ['Ca Sáng (7h-19h)', 'Ca Tối (19h-7h)']
+CREW_OPTIONS = ['A', 'B', 'C', 'D']
+STATUS_OPTIONS = ['OK', 'NOK', 'NA']
+CONFIRM_OPTIONS = ['Đã xác nhận', 'Chưa xác nhận']
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def _dumps(content):
+    return json.dumps(content, ensure_ascii=False, default=_json_default, separators=(',', ':')).encode('utf-8')
+
+
+class APIJSONResponse(JSONResponse):
+    """JSONResponse hỗ trợ datetime/date và giữ nguyên tiếng Việt"""
+
+    def render(self, content):
+        return _dumps(content)
+
+
+def _error(status_code, message):
+    return APIJSONResponse({'error': message}, status_code=status_code)
+
+
+def _check_api_key(request, write=False, require_key=False):
+    """
+    Trả về response lỗi nếu request không có quyền, None nếu hợp lệ
+
+    Args:
+        write: API ghi dữ liệu (luôn cần key)
+        require_key: API đọc luôn cần key kể cả khi chưa cấu hình API_KEYS (export toàn bộ dữ liệu)
+    """
+    if not API_KEYS:
+        if write or require_key:
+            return _error(403, "API này chưa được bật (chưa cấu hình API_KEYS)")
+        return None
+    if request.headers.get('x-api-key') not in API_KEYS:
+        return _error(401, "API key không hợp lệ")
+    return None
+
+
+def _parse_date(value, default=None):
+    if not value:
+        return default
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+async def _read_json(request, required_fields):
+    """Đọc body JSON và kiểm tra các trường bắt buộc. Returns: (data, error_response)"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None, _error(400, "Body phải là JSON")
+    if not isinstance(data, dict):
+        return None, _error(400, "Body phải là JSON object")
+    missing = [field for field in required_fields if not data.get(field)]
+    if missing:
+        return None, _error(422, f"Thiếu trường bắt buộc: {', '.join(missing)}")
+    try:
+        _parse_date(data['ngay'])
+    except ValueError:
+        return None, _error(422, "Trường 'ngay' phải có định dạng YYYY-MM-DD")
+    return data, None
+
+
+def _validate_common(data):
+    """Kiểm tra nhân viên / line / ca giống form Streamlit. Returns: danh sách lỗi"""
+    errors = []
+    ma_nv = data['ma_nv']
+    if not isinstance(ma_nv, str) or not ma_nv.isdigit() or len(ma_nv) != 6:
+        errors.append("Mã nhân viên phải là số và có đúng 6 chữ số")
+    elif not is_known_employee(ma_nv):
+        errors.append("Mã nhân viên không có trong danh bạ nhân viên")
+    if not isinstance(data['ten_nv'], str) or len(data['ten_nv']) > 200:
+        errors.append("Tên nhân viên tối đa 200 ký tự")
+    if data['line'] not in get_active_lines():
+        errors.append(f"Line '{data['line']}' không tồn tại hoặc đã ngừng hoạt động")
+    if data['ca'] not in SHIFT_OPTIONS:
+        errors.append(f"Trường 'ca' phải là một trong: {', '.join(SHIFT_OPTIONS)}")
+    if data['chu_ky'] not in CREW_OPTIONS:
+        errors.append(f"Trường 'chu_ky' phải là một trong: {', '.join(CREW_OPTIONS)}")
+    return errors
+
+
+def _validate_handover(data):
+    """Kiểm tra dữ liệu giao ca: trạng thái hợp lệ, NOK/NA bắt buộc ghi chú (trừ 'Khác')"""
+    errors = _validate_common(data)
+    for category in CATEGORIES:
+        status = data.get(f"{category} - Tình Trạng")
+        comment = data.get(f"{category} - Comments") or ''
+        if status is None and category == 'Khác':
+            continue
+        if status not in STATUS_OPTIONS:
+            errors.append(f"Trạng thái '{category}' phải là một trong: {', '.join(STATUS_OPTIONS)}")
+        elif category != 'Khác' and status in ('NOK', 'NA') and not str(comment).strip():
+            errors.append(f"'{category}' có trạng thái {status} - bắt buộc nhập ghi chú")
+    return errors
+
+
+def _validate_receive(data, handover):
+    """Kiểm tra dữ liệu nhận ca: xác nhận đủ các hạng mục, 'Khác' có thông tin thì phải xác nhận"""
+    errors = _validate_common(data)
+    for category in CATEGORIES:
+        confirm = data.get(f"{category} - Xác Nhận")
+        if category == 'Khác':
+            if confirm is not None and confirm not in CONFIRM_OPTIONS:
+                errors.append(f"Xác nhận 'Khác' phải là một trong: {', '.join(CONFIRM_OPTIONS)}")
+        elif confirm != 'Đã xác nhận':
+            errors.append(f"Chưa xác nhận hạng mục '{category}'")
+    khac_comment = str(handover.get('Khác - Comments') or '').strip() or str(data.get('Khác - Comments Nhận') or '').strip()
+    if khac_comment and data.get('Khác - Xác Nhận') != 'Đã xác nhận':
+        errors.append("Mục 'Khác' có thông tin nhưng chưa được xác nhận")
+    return errors
+
+
+# ===== HANDLERS =====
+
+async def health(request):
+    return APIJSONResponse({'status': 'ok'})
+
+
+async def lines(request):
+    if (denied := _check_api_key(request)):
+        return denied
+    return APIJSONResponse({'lines': await run_in_threadpool(get_active_lines)})
+
+
+async def dashboard(request):
+    """
+    Tóm tắt dashboard của một ngày (mặc định hôm nay), có ETag:
+    client gửi If-None-Match với ETag cũ sẽ nhận 304 nếu dữ liệu không đổi.
+    Có tham số since: chỉ trả các bàn giao thay đổi/bị bỏ ra sau mốc đó và mốc mới.
+    Có tham số limit: chỉ trả một trang, trang sau lấy bằng cursor=next_cursor
+    """
+    if (denied := _check_api_key(request)):
+        return denied
+    try:
+        work_date = _parse_date(request.query_params.get('date'), date.today())
+    except ValueError:
+        return _error(422, "Tham số 'date' phải có định dạng YYYY-MM-DD")
+    line = request.query_params.get('line') or None
+
+    since = request.query_params.get('since')
+    if since:
+        # Chỉ trả các bàn giao thay đổi sau mốc `watermark` của lần gọi trước
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            return _error(422, "Tham số 'since' phải có định dạng ISO 8601")
+        changes = await run_in_threadpool(get_dashboard_changes, work_date.strftime('%Y-%m-%d'), line, since)
+        if changes is None:
+            return _error(500, "Không lấy được thay đổi dashboard")
+        return APIJSONResponse({'date': work_date, 'line': line, **changes})
+
+    try:
+        limit = int(request.query_params['limit']) if request.query_params.get('limit') else None
+    except ValueError:
+        return _error(422, "Tham số 'limit' phải là số")
+    if limit is not None:
+        limit = max(1, min(limit, API_SEARCH_MAX_LIMIT))
+    cursor = request.query_params.get('cursor') or None
+    if cursor:
+        try:
+            datetime.fromisoformat(cursor.split('|', 1)[0])
+        except ValueError:
+            return _error(422, "Tham số 'cursor' không hợp lệ")
+
+    day = work_date.strftime('%Y-%m-%d')
+    summary = await run_in_threadpool(get_dashboard_summary, day, line)
+    if summary is None:
+        return _error(500, "Không lấy được số liệu dashboard")
+    items = await run_in_threadpool(get_dashboard_data, day, line, limit, cursor) or []
+    body = _dumps({
+        'date': work_date,
+        'line': line,
+        'summary': summary,
+        'items': items,
+        # Trang tiếp theo (phân trang keyset): gửi lại dưới dạng ?cursor=
+        'next_cursor': dashboard_cursor(items[-1]) if limit and len(items) == limit else None
+    })
+
+    etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if_none_match = request.headers.get('if-none-match', '')
+    if etag in [tag.strip() for tag in if_none_match.split(',')]:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type='application/json', headers=headers)
+
+
+async def pending(request):
+    if (denied := _check_api_key(request)):
+        return denied
+    try:
+        work_date = _parse_date(request.query_params.get('date'), date.today())
+    except ValueError:
+        return _error(422, "Tham số 'date' phải có định dạng YYYY-MM-DD")
+    lines_filter = request.query_params.getlist('line') or None
+    urgent_only = request.query_params.get('urgent') in ('1', 'true')
+    items = await run_in_threadpool(get_pending_handovers, work_date, lines_filter, urgent_only)
+    return APIJSONResponse({'date': work_date, 'items': items})
+
+
+async def missing(request):
+    if (denied := _check_api_key(request)):
+        return denied
+    try:
+        to_date = _parse_date(request.query_params.get('to'), date.today())
+        from_date = _parse_date(request.query_params.get('from'), to_date)
+    except ValueError:
+        return _error(422, "Tham số 'from'/'to' phải có định dạng YYYY-MM-DD")
+    lines_filter = request.query_params.getlist('line') or None
+    items = await run_in_threadpool(get_missing_handovers, from_date, to_date, lines_filter)
+    if items is None:
+        return _error(500, "Không lấy được danh sách ca chưa bàn giao")
+    return APIJSONResponse({'from': from_date, 'to': to_date, 'items': items})
+
+
+async def search(request):
+    if (denied := _check_api_key(request)):
+        return denied
+    params = request.query_params
+    try:
+        limit = max(1, min(int(params.get('limit', 50)), API_SEARCH_MAX_LIMIT))
+    except ValueError:
+        return _error(422, "Tham số 'limit' phải là số")
+    results = await run_in_threadpool(
+        search_handovers,
+        search_term=params.get('q') or None,
+        from_date=params.get('from') or None,
+        to_date=params.get('to') or None,
+        line=params.get('line') or None,
+        status=params.get('status') or None,
+        limit=limit
+    )
+    return APIJSONResponse({'items': results})
+
+
+async def handover_detail(request):
+    if (denied := _check_api_key(request)):
+        return denied
+    handover = await run_in_threadpool(get_handover_by_id, request.path_params['handover_id'])
+    if not handover:
+        return _error(404, "Không tìm thấy bàn giao")
+    return APIJSONResponse(handover)
+
+
+async def create_handover(request):
+    """
+    Tạo giao ca. Header Idempotency-Key (tùy chọn) được dùng làm request_key:
+    gửi lại cùng key trả về bàn giao đã tạo thay vì tạo bản mới
+    """
+    if (denied := _check_api_key(request, write=True)):
+        return denied
+    data, error = await _read_json(request, HANDOVER_REQUIRED_FIELDS)
+    if error:
+        return error
+
+    errors = await run_in_threadpool(_validate_handover, data)
+    if errors:
+        return APIJSONResponse({'error': "Dữ liệu không hợp lệ", 'details': errors}, status_code=422)
+
+    request_key = request.headers.get('idempotency-key') or None
+    if request_key and len(request_key) > 64:
+        return _error(422, "Idempotency-Key tối đa 64 ký tự")
+
+    success, result = await run_in_threadpool(save_handover_safe, data, request_key=request_key)
+    if not success:
+        return _error(500, result)
+    return APIJSONResponse({'handover_id': result}, status_code=201)
+
+
+async def receive_handover(request):
+    if (denied := _check_api_key(request, write=True)):
+        return denied
+    data, error = await _read_json(request, RECEIVE_REQUIRED_FIELDS)
+    if error:
+        return error
+
+    handover_id = request.path_params['handover_id']
+    handover = await run_in_threadpool(get_handover_by_id, handover_id)
+    if not handover:
+        return _error(404, "Không tìm thấy bàn giao")
+    errors = await run_in_threadpool(_validate_receive, data, handover)
+    if errors:
+        return APIJSONResponse({'error': "Dữ liệu không hợp lệ", 'details': errors}, status_code=422)
+
+    success, message = await run_in_threadpool(save_receive_safe, data, handover_id)
+    if success:
+        return APIJSONResponse({'handover_id': handover_id, 'status': 'Đã nhận'}, status_code=201)
+    if message == "Không tìm thấy bàn giao":
+        return _error(404, message)
+    if message == "Bàn giao đã được nhận bởi người khác":
+        return _error(409, message)
+    return _error(500, message)
+
+
+async def export_handovers_csv(request):
+    """Export CSV dạng stream: đọc DB theo lô và gửi dần, không dựng toàn bộ file trong bộ nhớ"""
+    if (denied := _check_api_key(request, require_key=True)):
+        return denied
+    from_date = request.query_params.get('from') or None
+    to_date = request.query_params.get('to') or None
+
+    def generate():
+        buffer = io.StringIO()
+        writer = None
+        for row in iter_handover_export_rows(from_date, to_date):
+            if writer is None:
+                # BOM để Excel đọc đúng tiếng Việt
+                buffer.write('﻿')
+                writer = csv.DictWriter(buffer, fieldnames=list(row.keys()))
+                writer.writeheader()
+            writer.writerow(row)
+            if buffer.tell() > 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+
+    # Starlette chạy generator đồng bộ trong threadpool
+    return StreamingResponse(
+        generate(),
+        media_type='text/csv; charset=utf-8',
+        headers={'Content-Disposition': 'attachment; filename="handovers.csv"'}
+    )
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Giống app Streamlit: tạo/cập nhật schema khi khởi động, trừ khi FAST_START
+    if not FAST_START:
+        await run_in_threadpool(init_db)
+    yield
+
+
+routes = [
+    Route('/api/health', health),
+    Route('/api/lines', lines),
+    Route('/api/dashboard', dashboard),
+    Route('/api/pending', pending),
+    Route('/api/missing', missing),
+    Route('/api/handovers', create_handover, methods=['POST']),
+    Route('/api/handovers/search', search),
+    Route('/api/handovers/{handover_id}', handover_detail),
+    Route('/api/handovers/{handover_id}/receive', receive_handover, methods=['POST']),
+    Route('/api/export/handovers.csv', export_handovers_csv),
+]
+
+app = Starlette(routes=routes, lifespan=lifespan)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host=os.getenv('API_HOST', '127.0.0.1'), port=int(os.getenv('API_PORT', '8000')))
@@ -1,19 +1,31 @@
 import streamlit as st
-import pandas as pd
-from datetime import datetime, date
+import streamlit.components.v1 as components
+from datetime import datetime, date, timedelta
 import os
 import time
-from database import init_db
+import uuid
+from database import init_db, FAST_START
 from db_operations import (
-    save_handover_safe,
-    save_receive_safe,
-    get_latest_handover,
     check_handover_received,
+    get_receive_screen_data,
+    get_pending_handovers,
+    save_receives_batch,
     get_dashboard_data,
+    get_dashboard_changes,
+    merge_dashboard_changes,
+    dashboard_cursor,
     check_login,
     get_active_lines,
+    get_line_catalog,
     get_all_lines,
     save_lines_config,
+    get_shift_grid,
+    get_shift_rules,
+    save_shift_rules,
+    lookup_employee_name,
+    is_known_employee,
+    import_employees_csv,
+    get_employee_history,
     get_handover_data_for_export,
     get_receive_data_for_export,
     get_latest_handovers_for_display,
@@ -24,7 +36,32 @@ from db_operations import (
     delete_handover,
     get_receive_by_handover_id,
     delete_receive,
-    search_handovers
+    search_handovers,
+    # Thùng rác (xóa mềm)
+    restore_handover,
+    restore_receive,
+    get_deleted_items
+)
+from db_analytics import get_nok_trends, get_receive_latency_stats
+from auth import (
+    create_session_token, verify_session_token, revoke_session_token,
+    login_rate_limiter, login_rate_limit_keys, SESSION_TTL_HOURS
+)
+from sla_monitor import get_open_sla_alerts, start_sla_monitor, SLA_MINUTES, SLA_CHECK_INTERVAL_SECONDS
+from data_purge import start_purge_job, SOFT_DELETE_RETENTION_DAYS
+from discrepancy import get_discrepancy_report, start_discrepancy_job, DISCREPANCY_INTERVAL_SECONDS
+from consistency import run_consistency_check, start_consistency_job, CONSISTENCY_INTERVAL_SECONDS, CONSISTENCY_AUTO_REPAIR
+from audit import get_audit_log, start_audit_writer
+from write_spool import (
+    submit_handover,
+    submit_receive,
+    replay_spool,
+    get_spool_status,
+    get_failed_spool_entries,
+    retry_spool_entries,
+    discard_spool_entries,
+    start_spool_replay_job,
+    WRITE_SPOOL_REPLAY_INTERVAL_SECONDS
 )
 
 # Cấu hình trang
@@ -183,6 +220,10 @@ select:has(option[value="NA"]:checked) {
 @st.cache_resource
 def initialize_database():
     """Khởi tạo database và tạo tables (chạy 1 lần khi app start)"""
+    if FAST_START:
+        # Schema đã được tạo khi deploy (python database.py init), không chạy
+        # create_all/seed ở lần render đầu tiên sau cold start
+        return True
     try:
         init_db()
         return True
@@ -190,14 +231,31 @@ def initialize_database():
         st.error(f"Lỗi khởi tạo database: {e}")
         return False
 
+# Khởi động các job chạy nền (1 lần cho mỗi process)
+@st.cache_resource
+def start_background_jobs():
+    """Khởi động SLA monitor, job purge dữ liệu đã xóa, job tổng hợp bất đồng giao-nhận, job kiểm tra nhất quán, job phát lại hàng đợi ghi tạm và writer audit chạy nền"""
+    # Ở chế độ khởi động nhanh, lần quét SLA đầu tiên chạy sau lần render đầu
+    start_sla_monitor(initial_delay=SLA_CHECK_INTERVAL_SECONDS if FAST_START else 0)
+    start_purge_job()
+    start_discrepancy_job(initial_delay=DISCREPANCY_INTERVAL_SECONDS if FAST_START else 0)
+    start_consistency_job(initial_delay=CONSISTENCY_INTERVAL_SECONDS if FAST_START else 0)
+    start_spool_replay_job()
+    start_audit_writer()
+    return True
+
 # Các hạng mục kiểm tra
 CATEGORIES = ['5S', 'An Toàn', 'Chất Lượng', 'Thiết Bị', 'Kế Hoạch', 'Khác']
 STATUS_OPTIONS = ['OK', 'NOK', 'NA']
 
+# Số bàn giao mỗi trang của danh sách chi tiết trên dashboard
+DASHBOARD_PAGE_SIZES = [5, 10, 20, 50]
+
 # Hàm validate mã nhân viên
-def validate_employee_id(emp_id):
+def validate_employee_id(emp_id, check_directory=True):
     """
-    Kiểm tra mã nhân viên phải là số và có đúng 6 chữ số
+    Kiểm tra mã nhân viên phải là số và có đúng 6 chữ số,
+    và (nếu đã import danh bạ) phải có trong danh bạ nhân viên
     """
     if not emp_id:
         return False, "Mã nhân viên không được để trống"
@@ -208,9 +266,251 @@ def validate_employee_id(emp_id):
     if len(emp_id) != 6:
         return False, "Mã nhân viên phải có đúng 6 chữ số"
     
+    if check_directory and not is_known_employee(emp_id):
+        return False, "Mã nhân viên không có trong danh bạ nhân viên"
+    
     return True, ""
 
 
+def autofill_employee_name(id_key, name_key):
+    """Callback khi nhập mã NV: điền tên từ danh bạ trong bộ nhớ (không truy vấn DB)"""
+    name = lookup_employee_name(st.session_state.get(id_key))
+    if name:
+        st.session_state[name_key] = name
+
+
+def apply_spool_action(action):
+    """Callback thử lại/bỏ qua các bản ghi đã chọn trong hàng đợi ghi tạm (xóa lựa chọn trước khi vẽ lại)"""
+    action(st.session_state.get('spool_selected_ids', []))
+    st.session_state.spool_selected_ids = []
+
+
+# Cookie giữ session token admin khi tải lại trang (token không nằm trên URL:
+# tránh lộ qua lịch sử trình duyệt, log proxy, header Referer hay link được chia sẻ).
+# Hạn chế: Streamlit không cho script đặt header Set-Cookie, cookie được ghi bằng JavaScript
+# nên KHÔNG thể là HttpOnly - script chạy trên trang (XSS) đọc được token. Giảm thiệt hại bằng
+# SESSION_TTL_HOURS ngắn và thu hồi token khi đăng xuất (revoke_session_token).
+SESSION_COOKIE = 'admin_session'
+
+
+def queue_session_cookie(token, max_age):
+    """Hẹn ghi cookie session (token rỗng + max_age=0 = xóa cookie) ở lần render kế tiếp"""
+    st.session_state.pending_session_cookie = (token, max_age)
+
+
+def get_login_client_key():
+    """
+    Key của client cho giới hạn đăng nhập sai (bên cạnh key theo username)
+    - Sau reverse proxy: IP do proxy gần nhất ghi (phần tử cuối của X-Forwarded-For, hoặc X-Real-Ip)
+    - Không có proxy: key ngẫu nhiên gắn với phiên trình duyệt
+    """
+    headers = st.context.headers
+    forwarded = headers.get('X-Forwarded-For')
+    if forwarded:
+        return 'ip:' + forwarded.split(',')[-1].strip()
+    if headers.get('X-Real-Ip'):
+        return 'ip:' + headers['X-Real-Ip'].strip()
+    if 'login_client_key' not in st.session_state:
+        st.session_state.login_client_key = uuid.uuid4().hex
+    return 'session:' + st.session_state.login_client_key
+
+
+def render_session_cookie():
+    """Ghi/xóa cookie session trên trình duyệt bằng component HTML ẩn (chỉ vẽ 1 lần sau đăng nhập/đăng xuất)"""
+    pending = st.session_state.pop('pending_session_cookie', None)
+    if pending is None:
+        return
+    token, max_age = pending
+    components.html(f"""
+        <script>
+        const secure = window.parent.location.protocol === 'https:' ? '; Secure' : '';
+        window.parent.document.cookie = '{SESSION_COOKIE}={token}; path=/; max-age={max_age}; SameSite=Strict' + secure;
+        </script>
+    """, height=0)
+
+
+def get_session_record(kind, record_id, loader):
+    """
+    Bản ghi đang sửa/xóa trong phiên: chỉ đọc DB lần đầu, các lần rerun (mỗi lần đổi
+    widget) dùng bản trong session_state. Khi lưu/xóa, mốc phiên bản của bản ghi
+    (version / id phiếu nhận) được kiểm tra lại trong database.
+    """
+    cache = st.session_state.setdefault('record_cache', {})
+    key = (kind, record_id)
+    if key not in cache:
+        record = loader(record_id)
+        if record is None:
+            return None
+        cache[key] = record
+    return cache[key]
+
+
+def drop_session_record(kind, record_id):
+    """Kết thúc phiên sửa/xóa (hoặc bản ghi đã cũ): lần sau đọc lại từ DB"""
+    st.session_state.get('record_cache', {}).pop((kind, record_id), None)
+
+
+def load_dashboard_snapshot(filter_date, filter_line):
+    """
+    Dữ liệu dashboard của phiên: lần đầu (hoặc khi đổi bộ lọc) tải toàn bộ ngày,
+    các lần làm mới sau chỉ lấy các bàn giao thay đổi từ mốc updated_at rồi gộp
+    vào snapshot trong session_state. Đổi tên line không tăng updated_at nên tên các
+    line cũng nằm trong khóa snapshot: danh mục đổi thì tải lại toàn bộ ngày.
+    """
+    line_names = tuple(line['line_name'] for line in get_line_catalog() or [])
+    key = (filter_date.strftime('%Y-%m-%d'), filter_line, line_names)
+    snapshot = st.session_state.get('dashboard_snapshot')
+    
+    if snapshot and snapshot['key'] == key:
+        changes = get_dashboard_changes(key[0], filter_line, snapshot['watermark'])
+        if changes is not None:
+            if changes['items'] or changes['removed']:
+                snapshot['items'] = merge_dashboard_changes(snapshot['items'], changes)
+            snapshot['watermark'] = changes['watermark']
+            return snapshot['items']
+    
+    # Mốc lấy TRƯỚC khi tải để không bỏ sót thay đổi xảy ra trong lúc tải
+    watermark = datetime.now()
+    items = get_dashboard_data(filter_date=key[0], filter_line=filter_line)
+    if items is None:
+        # Ngày chưa có dữ liệu (hoặc lỗi): lần sau tải lại toàn bộ
+        st.session_state.pop('dashboard_snapshot', None)
+        return None
+    
+    st.session_state.dashboard_snapshot = {'key': key, 'items': items, 'watermark': watermark}
+    return items
+
+
+def render_batch_receive():
+    """
+    Chế độ nhận nhiều ca: 1 người nhận xác nhận nhiều bàn giao chưa nhận
+    (nhiều line) và lưu tất cả trong 1 transaction
+    """
+    st.caption("📦 Dành cho trưởng ca phụ trách nhiều line: chọn các bàn giao chưa nhận, xác nhận từng hạng mục và lưu một lần")
+    
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        batch_ma_nv = st.text_input("Mã Nhân Viên * (6 chữ số)", key="batch_ma_nv", max_chars=6, placeholder="Ví dụ: 123456",
+                                    on_change=autofill_employee_name, args=("batch_ma_nv", "batch_ten_nv"))
+        batch_ngay = st.date_input("Ngày Làm Việc *", value=datetime.now(), key="batch_ngay")
+    
+    with col2:
+        batch_ten_nv = st.text_input("Tên Đầy Đủ *", key="batch_ten_nv")
+        batch_ca = st.selectbox("Ca Làm Việc *", ["Ca Sáng (7h-19h)", "Ca Tối (19h-7h)"], key="batch_ca")
+    
+    with col3:
+        batch_chu_ky = st.selectbox("Nhân viên thuộc ca *", ["A", "B", "C", "D"], key="batch_chu_ky")
+        batch_lines = st.multiselect("Lines phụ trách", get_active_lines(), key="batch_lines",
+                                     help="Để trống = tất cả lines")
+    
+    if batch_ma_nv:
+        is_valid, error_msg = validate_employee_id(batch_ma_nv)
+        if not is_valid:
+            st.error(f"⚠️ {error_msg}")
+    
+    col_btn1, col_btn2, col_btn3 = st.columns([1, 2, 1])
+    with col_btn2:
+        if st.button("🔍 TẢI BÀN GIAO CHƯA NHẬN", use_container_width=True, type="primary", key="batch_load"):
+            st.session_state.batch_pending = get_pending_handovers(batch_ngay, batch_lines or None)
+            if 'batch_results' in st.session_state:
+                del st.session_state.batch_results
+    
+    # Kết quả lần lưu gần nhất
+    if 'batch_results' in st.session_state:
+        st.markdown("### 📋 Kết Quả Nhận Ca")
+        for handover_id, (success, message) in st.session_state.batch_results.items():
+            if success:
+                st.success(f"✅ {handover_id}: Đã nhận ca thành công")
+            else:
+                st.error(f"❌ {handover_id}: {message}")
+    
+    pending = st.session_state.get('batch_pending')
+    if pending is None:
+        return
+    
+    if not pending:
+        st.info(f"📌 Không có bàn giao chưa nhận vào ngày **{batch_ngay.strftime('%d/%m/%Y')}**")
+        return
+    
+    st.markdown("---")
+    st.markdown(f"### ✅ Checklist Nhận Ca ({len(pending)} bàn giao chưa nhận)")
+    
+    selected = []
+    for handover in pending:
+        handover_id = handover['ID Giao Ca']
+        statuses = [handover.get(f"{category} - Tình Trạng") for category in CATEGORIES]
+        nok_icon = "🔴 " if 'NOK' in statuses else ""
+        
+        with st.expander(f"{nok_icon}**{handover['Line']}** - {handover['Ca']} - Nhóm {handover['Nhân viên thuộc ca']} | ID: {handover_id} | Người giao: {handover['Mã NV Giao Ca']} - {handover['Tên NV Giao Ca']}", expanded=True):
+            include = st.checkbox("Nhận bàn giao này", key=f"batch_select_{handover_id}", value=True)
+            
+            confirm_cols = st.columns(len(CATEGORIES))
+            confirmations = {}
+            for col, category in zip(confirm_cols, CATEGORIES):
+                with col:
+                    status = handover.get(f"{category} - Tình Trạng")
+                    status_icon = "🟢" if status == "OK" else "🔴" if status == "NOK" else "⚪"
+                    confirmations[category] = st.checkbox(
+                        f"{status_icon} {category}",
+                        key=f"batch_confirm_{handover_id}_{category}",
+                        help=handover.get(f"{category} - Comments") or None
+                    )
+            
+            comment = st.text_input("Ghi chú (nếu cần)", key=f"batch_comment_{handover_id}", placeholder="Nhập ghi chú...")
+            
+            if include:
+                selected.append((handover, confirmations, comment))
+    
+    st.markdown("---")
+    
+    col_btn1, col_btn2, col_btn3 = st.columns([1, 2, 1])
+    with col_btn2:
+        if st.button(f"✅ XÁC NHẬN NHẬN {len(selected)} CA", type="primary", use_container_width=True, key="batch_confirm_receive"):
+            errors = []
+            if not batch_ma_nv or not batch_ten_nv:
+                errors.append("❌ Chưa nhập Mã NV và Tên NV")
+            else:
+                is_valid, error_msg = validate_employee_id(batch_ma_nv)
+                if not is_valid:
+                    errors.append(f"❌ {error_msg}")
+            
+            if not selected:
+                errors.append("❌ Chưa chọn bàn giao nào")
+            
+            # Giống chế độ nhận từng ca: bắt buộc xác nhận các hạng mục (trừ "Khác")
+            for handover, confirmations, comment in selected:
+                missing = [category for category in CATEGORIES if category != "Khác" and not confirmations[category]]
+                if missing:
+                    errors.append(f"❌ **{handover['ID Giao Ca']}** chưa xác nhận: {', '.join(missing)}")
+            
+            if errors:
+                st.error("### ⚠️ Vui lòng hoàn thành các mục sau:\n\n" + "\n\n".join(errors))
+            else:
+                items = []
+                for handover, confirmations, comment in selected:
+                    data = {
+                        'ma_nv': batch_ma_nv,
+                        'ten_nv': batch_ten_nv,
+                        'line': handover['Line'],
+                        'ca': batch_ca,
+                        'chu_ky': batch_chu_ky,
+                        'ngay': batch_ngay.strftime('%Y-%m-%d'),
+                        'Khác - Comments Nhận': comment
+                    }
+                    for category in CATEGORIES:
+                        data[f"{category} - Xác Nhận"] = "Đã xác nhận" if confirmations[category] else "Chưa xác nhận"
+                    items.append({'handover_id': handover['ID Giao Ca'], 'data': data})
+                
+                with st.spinner(f'⏳ Đang lưu {len(items)} phiếu nhận ca...'):
+                    success, results = save_receives_batch(items)
+                
+                st.session_state.batch_results = results
+                # Tải lại danh sách để bỏ các bàn giao đã nhận
+                st.session_state.batch_pending = get_pending_handovers(batch_ngay, batch_lines or None)
+                st.rerun()
+
+
 # Main app
 def main():
     # Khởi tạo database
@@ -219,6 +519,24 @@ def main():
         st.stop()
         return
     
+    start_background_jobs()
+    
+    # Link cũ còn session token trên URL: thu hồi token đã lộ và bỏ khỏi URL
+    if 'session' in st.query_params:
+        revoke_session_token(st.query_params['session'])
+        del st.query_params['session']
+    
+    # Khôi phục đăng nhập admin từ cookie session (kiểm tra chữ ký trong bộ nhớ, không truy vấn DB)
+    if not st.session_state.get('admin_logged_in') and st.context.cookies.get(SESSION_COOKIE):
+        token = st.context.cookies[SESSION_COOKIE]
+        session = verify_session_token(token)
+        if session and session['username'] == 'admin':
+            st.session_state.admin_logged_in = True
+            st.session_state.admin_name = session['full_name']
+            st.session_state.admin_session_token = token
+    
+    render_session_cookie()
+    
     st.title("🔄 Hệ Thống Bàn Giao Ca Làm Việc Trên Line")
     
     # Hiển thị badge admin nếu đã đăng nhập
@@ -286,8 +604,27 @@ def main():
         
         st.markdown("---")
         
+        # Lưới line × ca theo lịch ca: thấy ngay ca nào chưa nộp bàn giao
+        shift_grid = get_shift_grid(filter_date, None if filter_line == "Tất cả" else [filter_line])
+        if shift_grid and shift_grid['rows'] and shift_grid['shifts']:
+            missing_count = sum(
+                1 for row in shift_grid['rows'] for status in row['cells'].values() if status == 'missing'
+            )
+            if missing_count:
+                st.error(f"❌ **{missing_count}** ca theo lịch chưa có bàn giao")
+            # Bảng lưới chỉ vẽ khi bật (st.dataframe import pandas): lần render đầu của dashboard không tải pandas
+            if st.toggle("🗓️ Xem lưới ca theo line", key="dashboard_show_shift_grid"):
+                import pandas as pd
+                grid_labels = {'received': '✅ Đã nhận', 'pending': '⏳ Chờ nhận', 'missing': '❌ Chưa bàn giao', None: '—'}
+                grid_df = pd.DataFrame([
+                    {'Line': row['line'], **{ca: grid_labels[row['cells'][ca]] for ca in shift_grid['shifts']}}
+                    for row in shift_grid['rows']
+                ])
+                st.dataframe(grid_df, use_container_width=True, hide_index=True)
+            st.markdown("---")
+        
         # Lấy dữ liệu dashboard với bộ lọc
-        dashboard_data = get_dashboard_data(filter_date=filter_date.strftime('%Y-%m-%d'), filter_line=filter_line)
+        dashboard_data = load_dashboard_snapshot(filter_date, filter_line)
         
         if dashboard_data is None or len(dashboard_data) == 0:
             st.info("📌 Chưa có dữ liệu giao ca trong ngày được chọn")
@@ -337,6 +674,11 @@ def main():
             if pending_handovers:
                 st.subheader(f"⚠️ Bàn Giao Chưa Nhận ({len(pending_handovers)} ca)")
                 
+                # Cảnh báo SLA đã được SLA monitor tính sẵn
+                sla_alerts = get_open_sla_alerts(filter_date.strftime('%Y-%m-%d'), filter_line)
+                if sla_alerts:
+                    st.error(f"⏰ **{len(sla_alerts)}** bàn giao đã chờ nhận quá **{SLA_MINUTES} phút** (SLA)")
+                
                 for item in pending_handovers:
                     # Xác định mức độ ưu tiên dựa trên NOK
                     if item['NOK'] > 0:
@@ -346,6 +688,11 @@ def main():
                         priority_color = "🟡"
                         priority_text = "CHỜ XỬ LÝ"
                     
+                    sla_alert = sla_alerts.get(item['ID Giao Ca'])
+                    sla_html = ""
+                    if sla_alert:
+                        sla_html = f'<p style="margin: 5px 0; color: #dc3545;"><strong>⏰ Quá hạn SLA:</strong> đã chờ {sla_alert["wait_minutes"]} phút (SLA {sla_alert["sla_minutes"]} phút)</p>'
+                    
                     with st.container():
                         st.markdown(f"""
                         <div style="background-color: #fff3cd; padding: 15px; border-radius: 8px; border-left: 5px solid #ffc107; margin-bottom: 10px;">
@@ -354,6 +701,7 @@ def main():
                             <p style="margin: 5px 0;"><strong>Người giao:</strong> {item['Mã NV Giao']} - {item['Tên NV Giao']}</p>
                             <p style="margin: 5px 0;"><strong>Thời gian giao:</strong> {item['Thời Gian Giao']}</p>
                             <p style="margin: 5px 0;"><strong>Trạng thái:</strong> 🟢 {item['OK']} OK | 🔴 {item['NOK']} NOK | ⚪ {item['NA']} NA</p>
+                            {sla_html}
                         </div>
                         """, unsafe_allow_html=True)
                 
@@ -365,20 +713,38 @@ def main():
             # Hiển thị chi tiết từng line
             st.subheader("📋 Chi Tiết Bàn Giao Ca Theo Line")
             
-            # Khởi tạo session state cho số lượng hiển thị
-            if 'dashboard_show_all' not in st.session_state:
-                st.session_state.dashboard_show_all = False
+            # Phân trang phía server: chỉ tải và render các bàn giao của trang đang xem
+            col_size, col_info = st.columns([1, 3])
+            with col_size:
+                page_size = st.selectbox(
+                    "Số bàn giao mỗi trang",
+                    DASHBOARD_PAGE_SIZES,
+                    key="dashboard_page_size"
+                )
             
-            # Xác định số lượng hiển thị
-            if st.session_state.dashboard_show_all:
-                display_data = dashboard_data
-                show_count = len(dashboard_data)
-            else:
-                display_data = dashboard_data[:5]
-                show_count = min(5, len(dashboard_data))
+            # Cursor đầu mỗi trang đã xem (trang 1 = None); đổi bộ lọc thì về trang 1
+            page_key = (filter_date.strftime('%Y-%m-%d'), filter_line, page_size)
+            if st.session_state.get('dashboard_page_key') != page_key:
+                st.session_state.dashboard_page_key = page_key
+                st.session_state.dashboard_page_cursors = [None]
+            page_cursors = st.session_state.dashboard_page_cursors
+            page_index = len(page_cursors) - 1
+            
+            display_data = get_dashboard_data(
+                filter_date=page_key[0],
+                filter_line=filter_line,
+                limit=page_size,
+                cursor=page_cursors[-1]
+            ) or []
+            first_row = page_index * page_size
             
-            # Hiển thị thông tin số lượng
-            st.caption(f"Đang hiển thị **{show_count}** / **{len(dashboard_data)}** bàn giao ca")
+            with col_info:
+                st.markdown("<br>", unsafe_allow_html=True)
+                # Hiển thị thông tin số lượng
+                st.caption(
+                    f"Đang hiển thị **{first_row + 1 if display_data else 0}-{first_row + len(display_data)}** "
+                    f"/ **{total_handovers}** bàn giao ca (trang {page_index + 1})"
+                )
             
             for idx, item in enumerate(display_data):
                 # Xác định màu card
@@ -393,7 +759,7 @@ def main():
                     status_icon = "⏳"
                 
                 # Tạo expander cho mỗi line
-                is_expanded = (idx == 0 and item['Trạng Thái Nhận'] == "Chưa nhận" and not st.session_state.dashboard_show_all)
+                is_expanded = (idx == 0 and page_index == 0 and item['Trạng Thái Nhận'] == "Chưa nhận")
                 
                 with st.expander(f"{status_icon} **{item['Line']}** - {item['Ca']} - Nhóm {item['Nhân viên thuộc ca']} | ID: {item['ID Giao Ca']} | {item['Trạng Thái Nhận']}", expanded=is_expanded):
                     
@@ -440,19 +806,19 @@ def main():
                     
                     st.markdown("---")
             
-            # Nút Xem thêm / Thu gọn
-            if len(dashboard_data) > 5:
+            # Nút chuyển trang
+            has_next = first_row + len(display_data) < total_handovers and len(display_data) == page_size
+            if page_index > 0 or has_next:
                 st.markdown("---")
                 col1, col2, col3 = st.columns([1, 2, 1])
-                with col2:
-                    if st.session_state.dashboard_show_all:
-                        if st.button("🔼 Thu Gọn", use_container_width=True, key="dashboard_collapse"):
-                            st.session_state.dashboard_show_all = False
-                            st.rerun()
-                    else:
-                        if st.button(f"🔽 Xem Thêm ({len(dashboard_data) - 5} bàn giao ca)", use_container_width=True, key="dashboard_expand"):
-                            st.session_state.dashboard_show_all = True
-                            st.rerun()
+                with col1:
+                    if page_index > 0 and st.button("◀️ Trang Trước", use_container_width=True, key="dashboard_prev_page"):
+                        page_cursors.pop()
+                        st.rerun()
+                with col3:
+                    if has_next and st.button("Trang Sau ▶️", use_container_width=True, key="dashboard_next_page"):
+                        page_cursors.append(dashboard_cursor(display_data[-1]))
+                        st.rerun()
     
     # ===== TAB 1: GIAO CA =====
     with tab_handover:
@@ -511,11 +877,15 @@ def main():
             
             st.markdown("---")
             
+            if success_data.get('spooled'):
+                st.warning("⏳ Database đang tạm thời không kết nối được. Bàn giao đã được lưu tạm và sẽ "
+                           "tự động đồng bộ khi kết nối trở lại (ID Giao Ca được cấp lúc đồng bộ).")
+            
             st.success(f"""
 ### ✅ ĐÃ LƯU THÔNG TIN GIAO CA THÀNH CÔNG!
 
 **Thông tin bàn giao:**
-- 🆔 ID Giao Ca: **{success_data['id']}**
+- 🆔 ID Giao Ca: **{success_data['id'] or 'Chờ đồng bộ'}**
 - 👤 Nhân viên: **{success_data['ma_nv']}** - **{success_data['ten_nv']}**
 - 🏭 Line: **{success_data['line']}**
 - ⏰ Ca: **{success_data['ca']}**
@@ -538,6 +908,8 @@ def main():
                     st.session_state.handover_success = False
                     if 'handover_success_data' in st.session_state:
                         del st.session_state.handover_success_data
+                    if 'handover_request_key' in st.session_state:
+                        del st.session_state.handover_request_key
                     
                     # Clear tất cả các key liên quan đến form giao ca
                     keys_to_clear = [key for key in st.session_state.keys() if key.startswith(('ma_nv_giao', 'ten_nv_giao', 'line_giao', 'ca_giao', 'chu_ky_giao', 'ngay_bc', 'status_', 'comment_'))]
@@ -547,11 +919,17 @@ def main():
                     st.rerun()
         
         else:
+            # Khóa idempotency cho form hiện tại: bấm "Giao Ca" nhiều lần hoặc gửi lại
+            # sau lỗi mạng vẫn chỉ tạo 1 bàn giao
+            if 'handover_request_key' not in st.session_state:
+                st.session_state.handover_request_key = uuid.uuid4().hex
+            
             # Hiển thị form giao ca
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                ma_nv_giao = st.text_input("Mã Nhân Viên * (6 chữ số)", key="ma_nv_giao", value="", max_chars=6, placeholder="Ví dụ: 123456")
+                ma_nv_giao = st.text_input("Mã Nhân Viên * (6 chữ số)", key="ma_nv_giao", value="", max_chars=6, placeholder="Ví dụ: 123456",
+                                           on_change=autofill_employee_name, args=("ma_nv_giao", "ten_nv_giao"))
                 active_lines = get_active_lines()
                 line_giao = st.selectbox("Line Làm Việc *", 
                                          active_lines,
@@ -596,7 +974,7 @@ def main():
                 if current_hour >= 19:
                     default_date = current_time.date()
                 else:
-                    default_date = (current_time - pd.Timedelta(days=1)).date()
+                    default_date = (current_time - timedelta(days=1)).date()
             
             # Cảnh báo nếu chọn sai ca hoặc ngày
             if ngay_bc != default_date or ca_giao != default_shift:
@@ -749,9 +1127,13 @@ def main():
                             **handover_data
                         }
                         
-                        # Hiển thị loading
+                        # Hiển thị loading (database mất kết nối thì lưu tạm vào hàng đợi ghi)
                         with st.spinner('⏳ Đang lưu dữ liệu...'):
-                            success, result = save_handover_safe(data, max_retries=10)
+                            success, result, spooled = submit_handover(
+                                data,
+                                request_key=st.session_state.handover_request_key,
+                                max_retries=10
+                            )
                         
                         if success:
                             # Lưu thông tin vào session state để hiển thị sau khi rerun
@@ -764,6 +1146,7 @@ def main():
                                 'chu_ky': chu_ky_giao,
                                 'ngay': ngay_bc.strftime('%d/%m/%Y'),
                                 'id': result,
+                                'spooled': spooled,
                                 'time': datetime.now().strftime('%H:%M:%S'),
                                 'ok_count': ok_count,
                                 'nok_count': nok_count,
@@ -800,12 +1183,27 @@ def main():
         if 'receive_success' not in st.session_state:
             st.session_state.receive_success = False
         
+        receive_mode = st.radio(
+            "Chế độ nhận ca",
+            ["📥 Nhận từng ca", "📦 Nhận nhiều ca"],
+            horizontal=True,
+            key="receive_mode",
+            label_visibility="collapsed"
+        )
+        
+        if receive_mode == "📦 Nhận nhiều ca":
+            render_batch_receive()
+        
         # Kiểm tra xem có thông báo thành công cần hiển thị không
-        if st.session_state.receive_success:
+        elif st.session_state.receive_success:
             receive_data = st.session_state.receive_success_data
             
             st.markdown("---")
             
+            if receive_data.get('spooled'):
+                st.warning("⏳ Database đang tạm thời không kết nối được. Phiếu nhận ca đã được lưu tạm và "
+                           "sẽ tự động đồng bộ khi kết nối trở lại.")
+            
             st.success(f"""
 ### ✅ ĐÃ XÁC NHẬN NHẬN CA THÀNH CÔNG!
 
@@ -848,7 +1246,8 @@ def main():
             col1, col2, col3 = st.columns(3)
             
             with col1:
-                ma_nv_nhan = st.text_input("Mã Nhân Viên * (6 chữ số)", key="ma_nv_nhan", value="", max_chars=6, placeholder="Ví dụ: 123456")
+                ma_nv_nhan = st.text_input("Mã Nhân Viên * (6 chữ số)", key="ma_nv_nhan", value="", max_chars=6, placeholder="Ví dụ: 123456",
+                                           on_change=autofill_employee_name, args=("ma_nv_nhan", "ten_nv_nhan"))
                 active_lines = get_active_lines()
                 line_nhan = st.selectbox("Line Làm Việc *", 
                                          active_lines,
@@ -911,15 +1310,15 @@ def main():
             col_btn1, col_btn2, col_btn3 = st.columns([1, 2, 1])
             with col_btn2:
                 if st.button("🔍 XEM THÔNG TIN BÀN GIAO", use_container_width=True, type="primary"):
-                    handover_info = get_latest_handover(line_nhan, ngay_nhan)
-                    if handover_info:
-                        # Kiểm tra xem bàn giao này đã được nhận chưa
-                        is_received, receive_info = check_handover_received(handover_info['ID Giao Ca'])
+                    # 1 truy vấn: bàn giao + trạng thái nhận + người nhận
+                    screen_data = get_receive_screen_data(line_nhan, ngay_nhan)
+                    if screen_data:
+                        handover_info = screen_data['handover']
                         
-                        if is_received:
+                        if screen_data['is_received']:
                             # Hiển thị cảnh báo đã nhận
                             st.session_state['handover_already_received'] = True
-                            st.session_state['receive_info'] = receive_info
+                            st.session_state['receive_info'] = screen_data['receive_info']
                             st.session_state['handover_info'] = handover_info
                         else:
                             # Bàn giao chưa được nhận, cho phép tiếp tục
@@ -929,7 +1328,7 @@ def main():
                         
                         st.rerun()
                     else:
-                        st.warning(f"⚠️ Chưa có thông tin bàn giao chưa nhận cho **{line_nhan}** vào ngày **{ngay_nhan.strftime('%d/%m/%Y')}**!")
+                        st.warning(f"⚠️ Chưa có thông tin bàn giao cho **{line_nhan}** vào ngày **{ngay_nhan.strftime('%d/%m/%Y')}**!")
             
             # Kiểm tra xem có thông báo bàn giao đã được nhận không
             if 'handover_already_received' in st.session_state and st.session_state['handover_already_received']:
@@ -1143,7 +1542,7 @@ Vui lòng làm mới trang và thử lại.
                                 }
                                 
                                 with st.spinner('⏳ Đang lưu dữ liệu nhận ca...'):
-                                    success, message = save_receive_safe(data, handover_id)
+                                    success, message, spooled = submit_receive(data, handover_id)
                                 
                                 if success:
                                     # Lưu thông tin vào session state
@@ -1156,7 +1555,8 @@ Vui lòng làm mới trang và thử lại.
                                         'ca': ca_nhan,
                                         'chu_ky': chu_ky_nhan,
                                         'ngay': ngay_nhan.strftime('%d/%m/%Y'),
-                                        'time': datetime.now().strftime('%H:%M:%S')
+                                        'time': datetime.now().strftime('%H:%M:%S'),
+                                        'spooled': spooled
                                     }
                                     
                                     # Clear các session state không cần thiết
@@ -1185,11 +1585,15 @@ Vui lòng làm mới trang và thử lại.
         st.header("📈 Xem Dữ Liệu Bàn Giao Ca")
         
         # Sub-tabs cho các loại dữ liệu
-        data_tab1, data_tab2, data_tab3, data_tab4 = st.tabs([
+        data_tab1, data_tab2, data_tab3, data_tab4, data_tab5, data_tab6, data_tab7, data_tab8 = st.tabs([
             "📊 Tổng Hợp Giao-Nhận", 
             "📤 Dữ Liệu Giao Ca",
             "📥 Dữ Liệu Nhận Ca",
-            "🔥 Giao Ca Mới Nhất"
+            "🔥 Giao Ca Mới Nhất",
+            "📉 Xu Hướng NOK",
+            "⏱️ Thời Gian Nhận Ca",
+            "👤 Bàn Giao Của Tôi",
+            "⚖️ Bất Đồng Giao-Nhận"
         ])
         
         # SUB-TAB 1: TỔNG HỢP GIAO-NHẬN
@@ -1203,7 +1607,7 @@ Vui lòng làm mới trang và thử lại.
             with col_f1:
                 filter_from_date = st.date_input(
                     "Từ ngày",
-                    value=datetime.now().date() - pd.Timedelta(days=7),
+                    value=datetime.now().date() - timedelta(days=7),
                     key="combined_from_date"
                 )
             
@@ -1240,6 +1644,7 @@ Vui lòng làm mới trang và thử lại.
                         )
                         
                         if combined_data:
+                            import pandas as pd
                             df_combined = pd.DataFrame(combined_data)
                             
                             # Hiển thị thống kê
@@ -1293,69 +1698,81 @@ Vui lòng làm mới trang và thử lại.
         with data_tab2:
             st.subheader("📤 Dữ Liệu Giao Ca")
             
-            try:
-                data = get_handover_data_for_export()
-                if data:
-                    df = pd.DataFrame(data)
+            # Chỉ tải toàn bộ dữ liệu khi người dùng yêu cầu (không chạy ở mỗi lần render)
+            if st.button("🔍 Tải Dữ Liệu Giao Ca", key="show_handover_export_button"):
+                st.session_state.show_handover_export = True
+            
+            if st.session_state.get('show_handover_export', False):
+                try:
+                    data = get_handover_data_for_export()
+                    if data:
+                        import pandas as pd
+                        df = pd.DataFrame(data)
                     
-                    # Thống kê
-                    col1, col2, col3 = st.columns(3)
-                    with col1:
-                        st.metric("Tổng số giao ca", len(df))
-                    with col2:
-                        received = len(df[df['Trạng Thái Nhận'] == 'Đã nhận'])
-                        st.metric("Đã nhận", received)
-                    with col3:
-                        pending = len(df[df['Trạng Thái Nhận'] == 'Chưa nhận'])
-                        st.metric("Chưa nhận", pending)
+                        # Thống kê
+                        col1, col2, col3 = st.columns(3)
+                        with col1:
+                            st.metric("Tổng số giao ca", len(df))
+                        with col2:
+                            received = len(df[df['Trạng Thái Nhận'] == 'Đã nhận'])
+                            st.metric("Đã nhận", received)
+                        with col3:
+                            pending = len(df[df['Trạng Thái Nhận'] == 'Chưa nhận'])
+                            st.metric("Chưa nhận", pending)
                     
-                    st.markdown("---")
-                    st.dataframe(df, use_container_width=True, height=500)
+                        st.markdown("---")
+                        st.dataframe(df, use_container_width=True, height=500)
                     
-                    # Nút download
-                    col1, col2, col3 = st.columns([1, 2, 1])
-                    with col2:
-                        st.download_button(
-                            "📥 Tải xuống dữ liệu Giao Ca (CSV)",
-                            df.to_csv(index=False).encode('utf-8-sig'),
-                            "handover_data.csv",
-                            "text/csv",
-                            use_container_width=True
-                        )
-                else:
-                    st.info("Chưa có dữ liệu giao ca")
-            except Exception as e:
-                st.error(f"Lỗi khi đọc dữ liệu: {e}")
+                        # Nút download
+                        col1, col2, col3 = st.columns([1, 2, 1])
+                        with col2:
+                            st.download_button(
+                                "📥 Tải xuống dữ liệu Giao Ca (CSV)",
+                                df.to_csv(index=False).encode('utf-8-sig'),
+                                "handover_data.csv",
+                                "text/csv",
+                                use_container_width=True
+                            )
+                    else:
+                        st.info("Chưa có dữ liệu giao ca")
+                except Exception as e:
+                    st.error(f"Lỗi khi đọc dữ liệu: {e}")
         
         # SUB-TAB 3: DỮ LIỆU NHẬN CA
         with data_tab3:
             st.subheader("📥 Dữ Liệu Nhận Ca")
             
-            try:
-                data = get_receive_data_for_export()
-                if data:
-                    df = pd.DataFrame(data)
+            # Chỉ tải toàn bộ dữ liệu khi người dùng yêu cầu (không chạy ở mỗi lần render)
+            if st.button("🔍 Tải Dữ Liệu Nhận Ca", key="show_receive_export_button"):
+                st.session_state.show_receive_export = True
+            
+            if st.session_state.get('show_receive_export', False):
+                try:
+                    data = get_receive_data_for_export()
+                    if data:
+                        import pandas as pd
+                        df = pd.DataFrame(data)
                     
-                    # Thống kê
-                    st.metric("Tổng số nhận ca", len(df))
+                        # Thống kê
+                        st.metric("Tổng số nhận ca", len(df))
                     
-                    st.markdown("---")
-                    st.dataframe(df, use_container_width=True, height=500)
+                        st.markdown("---")
+                        st.dataframe(df, use_container_width=True, height=500)
                     
-                    # Nút download
-                    col1, col2, col3 = st.columns([1, 2, 1])
-                    with col2:
-                        st.download_button(
-                            "📥 Tải xuống dữ liệu Nhận Ca (CSV)",
-                            df.to_csv(index=False).encode('utf-8-sig'),
-                            "receive_data.csv",
-                            "text/csv",
-                            use_container_width=True
-                        )
-                else:
-                    st.info("Chưa có dữ liệu nhận ca")
-            except Exception as e:
-                st.error(f"Lỗi khi đọc dữ liệu: {e}")
+                        # Nút download
+                        col1, col2, col3 = st.columns([1, 2, 1])
+                        with col2:
+                            st.download_button(
+                                "📥 Tải xuống dữ liệu Nhận Ca (CSV)",
+                                df.to_csv(index=False).encode('utf-8-sig'),
+                                "receive_data.csv",
+                                "text/csv",
+                                use_container_width=True
+                            )
+                    else:
+                        st.info("Chưa có dữ liệu nhận ca")
+                except Exception as e:
+                    st.error(f"Lỗi khi đọc dữ liệu: {e}")
         
         # SUB-TAB 4: GIAO CA MỚI NHẤT
         with data_tab4:
@@ -1407,6 +1824,243 @@ Vui lòng làm mới trang và thử lại.
                     st.info("Chưa có dữ liệu giao ca")
             except Exception as e:
                 st.error(f"Lỗi khi đọc dữ liệu: {e}")
+        
+        # SUB-TAB 5: XU HƯỚNG NOK
+        with data_tab5:
+            st.subheader("📉 Xu Hướng NOK Theo Line Và Hạng Mục")
+            st.caption("Số liệu được tổng hợp trực tiếp trong database theo ngày/tuần/tháng")
+            
+            bucket_options = {
+                "Theo tuần": "week",
+                "Theo tháng": "month",
+                "Theo ngày": "day"
+            }
+            
+            col_t1, col_t2, col_t3, col_t4 = st.columns(4)
+            
+            with col_t1:
+                trend_from_date = st.date_input(
+                    "Từ ngày",
+                    value=datetime.now().date() - timedelta(days=90),
+                    key="trend_from_date"
+                )
+            
+            with col_t2:
+                trend_to_date = st.date_input(
+                    "Đến ngày",
+                    value=datetime.now().date(),
+                    key="trend_to_date"
+                )
+            
+            with col_t3:
+                trend_bucket = st.selectbox(
+                    "Gom nhóm",
+                    list(bucket_options.keys()),
+                    key="trend_bucket"
+                )
+            
+            with col_t4:
+                trend_line = st.selectbox(
+                    "Lọc Line",
+                    ["Tất cả"] + get_active_lines(),
+                    key="trend_filter_line"
+                )
+            
+            if st.button("📈 Xem Xu Hướng", type="primary", key="load_trends"):
+                with st.spinner("⏳ Đang tổng hợp dữ liệu..."):
+                    trends = get_nok_trends(
+                        from_date=trend_from_date.strftime('%Y-%m-%d'),
+                        to_date=trend_to_date.strftime('%Y-%m-%d'),
+                        bucket=bucket_options[trend_bucket],
+                        line_filter=trend_line if trend_line != "Tất cả" else None
+                    )
+                
+                if trends:
+                    import pandas as pd
+                    df_trends = pd.DataFrame(trends)
+                    
+                    # Tỷ lệ NOK theo line qua từng kỳ
+                    st.markdown("#### 🏭 Tỷ lệ NOK (%) theo Line")
+                    df_line = df_trends.pivot_table(index='Kỳ', columns='Line', values='Tỷ Lệ NOK (%)', aggfunc='sum')
+                    st.line_chart(df_line)
+                    
+                    # Tỷ lệ NOK theo hạng mục (gộp tất cả line được chọn)
+                    st.markdown("#### 📋 Tỷ lệ NOK (%) theo Hạng Mục")
+                    df_period = df_trends.groupby('Kỳ').sum(numeric_only=True)
+                    df_category = pd.DataFrame({
+                        category: (df_period[f'{category} - NOK'] / df_period['Số Giao Ca'] * 100).round(2)
+                        for category in CATEGORIES
+                    })
+                    st.line_chart(df_category)
+                    
+                    st.markdown("---")
+                    st.dataframe(df_trends, use_container_width=True, height=400)
+                    
+                    col1, col2, col3 = st.columns([1, 2, 1])
+                    with col2:
+                        st.download_button(
+                            "📥 Tải xuống xu hướng NOK (CSV)",
+                            df_trends.to_csv(index=False).encode('utf-8-sig'),
+                            f"xu_huong_nok_{trend_from_date}_{trend_to_date}.csv",
+                            "text/csv",
+                            use_container_width=True
+                        )
+                else:
+                    st.info("Không có dữ liệu trong khoảng thời gian đã chọn")
+        
+        # SUB-TAB 6: THỜI GIAN NHẬN CA
+        with data_tab6:
+            st.subheader("⏱️ Thời Gian Chờ Nhận Ca")
+            st.caption(f"Thời gian từ lúc giao ca tới lúc nhận ca, phân vị theo ngày/line/ca (SLA hiện tại: {SLA_MINUTES} phút)")
+            
+            col_l1, col_l2, col_l3 = st.columns(3)
+            
+            with col_l1:
+                latency_from_date = st.date_input(
+                    "Từ ngày",
+                    value=datetime.now().date() - timedelta(days=7),
+                    key="latency_from_date"
+                )
+            
+            with col_l2:
+                latency_to_date = st.date_input(
+                    "Đến ngày",
+                    value=datetime.now().date(),
+                    key="latency_to_date"
+                )
+            
+            with col_l3:
+                latency_line = st.selectbox(
+                    "Lọc Line",
+                    ["Tất cả"] + get_active_lines(),
+                    key="latency_filter_line"
+                )
+            
+            if st.button("⏱️ Xem Thời Gian Nhận", type="primary", key="load_latency"):
+                with st.spinner("⏳ Đang tổng hợp dữ liệu..."):
+                    latency_stats = get_receive_latency_stats(
+                        from_date=latency_from_date.strftime('%Y-%m-%d'),
+                        to_date=latency_to_date.strftime('%Y-%m-%d'),
+                        line_filter=latency_line if latency_line != "Tất cả" else None
+                    )
+                
+                if latency_stats:
+                    import pandas as pd
+                    df_latency = pd.DataFrame(latency_stats)
+                    
+                    col_m1, col_m2, col_m3 = st.columns(3)
+                    with col_m1:
+                        st.metric("Tổng lượt nhận", int(df_latency['Số Lượt Nhận'].sum()))
+                    with col_m2:
+                        st.metric("P90 cao nhất (phút)", df_latency['P90 (phút)'].max())
+                    with col_m3:
+                        over_sla = int((df_latency['P90 (phút)'] > SLA_MINUTES).sum())
+                        st.metric("Nhóm có P90 vượt SLA", over_sla)
+                    
+                    st.markdown("#### 🏭 P90 thời gian chờ (phút) theo Line")
+                    st.line_chart(df_latency.pivot_table(index='Ngày', columns='Line', values='P90 (phút)', aggfunc='max'))
+                    
+                    st.dataframe(df_latency, use_container_width=True, height=400)
+                else:
+                    st.info("Không có dữ liệu nhận ca trong khoảng thời gian đã chọn")
+        
+        # SUB-TAB 7: BÀN GIAO CỦA TÔI
+        with data_tab7:
+            st.subheader("👤 Bàn Giao Của Tôi")
+            st.caption("Lịch sử giao ca và nhận ca theo mã nhân viên, mới nhất trước")
+            
+            col_e1, col_e2 = st.columns([1, 2])
+            with col_e1:
+                my_ma_nv = st.text_input("Mã Nhân Viên", key="my_history_ma_nv", max_chars=6, placeholder="Ví dụ: 123456")
+            with col_e2:
+                my_limit = st.selectbox("Số dòng", [20, 50, 100, 200], index=1, key="my_history_limit")
+            
+            if my_ma_nv:
+                is_valid, error_msg = validate_employee_id(my_ma_nv, check_directory=False)
+                if not is_valid:
+                    st.error(f"⚠️ {error_msg}")
+                else:
+                    my_name = lookup_employee_name(my_ma_nv)
+                    if my_name:
+                        st.markdown(f"**{my_ma_nv} - {my_name}**")
+                    my_history = get_employee_history(my_ma_nv, limit=my_limit)
+                    if my_history:
+                        import pandas as pd
+                        df_history = pd.DataFrame(my_history)
+                        
+                        col_h1, col_h2 = st.columns(2)
+                        with col_h1:
+                            st.metric("Lượt giao ca", int((df_history['Vai Trò'] == 'Giao ca').sum()))
+                        with col_h2:
+                            st.metric("Lượt nhận ca", int((df_history['Vai Trò'] == 'Nhận ca').sum()))
+                        
+                        st.dataframe(df_history, use_container_width=True, hide_index=True)
+                    else:
+                        st.info("Chưa có bàn giao nào của mã nhân viên này")
+        
+        # SUB-TAB 8: BẤT ĐỒNG GIAO-NHẬN
+        with data_tab8:
+            st.subheader("⚖️ Bất Đồng Giao-Nhận")
+            st.caption(f"Hạng mục bên giao báo OK nhưng bên nhận không xác nhận hoặc xác nhận kèm ghi chú (tổng hợp nền mỗi {DISCREPANCY_INTERVAL_SECONDS // 60} phút)")
+            
+            col_d1, col_d2, col_d3, col_d4 = st.columns(4)
+            
+            with col_d1:
+                discrepancy_from_date = st.date_input(
+                    "Từ ngày",
+                    value=datetime.now().date() - timedelta(days=30),
+                    key="discrepancy_from_date"
+                )
+            
+            with col_d2:
+                discrepancy_to_date = st.date_input(
+                    "Đến ngày",
+                    value=datetime.now().date(),
+                    key="discrepancy_to_date"
+                )
+            
+            with col_d3:
+                discrepancy_line = st.selectbox(
+                    "Lọc Line",
+                    ["Tất cả"] + get_active_lines(),
+                    key="discrepancy_filter_line"
+                )
+            
+            with col_d4:
+                discrepancy_group_labels = {'line': 'Line', 'ca': 'Ca', 'giver': 'Người giao', 'receiver': 'Người nhận'}
+                discrepancy_group = st.selectbox(
+                    "Gom theo",
+                    list(discrepancy_group_labels),
+                    format_func=discrepancy_group_labels.get,
+                    key="discrepancy_group_by"
+                )
+            
+            if st.button("⚖️ Xem Bất Đồng", type="primary", key="load_discrepancy"):
+                discrepancy_report = get_discrepancy_report(
+                    from_date=discrepancy_from_date.strftime('%Y-%m-%d'),
+                    to_date=discrepancy_to_date.strftime('%Y-%m-%d'),
+                    group_by=discrepancy_group,
+                    line_filter=discrepancy_line if discrepancy_line != "Tất cả" else None
+                )
+                
+                if discrepancy_report:
+                    import pandas as pd
+                    df_discrepancy = pd.DataFrame(discrepancy_report)
+                    if discrepancy_group in ('giver', 'receiver'):
+                        employee_column = df_discrepancy.columns[0]
+                        df_discrepancy.insert(1, 'Tên NV', df_discrepancy[employee_column].map(lambda ma_nv: lookup_employee_name(ma_nv) or ''))
+                    
+                    col_s1, col_s2, col_s3 = st.columns(3)
+                    with col_s1:
+                        st.metric("Hạng mục được so sánh", int(df_discrepancy['Số Phiếu So Sánh'].sum()))
+                    with col_s2:
+                        st.metric("Không xác nhận", int(df_discrepancy['Không Xác Nhận'].sum()))
+                    with col_s3:
+                        st.metric("Xác nhận kèm ghi chú", int(df_discrepancy['Xác Nhận Kèm Ghi Chú'].sum()))
+                    
+                    st.dataframe(df_discrepancy, use_container_width=True, height=400, hide_index=True)
+                else:
+                    st.info("Không có dữ liệu so sánh trong khoảng thời gian đã chọn")
     
     # ===== TAB 4: QUẢN LÝ (CHỈ HIỂN THỊ KHI LÀ ADMIN) =====
     if tab_manage is not None:
@@ -1431,7 +2085,7 @@ Vui lòng làm mới trang và thử lại.
             with col_s2:
                 search_from_date = st.date_input(
                     "Từ ngày",
-                    value=datetime.now().date() - pd.Timedelta(days=7),
+                    value=datetime.now().date() - timedelta(days=7),
                     key="manage_from_date"
                 )
             
@@ -1484,6 +2138,7 @@ Vui lòng làm mới trang và thử lại.
                     st.success(f"✅ Tìm thấy **{len(results)}** kết quả")
                     
                     # Hiển thị kết quả dưới dạng bảng
+                    import pandas as pd
                     df_results = pd.DataFrame(results)
                     
                     # Thêm cột Actions
@@ -1526,12 +2181,14 @@ Vui lòng làm mới trang và thử lại.
                             
                             with col_act1:
                                 if st.button("📝 Sửa", key=f"edit_{row['ID Giao Ca']}", use_container_width=True):
+                                    drop_session_record('handover', row['ID Giao Ca'])
                                     st.session_state.editing_handover_id = row['ID Giao Ca']
                                     st.rerun()
                             
                             with col_act2:
                                 if row['Trạng Thái'] == 'Đã nhận':
                                     if st.button("🗑️ Xóa Phiếu Nhận", key=f"del_receive_{row['ID Giao Ca']}", use_container_width=True, type="secondary"):
+                                        drop_session_record('receive', row['ID Giao Ca'])
                                         st.session_state.deleting_receive_id = row['ID Giao Ca']
                                         st.rerun()
                                 else:
@@ -1539,6 +2196,7 @@ Vui lòng làm mới trang và thử lại.
                             
                             with col_act3:
                                 if st.button("❌ Xóa Bàn Giao", key=f"del_{row['ID Giao Ca']}", use_container_width=True, type="secondary"):
+                                    drop_session_record('handover', row['ID Giao Ca'])
                                     st.session_state.deleting_handover_id = row['ID Giao Ca']
                                     st.rerun()
                     
@@ -1554,8 +2212,19 @@ Vui lòng làm mới trang và thử lại.
                 st.markdown("---")
                 st.subheader(f"📝 Chỉnh Sửa Bàn Giao: {handover_id}")
                 
-                # Lấy thông tin handover
-                handover_info = get_handover_by_id(handover_id)
+                # Lấy thông tin handover (1 lần cho cả phiên chỉnh sửa)
+                handover_info = get_session_record('handover', handover_id, get_handover_by_id)
+                
+                # Lịch sử sửa/xóa của bàn giao (audit log)
+                with st.expander("🕘 Lịch sử thay đổi", expanded=False):
+                    history = get_audit_log(handover_id)
+                    if history:
+                        for entry in history:
+                            st.markdown(f"**{entry['Thời Gian'].strftime('%d/%m/%Y %H:%M:%S')}** - "
+                                        f"{entry['Thao Tác']} {entry['Đối Tượng']} - {entry['Người Thực Hiện']}")
+                            st.json(entry['Thay Đổi'], expanded=False)
+                    else:
+                        st.caption("Chưa có thay đổi nào")
                 
                 if handover_info:
                     # Kiểm tra trạng thái
@@ -1565,6 +2234,7 @@ Vui lòng làm mới trang và thử lại.
                         col_cancel = st.columns([1, 2, 1])[1]
                         with col_cancel:
                             if st.button("❌ Hủy Chỉnh Sửa", use_container_width=True):
+                                drop_session_record('handover', handover_id)
                                 del st.session_state.editing_handover_id
                                 st.rerun()
                     else:
@@ -1633,7 +2303,7 @@ Vui lòng làm mới trang và thử lại.
                             
                             if submit_edit:
                                 # Validate
-                                is_valid, error_msg = validate_employee_id(edit_ma_nv)
+                                is_valid, error_msg = validate_employee_id(edit_ma_nv, check_directory=False)
                                 
                                 if not is_valid:
                                     st.error(f"⚠️ {error_msg}")
@@ -1650,8 +2320,13 @@ Vui lòng làm mới trang và thử lại.
                                     }
                                     
                                     with st.spinner("⏳ Đang lưu thay đổi..."):
-                                        success, message = update_handover(handover_id, update_data)
+                                        success, message = update_handover(
+                                            handover_id, update_data, actor=st.session_state.get('admin_name'),
+                                            expected_version=handover_info['version']
+                                        )
                                     
+                                    # Thành công hoặc bị từ chối vì bản ghi đã cũ: lần sau đọc lại
+                                    drop_session_record('handover', handover_id)
                                     if success:
                                         st.success(f"✅ {message}")
                                         time.sleep(1)
@@ -1663,6 +2338,7 @@ Vui lòng làm mới trang và thử lại.
                                         st.error(f"❌ {message}")
                             
                             if cancel_edit:
+                                drop_session_record('handover', handover_id)
                                 del st.session_state.editing_handover_id
                                 st.rerun()
                 else:
@@ -1676,7 +2352,7 @@ Vui lòng làm mới trang và thử lại.
                 st.markdown("---")
                 st.warning(f"⚠️ **Xác nhận xóa phiếu nhận ca cho bàn giao: {handover_id}**")
                 
-                receive_info = get_receive_by_handover_id(handover_id)
+                receive_info = get_session_record('receive', handover_id, get_receive_by_handover_id)
                 
                 if receive_info:
                     st.info(f"""
@@ -1684,7 +2360,8 @@ Vui lòng làm mới trang và thử lại.
 - Người nhận: {receive_info['ma_nv']} - {receive_info['ten_nv']}
 - Thời gian nhận: {receive_info['thoi_gian']}
 
-⚠️ **Lưu ý:** Sau khi xóa, trạng thái bàn giao sẽ chuyển về "Chưa nhận"
+⚠️ **Lưu ý:** Sau khi xóa, trạng thái bàn giao sẽ chuyển về "Chưa nhận".
+Phiếu nhận được giữ trong thùng rác {SOFT_DELETE_RETENTION_DAYS} ngày và có thể khôi phục.
                     """)
                     
                     col_del1, col_del2, col_del3 = st.columns([1, 1, 1])
@@ -1692,8 +2369,12 @@ Vui lòng làm mới trang và thử lại.
                     with col_del1:
                         if st.button("✅ Xác Nhận Xóa", type="primary", use_container_width=True, key="confirm_del_receive"):
                             with st.spinner("⏳ Đang xóa..."):
-                                success, message = delete_receive(handover_id)
+                                success, message = delete_receive(
+                                    handover_id, actor=st.session_state.get('admin_name'),
+                                    expected_receive_id=receive_info['id']
+                                )
                             
+                            drop_session_record('receive', handover_id)
                             if success:
                                 st.success(f"✅ {message}")
                                 time.sleep(1)
@@ -1706,6 +2387,7 @@ Vui lòng làm mới trang và thử lại.
                     
                     with col_del2:
                         if st.button("❌ Hủy", use_container_width=True, key="cancel_del_receive"):
+                            drop_session_record('receive', handover_id)
                             del st.session_state.deleting_receive_id
                             st.rerun()
                 else:
@@ -1719,7 +2401,7 @@ Vui lòng làm mới trang và thử lại.
                 st.markdown("---")
                 st.error(f"🚨 **Xác nhận xóa bàn giao: {handover_id}**")
                 
-                handover_info = get_handover_by_id(handover_id)
+                handover_info = get_session_record('handover', handover_id, get_handover_by_id)
                 
                 if handover_info:
                     st.warning(f"""
@@ -1730,8 +2412,8 @@ Vui lòng làm mới trang và thử lại.
 - Trạng thái: {handover_info['trang_thai']}
 
 ⚠️ **CẢNH BÁO:** 
-- Hành động này sẽ xóa vĩnh viễn bàn giao và phiếu nhận ca (nếu có)
-- Không thể khôi phục sau khi xóa!
+- Hành động này sẽ xóa bàn giao và phiếu nhận ca (nếu có)
+- Có thể khôi phục từ thùng rác trong {SOFT_DELETE_RETENTION_DAYS} ngày, sau đó dữ liệu bị xóa vĩnh viễn
                     """)
                     
                     col_del1, col_del2, col_del3 = st.columns([1, 1, 1])
@@ -1739,8 +2421,12 @@ Vui lòng làm mới trang và thử lại.
                     with col_del1:
                         if st.button("🗑️ XÁC NHẬN XÓA", type="primary", use_container_width=True, key="confirm_del_handover"):
                             with st.spinner("⏳ Đang xóa..."):
-                                success, message = delete_handover(handover_id)
+                                success, message = delete_handover(
+                                    handover_id, actor=st.session_state.get('admin_name'),
+                                    expected_version=handover_info['version']
+                                )
                             
+                            drop_session_record('handover', handover_id)
                             if success:
                                 st.success(f"✅ {message}")
                                 time.sleep(1)
@@ -1753,11 +2439,142 @@ Vui lòng làm mới trang và thử lại.
                     
                     with col_del2:
                         if st.button("❌ Hủy", use_container_width=True, key="cancel_del_handover"):
+                            drop_session_record('handover', handover_id)
                             del st.session_state.deleting_handover_id
                             st.rerun()
                 else:
                     st.error("❌ Không tìm thấy bàn giao")
                     del st.session_state.deleting_handover_id
+            
+            st.markdown("---")
+            
+            # THÙNG RÁC - khôi phục bàn giao / phiếu nhận đã xóa
+            st.subheader("🗑️ Thùng Rác")
+            st.caption(f"Dữ liệu đã xóa được giữ {SOFT_DELETE_RETENTION_DAYS} ngày trước khi bị xóa vĩnh viễn")
+            
+            if st.button("🔍 Xem Thùng Rác", key="load_trash"):
+                st.session_state.show_trash = True
+            
+            if st.session_state.get('show_trash', False):
+                trash = get_deleted_items()
+                
+                if not trash['handovers'] and not trash['receives']:
+                    st.info("Thùng rác trống")
+                
+                for item in trash['handovers']:
+                    col_t1, col_t2 = st.columns([4, 1])
+                    with col_t1:
+                        st.write(f"📤 **{item['ID Giao Ca']}** - {item['Line']} - {item['Ca']} - {item['Người Giao']} "
+                                 f"(xóa lúc {item['Thời Gian Xóa'].strftime('%d/%m/%Y %H:%M')})")
+                    with col_t2:
+                        if st.button("♻️ Khôi phục", key=f"restore_handover_{item['ID Giao Ca']}", use_container_width=True):
+                            success, message = restore_handover(item['ID Giao Ca'], actor=st.session_state.get('admin_name'))
+                            if success:
+                                st.success(f"✅ {message}")
+                                if 'search_results' in st.session_state:
+                                    del st.session_state.search_results
+                                st.rerun()
+                            else:
+                                st.error(f"❌ {message}")
+                
+                for item in trash['receives']:
+                    col_t1, col_t2 = st.columns([4, 1])
+                    with col_t1:
+                        st.write(f"📥 Phiếu nhận **{item['ID Giao Ca']}** - {item['Line']} - {item['Người Nhận']} "
+                                 f"(xóa lúc {item['Thời Gian Xóa'].strftime('%d/%m/%Y %H:%M')})")
+                    with col_t2:
+                        if st.button("♻️ Khôi phục", key=f"restore_receive_{item['ID Phiếu Nhận']}", use_container_width=True):
+                            success, message = restore_receive(item['ID Phiếu Nhận'], actor=st.session_state.get('admin_name'))
+                            if success:
+                                st.success(f"✅ {message}")
+                                if 'search_results' in st.session_state:
+                                    del st.session_state.search_results
+                                st.rerun()
+                            else:
+                                st.error(f"❌ {message}")
+            
+            st.markdown("---")
+            
+            # KIỂM TRA NHẤT QUÁN - trạng thái nhận của bàn giao so với phiếu nhận
+            st.subheader("🩺 Kiểm Tra Nhất Quán Dữ Liệu")
+            st.caption(f"Job nền quét các ngày có thay đổi mỗi {CONSISTENCY_INTERVAL_SECONDS // 60} phút "
+                       f"({'tự sửa' if CONSISTENCY_AUTO_REPAIR else 'chỉ báo cáo'}). Quét toàn bộ có thể mất vài phút trên dữ liệu lớn.")
+            
+            col_c1, col_c2, col_c3 = st.columns([1, 1, 2])
+            with col_c1:
+                if st.button("🔍 Quét Toàn Bộ", use_container_width=True, key="consistency_scan"):
+                    with st.spinner("⏳ Đang quét..."):
+                        st.session_state.consistency_report = run_consistency_check(full=True)
+            with col_c2:
+                if st.button("🛠️ Quét Và Sửa", use_container_width=True, key="consistency_repair"):
+                    with st.spinner("⏳ Đang quét và sửa..."):
+                        st.session_state.consistency_report = run_consistency_check(
+                            repair=True, full=True, actor=st.session_state.get('admin_name')
+                        )
+            
+            consistency_report = st.session_state.get('consistency_report')
+            if consistency_report:
+                drift_labels = {
+                    'received_without_receive': "Bàn giao 'Đã nhận' nhưng không có phiếu nhận",
+                    'pending_with_receive': "Bàn giao 'Chưa nhận' nhưng đã có phiếu nhận",
+                    'orphan_receive': "Phiếu nhận của bàn giao không tồn tại/đã xóa",
+                    'duplicate_receive': "Phiếu nhận trùng cho một bàn giao"
+                }
+                drift_total = sum(consistency_report[kind] for kind in drift_labels)
+                if drift_total == 0:
+                    st.success(f"✅ Không có chỗ lệch trong {consistency_report['days']} ngày đã quét")
+                elif consistency_report['repaired']:
+                    st.success(f"✅ Đã sửa {drift_total} chỗ lệch (phiếu nhận thừa được chuyển vào thùng rác)")
+                else:
+                    st.warning(f"⚠️ Có {drift_total} chỗ lệch trong {consistency_report['days']} ngày đã quét")
+                
+                for kind, label in drift_labels.items():
+                    if consistency_report[kind]:
+                        samples = ', '.join(consistency_report['samples'].get(kind, []))
+                        st.write(f"- **{label}**: {consistency_report[kind]} (VD: {samples})")
+            
+            st.markdown("---")
+            
+            # HÀNG ĐỢI GHI TẠM - bàn giao/phiếu nhận lưu khi database mất kết nối
+            st.subheader("📮 Hàng Đợi Ghi Tạm")
+            st.caption(f"Giao/nhận ca gửi lúc database mất kết nối được lưu tạm trên máy chủ ứng dụng "
+                       f"và tự đồng bộ mỗi {WRITE_SPOOL_REPLAY_INTERVAL_SECONDS} giây khi kết nối trở lại")
+            
+            spool_status = get_spool_status()
+            col_s1, col_s2, col_s3 = st.columns(3)
+            with col_s1:
+                st.metric("Chờ đồng bộ", spool_status['pending'])
+            with col_s2:
+                st.metric("Bị từ chối", spool_status['failed'])
+            with col_s3:
+                st.metric("Kết nối database", "⛔ Mất kết nối" if spool_status['breaker_open'] else "✅ Bình thường")
+            if spool_status['oldest']:
+                st.caption(f"Bản ghi chờ lâu nhất: {spool_status['oldest'].strftime('%d/%m/%Y %H:%M:%S')}")
+            
+            if spool_status['pending'] and st.button("🔁 Đồng Bộ Ngay", key="spool_replay"):
+                with st.spinner("⏳ Đang đồng bộ..."):
+                    replay_result = replay_spool()
+                if replay_result is None:
+                    st.error("❌ Database vẫn chưa kết nối được")
+                else:
+                    st.success(f"✅ Đã đồng bộ {replay_result['replayed']}, bị từ chối {replay_result['failed']}, "
+                               f"còn chờ {replay_result['pending']}")
+            
+            if spool_status['failed']:
+                failed_entries = get_failed_spool_entries()
+                st.dataframe(failed_entries, use_container_width=True, hide_index=True)
+                selected_ids = st.multiselect(
+                    "Chọn bản ghi",
+                    options=[entry['ID'] for entry in failed_entries],
+                    key="spool_selected_ids"
+                )
+                col_f1, col_f2, col_f3 = st.columns([1, 1, 2])
+                with col_f1:
+                    st.button("🔁 Thử Lại", use_container_width=True, key="spool_retry", disabled=not selected_ids,
+                              on_click=apply_spool_action, args=(retry_spool_entries,))
+                with col_f2:
+                    st.button("🗑️ Bỏ Qua", use_container_width=True, key="spool_discard", disabled=not selected_ids,
+                              on_click=apply_spool_action, args=(discard_spool_entries,))
     
     # ===== TAB 5: CÀI ĐẶT =====
     with tab_settings:
@@ -1779,11 +2596,18 @@ Vui lòng làm mới trang và thử lại.
                 col_a, col_b = st.columns(2)
                 with col_a:
                     if st.button("🚀 Đăng Nhập", type="primary", use_container_width=True):
-                        if username and password:
-                            success, full_name = check_login(username, password)
+                        client_key = get_login_client_key()
+                        retry_after = login_rate_limiter.retry_after(*login_rate_limit_keys(username, client_key)) if username else 0
+                        if retry_after > 0:
+                            st.error(f"⛔ Đăng nhập sai quá nhiều lần. Vui lòng thử lại sau {retry_after} giây!")
+                        elif username and password:
+                            success, full_name = check_login(username, password, client_key)
                             if success and username == 'admin':
                                 st.session_state.admin_logged_in = True
                                 st.session_state.admin_name = full_name
+                                # Giữ đăng nhập khi tải lại trang / mở phiên trình duyệt mới (qua cookie, không qua URL)
+                                st.session_state.admin_session_token = create_session_token(username, full_name)
+                                queue_session_cookie(st.session_state.admin_session_token, SESSION_TTL_HOURS * 3600)
                                 st.success(f"Chào mừng {full_name}!")
                                 time.sleep(1)
                                 st.rerun()
@@ -1802,6 +2626,11 @@ Vui lòng làm mới trang và thử lại.
                     st.session_state.admin_logged_in = False
                     if 'admin_name' in st.session_state:
                         del st.session_state.admin_name
+                    token = st.session_state.pop('admin_session_token', None)
+                    if token:
+                        # Thu hồi token để worker khác không khôi phục lại phiên đăng nhập từ cookie
+                        revoke_session_token(token)
+                    queue_session_cookie('', 0)
                     st.rerun()
             
             st.markdown("---")
@@ -1810,6 +2639,7 @@ Vui lòng làm mới trang và thử lại.
             st.subheader("🏭 Quản Lý Lines Sản Xuất")
             
             try:
+                import pandas as pd
                 lines_data = get_all_lines()
                 lines_df = pd.DataFrame(lines_data)
                 
@@ -1833,7 +2663,7 @@ Vui lòng làm mới trang và thử lại.
                 with col1:
                     if st.button("💾 Lưu Cấu Hình", type="primary", use_container_width=True):
                         lines_list = edited_df.to_dict('records')
-                        if save_lines_config(lines_list):
+                        if save_lines_config(lines_list, actor=st.session_state.get('admin_name')):
                             st.success("✅ Đã lưu cấu hình lines thành công!")
                             time.sleep(1)
                             st.rerun()
@@ -1850,6 +2680,66 @@ Vui lòng làm mới trang và thử lại.
             except Exception as e:
                 st.error(f"❌ Lỗi khi tải cấu hình lines: {e}")
             
+            st.markdown("---")
+            
+            # Lịch ca dự kiến (dùng để phát hiện ca chưa bàn giao trên dashboard)
+            st.subheader("🗓️ Lịch Ca Dự Kiến")
+            
+            try:
+                import pandas as pd
+                rules_df = pd.DataFrame(
+                    get_shift_rules(),
+                    columns=['line', 'ca', 'weekdays', 'valid_from', 'valid_to', 'is_active']
+                )
+                edited_rules_df = st.data_editor(
+                    rules_df,
+                    use_container_width=True,
+                    num_rows="dynamic",
+                    column_config={
+                        "line": st.column_config.SelectboxColumn("Line", help="Để trống = áp dụng cho mọi line", options=[''] + get_active_lines()),
+                        "ca": st.column_config.TextColumn("Ca", required=True),
+                        "weekdays": st.column_config.TextColumn("Ngày trong tuần", help="7 ký tự 0/1 từ Thứ 2 tới Chủ nhật, VD: 1111100 = Thứ 2 - Thứ 6", default="1111111", max_chars=7),
+                        "valid_from": st.column_config.DateColumn("Từ ngày", help="Để trống = không giới hạn"),
+                        "valid_to": st.column_config.DateColumn("Đến ngày", help="Để trống = không giới hạn"),
+                        "is_active": st.column_config.CheckboxColumn("Áp dụng", default=True)
+                    },
+                    hide_index=True,
+                    key="shift_rules_editor"
+                )
+                
+                if st.button("💾 Lưu Lịch Ca", type="primary", key="save_shift_rules"):
+                    rules_list = [
+                        {key: (None if value != value else value) for key, value in rule.items()}
+                        for rule in edited_rules_df.to_dict('records')
+                    ]
+                    success, message = save_shift_rules(rules_list, actor=st.session_state.get('admin_name'))
+                    if success:
+                        st.success(f"✅ {message}")
+                        time.sleep(1)
+                        st.rerun()
+                    else:
+                        st.error(f"❌ {message}")
+                
+                st.info("💡 Mỗi dòng là một ca dự kiến; dashboard báo **Chưa bàn giao** cho ca có trong lịch nhưng chưa có bàn giao nào")
+            
+            except Exception as e:
+                st.error(f"❌ Lỗi khi tải lịch ca: {e}")
+            
+            st.markdown("---")
+            
+            # Danh bạ nhân viên (kiểm tra mã NV và tự điền tên trên các form)
+            st.subheader("👥 Danh Bạ Nhân Viên")
+            st.caption("File CSV gồm cột **ma_nv**, **ten_nv** và tùy chọn **is_active** (0 = đã nghỉ). Nhân viên đã có được cập nhật theo mã NV.")
+            
+            employees_file = st.file_uploader("Chọn file CSV", type=["csv"], key="employees_csv")
+            if employees_file is not None and st.button("📥 Import Danh Bạ", type="primary", key="import_employees"):
+                with st.spinner("⏳ Đang import..."):
+                    success, message = import_employees_csv(employees_file.getvalue(), actor=st.session_state.get('admin_name'))
+                if success:
+                    st.success(f"✅ {message}")
+                else:
+                    st.error(f"❌ {message}")
+            
             st.markdown("---")
             st.markdown("---")
             
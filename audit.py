@@ -0,0 +1,275 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+from database import get_connection, AuditLog
+
+# ===== AUDIT LOG =====
+# Mọi thao tác sửa/xóa/khôi phục của admin được ghi lại (giá trị trước/sau) vào bảng
+# audit_log, chỉ thêm mới, không sửa/xóa.
+#
+# Thao tác có transaction truyền conn vào record_audit(): bản ghi được INSERT vào audit_log
+# trong chính transaction đó, commit/rollback cùng thay đổi nên không thể có thay đổi đã
+# commit mà thiếu audit.
+#
+# Không có conn (journal dự phòng): record_audit() chỉ tính diff, ghi bản ghi vào journal
+# SQLite cục bộ (AUDIT_JOURNAL_PATH) rồi trả về ngay; một writer thread nền gom nhiều bản
+# ghi và ghi bằng 1 lệnh insert theo lô.
+#
+# Bản ghi chỉ bị xóa khỏi journal sau khi insert vào audit_log thành công: database lỗi
+# hoặc process chết giữa chừng thì bản ghi vẫn còn trong journal và được ghi lại sau
+# (mỗi AUDIT_RETRY_INTERVAL_SECONDS, hoặc bởi process khởi động sau). Writer nhận quyền
+# ghi từng lô (claimed_at) nên các worker dùng chung file không ghi trùng; chỉ khi
+# process chết ngay sau khi insert và trước khi xóa khỏi journal thì lô đó bị ghi 2 lần.
+
+# File SQLite chứa journal audit (dùng chung cho các worker trên cùng máy)
+AUDIT_JOURNAL_PATH = os.getenv('AUDIT_JOURNAL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'audit_journal.db'))
+
+# Số bản ghi tối đa trong một lần insert
+AUDIT_BATCH_SIZE = int(os.getenv('AUDIT_BATCH_SIZE', '100'))
+
+# Thời gian chờ gom thêm bản ghi trước khi ghi (giây)
+AUDIT_FLUSH_INTERVAL_SECONDS = float(os.getenv('AUDIT_FLUSH_INTERVAL_SECONDS', '1'))
+
+# Chu kỳ ghi lại các bản ghi còn trong journal sau khi ghi lỗi (giây)
+AUDIT_RETRY_INTERVAL_SECONDS = float(os.getenv('AUDIT_RETRY_INTERVAL_SECONDS', '30'))
+
+# Lô đã nhận quyền ghi quá thời gian này (process chết giữa chừng) được ghi lại (giây)
+AUDIT_CLAIM_TIMEOUT_SECONDS = 300
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+_wakeup = threading.Event()
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _connect():
+    """Connection tới file journal, mỗi thread một connection (autocommit, WAL)"""
+    global _schema_ready
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(AUDIT_JOURNAL_PATH, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # WAL + NORMAL: commit không mất khi process chết, chỉ có thể mất khi mất điện
+        conn.execute('PRAGMA synchronous=NORMAL')
+        _local.conn = conn
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS audit_journal ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "record TEXT NOT NULL, "
+                    "claimed_at REAL)"
+                )
+                _schema_ready = True
+    return conn
+
+
+def _json_value(value):
+    """Chuẩn hóa giá trị để so sánh và ghi JSON (datetime -> chuỗi ISO)"""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat(sep=' ') if isinstance(value, datetime) else value.isoformat()
+    return value
+
+
+def compute_changes(before, after):
+    """
+    Diff gọn giữa hai trạng thái: chỉ giữ các cột có giá trị thay đổi
+
+    Args:
+        before: dict giá trị trước (None = tạo mới)
+        after: dict giá trị sau (None = bị xóa)
+
+    Returns: dict {cột: [giá trị cũ, giá trị mới]}
+    """
+    before = before or {}
+    after = after or {}
+    changes = {}
+    for key in list(before) + [k for k in after if k not in before]:
+        old, new = _json_value(before.get(key)), _json_value(after.get(key))
+        if old != new:
+            changes[key] = [old, new]
+    return changes
+
+
+def record_audit(entity_type, entity_id, action, before=None, after=None, actor=None, conn=None):
+    """
+    Ghi một bản ghi audit
+
+    Args:
+        entity_type: 'handover', 'receive', 'lines'
+        entity_id: handover_id hoặc khóa của đối tượng
+        action: 'update', 'delete', 'restore', ...
+        before: dict giá trị trước thao tác
+        after: dict giá trị sau thao tác
+        actor: người thực hiện (tên admin)
+        conn: Connection/Session đang trong transaction của thao tác: INSERT vào audit_log
+            trong transaction đó (lỗi được ném ra để thao tác rollback thay vì mất audit).
+            None = đưa vào journal cục bộ (không truy vấn DB, trả về ngay)
+    """
+    changes = compute_changes(before, after)
+    if not changes:
+        return
+
+    record = {
+        'entity_type': entity_type,
+        'entity_id': str(entity_id),
+        'action': action,
+        'actor': actor,
+        'changes': json.dumps(changes, ensure_ascii=False, separators=(',', ':'), default=str),
+        'created_at': datetime.now()
+    }
+    if conn is not None:
+        conn.execute(AuditLog.__table__.insert().values(**record))
+        return
+
+    try:
+        _connect().execute(
+            "INSERT INTO audit_journal (record) VALUES (?)",
+            (json.dumps({**record, 'created_at': record['created_at'].isoformat()},
+                        ensure_ascii=False, separators=(',', ':')),)
+        )
+        _ensure_writer()
+        _wakeup.set()
+    except Exception as e:
+        print(f"Error recording audit: {e}")
+
+
+def _write_batch(batch):
+    with get_connection() as conn:
+        with conn.begin():
+            conn.execute(AuditLog.__table__.insert(), batch)
+
+
+def _claim_batch(conn):
+    """Nhận quyền ghi một lô bản ghi chưa ai nhận (hoặc nhận đã quá hạn). Returns: list (id, record)"""
+    now = time.time()
+    return conn.execute(
+        "UPDATE audit_journal SET claimed_at = ? WHERE id IN ("
+        "SELECT id FROM audit_journal WHERE claimed_at IS NULL OR claimed_at < ? ORDER BY id LIMIT ?"
+        ") RETURNING id, record",
+        (now, now - AUDIT_CLAIM_TIMEOUT_SECONDS, AUDIT_BATCH_SIZE)
+    ).fetchall()
+
+
+def flush_journal():
+    """
+    Ghi các bản ghi trong journal vào audit_log theo lô, dừng ở lô đầu tiên bị lỗi
+    (lô lỗi được trả lại journal để lần sau ghi lại)
+
+    Returns: số bản ghi đã ghi (None nếu ghi lỗi)
+    """
+    conn = _connect()
+    written = 0
+    while True:
+        rows = _claim_batch(conn)
+        if not rows:
+            return written
+        ids = [row_id for row_id, _ in rows]
+        placeholders = ', '.join('?' * len(ids))
+        batch = []
+        for _, record in rows:
+            values = json.loads(record)
+            batch.append({**values, 'created_at': datetime.fromisoformat(values['created_at'])})
+        try:
+            _write_batch(batch)
+        except Exception as e:
+            print(f"Error writing audit batch ({len(batch)} records, kept in journal): {e}")
+            conn.execute(f"UPDATE audit_journal SET claimed_at = NULL WHERE id IN ({placeholders})", ids)
+            return None
+        conn.execute(f"DELETE FROM audit_journal WHERE id IN ({placeholders})", ids)
+        written += len(batch)
+
+
+def _writer_loop():
+    while True:
+        # Có bản ghi mới thì chờ gom thêm rồi ghi; không có thì định kỳ ghi lại phần còn trong journal
+        if _wakeup.wait(AUDIT_RETRY_INTERVAL_SECONDS):
+            time.sleep(AUDIT_FLUSH_INTERVAL_SECONDS)
+        _wakeup.clear()
+        try:
+            flush_journal()
+        except Exception as e:
+            # Không làm chết writer thread; bản ghi vẫn nằm trong journal
+            print(f"Error flushing audit journal: {e}")
+
+
+def _ensure_writer():
+    """Khởi động writer thread ở lần ghi audit đầu tiên (mỗi process một thread)"""
+    global _writer
+    if _writer is not None and _writer.is_alive():
+        return
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name='audit-writer', daemon=True)
+            _writer.start()
+
+
+def start_audit_writer():
+    """Khởi động writer khi process khởi động để ghi lại các bản ghi còn trong journal từ lần chạy trước"""
+    try:
+        if _connect().execute("SELECT 1 FROM audit_journal LIMIT 1").fetchone():
+            _ensure_writer()
+            _wakeup.set()
+    except Exception as e:
+        print(f"Error starting audit writer: {e}")
+
+
+def flush_audit(timeout=5.0):
+    """
+    Ghi ngay các bản ghi trong journal (dùng khi tắt process). Bản ghi chưa ghi được
+    vẫn nằm trong journal cho lần chạy sau. Returns: True nếu journal đã trống
+    """
+    if _writer is None:
+        return True
+    deadline = time.monotonic() + timeout
+    conn = _connect()
+    while conn.execute("SELECT 1 FROM audit_journal LIMIT 1").fetchone():
+        if flush_journal() is None or time.monotonic() >= deadline:
+            return False
+        # Lô đang được writer thread (hoặc worker khác) ghi: chờ rồi kiểm tra lại
+        time.sleep(0.05)
+    return True
+
+
+atexit.register(flush_audit)
+
+
+def get_audit_log(entity_id=None, limit=100):
+    """
+    Lấy lịch sử thay đổi (mới nhất trước), dùng index (entity_id, created_at)
+
+    Args:
+        entity_id: handover_id (None = tất cả)
+        limit: số bản ghi tối đa
+
+    Returns: list of dict
+    """
+    try:
+        table = AuditLog.__table__
+        query = table.select()
+        if entity_id:
+            query = query.where(table.c.entity_id == entity_id)
+        query = query.order_by(table.c.created_at.desc(), table.c.id.desc()).limit(limit)
+
+        with get_connection() as conn:
+            rows = conn.execute(query).all()
+
+        return [{
+            'Thời Gian': row.created_at,
+            'Đối Tượng': row.entity_type,
+            'ID': row.entity_id,
+            'Thao Tác': row.action,
+            'Người Thực Hiện': row.actor or '',
+            'Thay Đổi': json.loads(row.changes) if row.changes else {}
+        } for row in rows]
+    except Exception as e:
+        print(f"Error getting audit log: {e}")
+        return []
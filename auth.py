@@ -0,0 +1,203 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from shared_state import get_shared_state
+
+# ===== CREDENTIALS & SESSIONS =====
+# - Mật khẩu lưu dạng PBKDF2-SHA256 có salt: pbkdf2_sha256$<iterations>$<salt>$<hash>
+# - Session token ký HMAC, kiểm tra hoàn toàn trong bộ nhớ (không truy vấn DB)
+# - Giới hạn số lần đăng nhập sai theo username, chặn TRƯỚC khi truy vấn DB
+
+PASSWORD_HASH_ALGORITHM = 'pbkdf2_sha256'
+PBKDF2_ITERATIONS = int(os.getenv('PBKDF2_ITERATIONS', '390000'))
+
+# Khóa ký session token. Nên đặt cố định trong môi trường production; nếu không đặt,
+# khóa ngẫu nhiên được tạo một lần và chia sẻ giữa các worker qua shared state.
+SESSION_SECRET = os.getenv('SESSION_SECRET')
+
+# Giá trị mẫu công khai (ví dụ trong .env.example cũ): ai cũng biết nên không được dùng để ký token
+_PLACEHOLDER_SESSION_SECRETS = {'change-me', 'changeme', 'secret'}
+if SESSION_SECRET and SESSION_SECRET.strip().lower() in _PLACEHOLDER_SESSION_SECRETS:
+    raise RuntimeError(
+        "SESSION_SECRET đang là giá trị mẫu công khai. Đặt chuỗi ngẫu nhiên "
+        "(python -c \"import secrets; print(secrets.token_hex(32))\") hoặc để trống."
+    )
+
+# Thời hạn của session token (giờ)
+SESSION_TTL_HOURS = int(os.getenv('SESSION_TTL_HOURS', '12'))
+
+# Số lần đăng nhập sai tối đa trong cửa sổ thời gian (giây) trước khi bị khóa tạm
+LOGIN_MAX_ATTEMPTS = int(os.getenv('LOGIN_MAX_ATTEMPTS', '5'))
+LOGIN_WINDOW_SECONDS = int(os.getenv('LOGIN_WINDOW_SECONDS', '300'))
+
+
+def _b64encode(raw):
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(value):
+    return base64.urlsafe_b64decode(value + '=' * (-len(value) % 4))
+
+
+# ===== PASSWORD HASHING =====
+
+def hash_password(password, iterations=None):
+    """Tạo chuỗi hash có salt ngẫu nhiên cho mật khẩu"""
+    iterations = iterations or PBKDF2_ITERATIONS
+    salt = secrets.token_bytes(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, iterations)
+    return f"{PASSWORD_HASH_ALGORITHM}${iterations}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+def is_password_hash(value):
+    """Giá trị cột password đã là hash (không phải mật khẩu dạng text cũ)"""
+    return bool(value) and value.startswith(f"{PASSWORD_HASH_ALGORITHM}$")
+
+
+# Hash giả để username không tồn tại vẫn tốn cùng thời gian kiểm tra
+_DUMMY_HASH = hash_password(secrets.token_hex(16))
+
+
+def verify_password(password, stored):
+    """
+    So sánh mật khẩu với giá trị đã lưu trong thời gian hằng (hmac.compare_digest)
+
+    Args:
+        password: Mật khẩu người dùng nhập
+        stored: Giá trị cột password (hash, hoặc text của dữ liệu chưa migrate; None = không có user)
+
+    Returns: (matched, needs_rehash)
+    """
+    if stored is None:
+        verify_password(password, _DUMMY_HASH)
+        return False, False
+
+    if not is_password_hash(stored):
+        # Dữ liệu cũ chưa được migration hash: so sánh rồi yêu cầu hash lại
+        matched = hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+        return matched, matched
+
+    try:
+        _, iterations, salt, expected = stored.split('$')
+        iterations = int(iterations)
+        digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), _b64decode(salt), iterations)
+    except (ValueError, TypeError):
+        return False, False
+
+    matched = hmac.compare_digest(digest, _b64decode(expected))
+    return matched, matched and iterations < PBKDF2_ITERATIONS
+
+
+# ===== SESSION TOKENS =====
+
+def _session_secret():
+    """Khóa ký session: SESSION_SECRET, hoặc khóa ngẫu nhiên dùng chung qua shared state"""
+    global SESSION_SECRET
+    if not SESSION_SECRET:
+        state = get_shared_state()
+        # add() chỉ ghi nếu chưa có: các worker khởi động cùng lúc vẫn nhận cùng một khóa
+        state.add('auth:session_secret', secrets.token_hex(32))
+        SESSION_SECRET = state.get('auth:session_secret')
+    return SESSION_SECRET
+
+
+def _sign(payload):
+    return _b64encode(hmac.new(_session_secret().encode('utf-8'), payload.encode('ascii'), hashlib.sha256).digest())
+
+
+def create_session_token(username, full_name, ttl_hours=None):
+    """Tạo session token ký HMAC: <payload base64>.<chữ ký>"""
+    expires_at = int(time.time()) + (ttl_hours or SESSION_TTL_HOURS) * 3600
+    payload = _b64encode(json.dumps(
+        {'u': username, 'n': full_name, 'exp': expires_at},
+        separators=(',', ':'), ensure_ascii=False
+    ).encode('utf-8'))
+    return f"{payload}.{_sign(payload)}"
+
+
+def verify_session_token(token):
+    """
+    Kiểm tra chữ ký và hạn của session token (không truy vấn DB)
+
+    Returns: dict {'username', 'full_name', 'expires_at'} hoặc None nếu không hợp lệ
+    """
+    try:
+        payload, signature = token.split('.')
+        if not hmac.compare_digest(signature, _sign(payload)):
+            return None
+        data = json.loads(_b64decode(payload))
+    except (AttributeError, ValueError, TypeError):
+        return None
+
+    if data.get('exp', 0) < time.time():
+        return None
+    if get_shared_state().get(f'auth:revoked:{signature}'):
+        return None
+    return {'username': data.get('u'), 'full_name': data.get('n'), 'expires_at': data['exp']}
+
+
+def revoke_session_token(token):
+    """Thu hồi token khi đăng xuất (ghi vào shared state tới lúc token hết hạn)"""
+    session = verify_session_token(token)
+    if session:
+        signature = token.split('.')[1]
+        get_shared_state().set(f'auth:revoked:{signature}', True, ttl=max(1, int(session['expires_at'] - time.time())))
+
+
+# ===== LOGIN RATE LIMIT =====
+
+def login_rate_limit_keys(username, client_key=None):
+    """
+    Các key đếm đăng nhập sai của một lần đăng nhập
+
+    Args:
+        username: Tên đăng nhập (chặn dò mật khẩu một tài khoản từ nhiều nơi)
+        client_key: Key của client gửi yêu cầu - IP hoặc key riêng của phiên
+            (chặn một client dò lần lượt nhiều tài khoản)
+
+    Returns:
+        List key truyền cho LoginRateLimiter
+    """
+    keys = [f'user:{username}']
+    if client_key:
+        keys.append(f'client:{client_key}')
+    return keys
+
+
+class LoginRateLimiter:
+    """
+    Đếm số lần đăng nhập sai theo từng key (username, client) trong cửa sổ thời gian cố định;
+    bị khóa khi bất kỳ key nào vượt giới hạn.
+    Bộ đếm nằm trong shared state nên giới hạn áp dụng chung cho mọi worker.
+    """
+
+    def __init__(self, max_attempts=LOGIN_MAX_ATTEMPTS, window_seconds=LOGIN_WINDOW_SECONDS):
+        self.max_attempts = max_attempts
+        self.window_seconds = window_seconds
+
+    def _key(self, key):
+        return f'auth:login_failures:{key}'
+
+    def retry_after(self, *keys):
+        """Số giây phải chờ trước khi được thử lại (0 = được phép đăng nhập)"""
+        state = get_shared_state()
+        wait = 0
+        for key in keys:
+            if state.count(self._key(key)) >= self.max_attempts:
+                wait = max(wait, (state.ttl(self._key(key)) or 0) + 1)
+        return wait
+
+    def record_failure(self, *keys):
+        for key in keys:
+            get_shared_state().incr(self._key(key), ttl=self.window_seconds)
+
+    def reset(self, *keys):
+        for key in keys:
+            get_shared_state().delete(self._key(key))
+
+
+login_rate_limiter = LoginRateLimiter()
@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import select
+from database import get_connection, JobState
+from shared_state import get_shared_state
+
+# ===== BACKGROUND JOBS =====
+# Các job định kỳ chạy trên daemon thread trong cùng process với Streamlit.
+# Mỗi job chỉ được khởi động một lần cho mỗi process (gọi lại sẽ trả về job cũ),
+# và khi chạy nhiều worker thì mỗi chu kỳ chỉ một worker thực sự chạy job.
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class PeriodicJob:
+    """Chạy func mỗi interval_seconds giây cho tới khi stop()"""
+    
+    def __init__(self, name, func, interval_seconds, initial_delay=0):
+        self.name = name
+        self.func = func
+        self.interval_seconds = interval_seconds
+        self.initial_delay = initial_delay
+        self.last_run = None
+        self.last_result = None
+        self.last_error = None
+        self.run_count = 0
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-{name}", daemon=True)
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop_event.set()
+    
+    def is_alive(self):
+        return self._thread.is_alive()
+    
+    def run_once(self):
+        """Chạy job ngay lập tức, không làm chết thread khi job lỗi"""
+        try:
+            self.last_result = self.func()
+            self.last_error = None
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"Error in background job {self.name}: {e}")
+        finally:
+            self.last_run = datetime.now()
+            self.run_count += 1
+        return self.last_result
+    
+    def _acquire_turn(self):
+        """
+        Khi chạy nhiều worker, chỉ một worker chạy job trong mỗi chu kỳ: khóa leader
+        trong shared state (tự hết hạn trước chu kỳ sau). Lỗi backend thì vẫn chạy.
+        """
+        try:
+            return get_shared_state().add(
+                f'job_lock:{self.name}', os.getpid(), ttl=max(int(self.interval_seconds * 0.9), 1)
+            )
+        except Exception as e:
+            print(f"Error acquiring lock for job {self.name}: {e}")
+            return True
+    
+    def _run(self):
+        if self.initial_delay and self._stop_event.wait(self.initial_delay):
+            return
+        while not self._stop_event.is_set():
+            started = time.monotonic()
+            if self._acquire_turn():
+                self.run_once()
+            elapsed = time.monotonic() - started
+            if self._stop_event.wait(max(self.interval_seconds - elapsed, 1)):
+                return
+
+
+def start_periodic_job(name, func, interval_seconds, initial_delay=0):
+    """
+    Khởi động job định kỳ (idempotent theo name)
+    
+    Returns: PeriodicJob
+    """
+    with _jobs_lock:
+        job = _jobs.get(name)
+        if job and job.is_alive():
+            return job
+        job = PeriodicJob(name, func, interval_seconds, initial_delay).start()
+        _jobs[name] = job
+        print(f"Started background job: {name} (every {interval_seconds}s)")
+        return job
+
+
+def get_jobs_status():
+    """Trạng thái các job đang chạy để hiển thị trong trang admin"""
+    with _jobs_lock:
+        return [{
+            'Job': job.name,
+            'Chu kỳ (giây)': job.interval_seconds,
+            'Đang chạy': job.is_alive(),
+            'Số lần chạy': job.run_count,
+            'Lần chạy cuối': job.last_run,
+            'Kết quả': str(job.last_result) if job.last_result is not None else '',
+            'Lỗi': job.last_error or ''
+        } for job in _jobs.values()]
+
+
+def get_job_watermark(name):
+    """Mốc đã xử lý tới của job chạy tăng dần (bảng job_state, None = chưa chạy lần nào)"""
+    with get_connection() as conn:
+        return conn.execute(
+            select(JobState.__table__.c.watermark).where(JobState.__table__.c.name == name)
+        ).scalar()
+
+
+def set_job_watermark(name, watermark):
+    """Lưu mốc đã xử lý tới của job (tạo dòng job_state nếu chưa có)"""
+    table = JobState.__table__
+    now = datetime.now()
+    with get_connection() as conn:
+        with conn.begin():
+            updated = conn.execute(
+                table.update().where(table.c.name == name).values(watermark=watermark, updated_at=now)
+            ).rowcount
+            if not updated:
+                conn.execute(table.insert().values(name=name, watermark=watermark, updated_at=now))
+
+
+def stop_all_jobs():
+    """Dừng tất cả job (dùng cho script/benchmark)"""
+    with _jobs_lock:
+        for job in _jobs.values():
+            job.stop()
+        _jobs.clear()
@@ -0,0 +1,98 @@
+"""
+Benchmark throughput của REST API (api.py)
+
+Client httpx gọi thẳng ứng dụng ASGI trong cùng process (không qua mạng),
+với `--concurrency` request chạy song song:
+- dashboard: lần đầu (200, trả toàn bộ JSON) và có If-None-Match (304, không body)
+- handover detail, search
+- tạo giao ca có Idempotency-Key
+- export CSV dạng stream
+
+Usage:
+    python benchmarks/bench_api.py --rows 50000 --requests 500 --concurrency 20
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from common import configure_database, seed_handovers
+
+
+async def run_load(client, make_request, total, concurrency):
+    """Gửi `total` request với tối đa `concurrency` request đồng thời. Returns: (req/s, status codes)"""
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses = {}
+
+    async def one(i):
+        async with semaphore:
+            response = await make_request(i)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return total / (time.perf_counter() - started), statuses
+
+
+async def bench(args):
+    import httpx
+    import api
+
+    headers = {'X-API-Key': 'bench'}
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench', headers=headers, timeout=120) as client:
+        detail_id = 'HO-BENCH-00000000'
+        # Dashboard của một ngày có dữ liệu seed
+        day = (await client.get(f'/api/handovers/{detail_id}')).json()['ngay'][:10]
+        day_items = (await client.get('/api/dashboard', params={'date': day})).json()['items']
+        etag = (await client.get('/api/dashboard', params={'date': day})).headers['etag']
+        body = {
+            'ma_nv': '123456', 'ten_nv': 'Nguyen Van A', 'line': 'Line 20A', 'ca': 'Ca Sáng (7h-19h)',
+            'chu_ky': 'A', 'ngay': time.strftime('%Y-%m-%d'), '5S - Tình Trạng': 'OK'
+        }
+
+        scenarios = [
+            ('dashboard (200)', lambda i: client.get('/api/dashboard', params={'date': day})),
+            ('dashboard (304)', lambda i: client.get(
+                '/api/dashboard', params={'date': day}, headers={'If-None-Match': etag}
+            )),
+            ('handover detail', lambda i: client.get(f'/api/handovers/{detail_id}')),
+            ('search', lambda i: client.get('/api/handovers/search', params={'q': 'HO-BENCH-0000', 'limit': 50})),
+            ('create handover', lambda i: client.post(
+                '/api/handovers', json=body, headers={'Idempotency-Key': f'bench-{i}'}
+            )),
+        ]
+
+        print(f"Dashboard {day}: {len(day_items)} bàn giao")
+        print(f"{'Kịch bản':<20}{'req/s':>10}  status")
+        for name, make_request in scenarios:
+            rate, statuses = await run_load(client, make_request, args.requests, args.concurrency)
+            print(f"{name:<20}{rate:>10.1f}  {statuses}")
+
+        started = time.perf_counter()
+        size = 0
+        async with client.stream('GET', '/api/export/handovers.csv') as response:
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+        elapsed = time.perf_counter() - started
+        print(f"{'export CSV':<20}{size / elapsed / 1024 / 1024:>10.1f}  MB/s ({size / 1024 / 1024:.1f} MB trong {elapsed:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"Database: {configure_database()}")
+    os.environ['API_KEYS'] = 'bench'
+    os.environ['FAST_START'] = '1'
+    print(f"Seeded {args.rows} rows in {seed_handovers(args.rows, days=args.days):.1f}s")
+
+    asyncio.run(bench(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Microbenchmark chi phí Python mỗi lần gọi của các truy vấn nóng trong luồng nhận ca
+
+So sánh cách cũ (dựng ORM Query mới + nạp ORM entity ở mỗi lần gọi) với cách mới
+trong db_operations (Core select() dựng sẵn + bindparam, trả về Row).
+Database nhỏ để thời gian đo chủ yếu là overhead phía Python.
+
+Usage:
+    python benchmarks/bench_hot_lookups.py --calls 2000
+"""
+import argparse
+import time
+from datetime import datetime
+
+from common import configure_database, seed_handovers
+
+
+def legacy_get_latest_handover(line, work_date):
+    from database import get_db, Handover
+    from sqlalchemy import and_, func
+    with get_db() as db:
+        handover = db.query(Handover).filter(
+            and_(
+                Handover.line == line,
+                func.date(Handover.ngay_bao_cao) == work_date,
+                Handover.trang_thai_nhan == 'Chưa nhận'
+            )
+        ).order_by(Handover.thoi_gian_giao_ca.desc()).first()
+        return handover.handover_id if handover else None
+
+
+def legacy_check_handover_received(handover_id):
+    from database import get_db, Handover, Receive
+    with get_db() as db:
+        handover = db.query(Handover).filter(Handover.handover_id == handover_id).first()
+        if handover and handover.trang_thai_nhan == 'Đã nhận':
+            receive = db.query(Receive).filter(Receive.handover_id == handover_id).first()
+            if receive:
+                return True, receive.ma_nv_nhan_ca
+        return False, None
+
+
+def legacy_get_handover_by_id(handover_id):
+    from database import get_db, Handover
+    with get_db() as db:
+        handover = db.query(Handover).filter(Handover.handover_id == handover_id).first()
+        return handover.handover_id if handover else None
+
+
+def legacy_get_receive_by_handover_id(handover_id):
+    from database import get_db, Receive
+    with get_db() as db:
+        receive = db.query(Receive).filter(Receive.handover_id == handover_id).first()
+        return receive.id if receive else None
+
+
+def per_call_us(func, args, calls):
+    func(*args)  # warm up (compile cache, pool)
+    started = time.perf_counter()
+    for _ in range(calls):
+        func(*args)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--calls', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"Database: {configure_database()}")
+    seed_handovers(args.rows, days=30)
+
+    import db_operations as ops
+    from database import get_db, Handover
+
+    with get_db() as db:
+        received = db.query(Handover).filter(Handover.trang_thai_nhan == 'Đã nhận').first()
+        pending = db.query(Handover).filter(Handover.trang_thai_nhan == 'Chưa nhận').first()
+        line, work_date = pending.line, pending.ngay_bao_cao.date()
+        received_id = received.handover_id
+
+    cases = [
+        ('get_latest_handover', legacy_get_latest_handover, ops.get_latest_handover, (line, work_date)),
+        ('check_handover_received', legacy_check_handover_received, ops.check_handover_received, (received_id,)),
+        ('get_handover_by_id', legacy_get_handover_by_id, ops.get_handover_by_id, (received_id,)),
+        ('get_receive_by_handover_id', legacy_get_receive_by_handover_id, ops.get_receive_by_handover_id, (received_id,)),
+    ]
+
+    print(f"{'Hàm':<28}{'Trước (µs/lần)':>16}{'Sau (µs/lần)':>16}{'Nhanh hơn':>12}")
+    for name, before_func, after_func, call_args in cases:
+        before = per_call_us(before_func, call_args, args.calls)
+        after = per_call_us(after_func, call_args, args.calls)
+        print(f"{name:<28}{before:>16.1f}{after:>16.1f}{before / after:>11.2f}x")
+
+
+if __name__ == '__main__':
+    main()
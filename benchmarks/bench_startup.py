@@ -0,0 +1,79 @@
+"""
+Benchmark thời gian khởi động của app (cold start)
+
+Mỗi lần đo chạy trong một process Python mới để giống lần render đầu tiên
+sau deploy/cold start:
+- import: thời gian import app.py (database, db_operations, ...)
+- first render: thời gian chạy script app tới khi render xong trang đầu (streamlit AppTest)
+
+So sánh chế độ mặc định với FAST_START=1 (schema tạo trước bằng python database.py init).
+
+Usage:
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+from common import ROOT_DIR, configure_database
+
+IMPORT_SNIPPET = """
+import sys, time
+sys.path.insert(0, {root!r})
+started = time.perf_counter()
+import app
+print(time.perf_counter() - started)
+"""
+
+RENDER_SNIPPET = """
+import time
+from streamlit.testing.v1 import AppTest
+started = time.perf_counter()
+at = AppTest.from_file({app_path!r}, default_timeout=120)
+at.run()
+elapsed = time.perf_counter() - started
+if at.exception:
+    raise SystemExit(str(at.exception[0].value))
+print(elapsed)
+"""
+
+
+def measure(snippet, fast_start, runs):
+    """Chạy snippet trong process mới `runs` lần, trả về danh sách số giây"""
+    env = dict(os.environ, FAST_START='1' if fast_start else '0')
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', snippet],
+            cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(float(output.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Database: {configure_database()}")
+
+    # Tạo schema một lần như bước deploy, để FAST_START đo đúng kịch bản thực tế
+    subprocess.run([sys.executable, 'database.py', 'init'], cwd=ROOT_DIR, check=True, capture_output=True)
+
+    snippets = [
+        ('import app', IMPORT_SNIPPET.format(root=ROOT_DIR)),
+        ('first render', RENDER_SNIPPET.format(app_path=os.path.join(ROOT_DIR, 'app.py'))),
+    ]
+
+    print(f"{'Bước':<16}{'Mặc định (s)':>16}{'FAST_START (s)':>18}")
+    for name, snippet in snippets:
+        default = statistics.median(measure(snippet, False, args.runs))
+        fast = statistics.median(measure(snippet, True, args.runs))
+        print(f"{name:<16}{default:>16.3f}{fast:>18.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""
+Benchmark cột đếm ok_count/nok_count/na_count và partial index bàn giao khẩn cấp
+
+- Kích thước: số byte trung bình mỗi dòng của 6 cột trạng thái dạng chuỗi so với
+  3 cột đếm SmallInteger (PostgreSQL: pg_column_size, SQLite: length)
+- Danh sách KHẨN CẤP (chờ nhận + có NOK) của một ngày: cách cũ nạp mọi bàn giao
+  chờ nhận rồi đếm NOK bằng Python; cách mới lọc nok_count > 0 trong SQL trên
+  partial index ix_handovers_urgent_pending
+- Tóm tắt dashboard: "có NOK" bằng OR trên 6 cột trạng thái so với nok_count > 0
+
+Usage:
+    python benchmarks/bench_status_counts.py --rows 200000
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from common import configure_database, seed_handovers, timeit
+
+STATUS_COLUMNS = ('status_5s', 'status_an_toan', 'status_chat_luong',
+                  'status_thiet_bi', 'status_ke_hoach', 'status_khac')
+
+
+def legacy_urgent_pending(work_date):
+    from database import get_db, Handover
+    day_start = datetime(work_date.year, work_date.month, work_date.day)
+    with get_db() as db:
+        pending = db.query(Handover).filter(
+            Handover.ngay_bao_cao >= day_start,
+            Handover.ngay_bao_cao < day_start + timedelta(days=1),
+            Handover.trang_thai_nhan == 'Chưa nhận',
+            Handover.deleted_at.is_(None)
+        ).all()
+        return [
+            h.handover_id for h in pending
+            if any(getattr(h, column) == 'NOK' for column in STATUS_COLUMNS)
+        ]
+
+
+def legacy_nok_summary(work_date):
+    from database import get_connection, Handover
+    from sqlalchemy import case, func, or_, select
+    table = Handover.__table__
+    day_start = datetime(work_date.year, work_date.month, work_date.day)
+    has_nok = or_(*[table.c[column] == 'NOK' for column in STATUS_COLUMNS])
+    with get_connection() as conn:
+        return conn.execute(select(func.sum(case((has_nok, 1), else_=0))).where(
+            table.c.ngay_bao_cao >= day_start,
+            table.c.ngay_bao_cao < day_start + timedelta(days=1),
+            table.c.deleted_at.is_(None)
+        )).scalar()
+
+
+def column_bytes():
+    """Số byte trung bình mỗi dòng: (6 cột trạng thái, 3 cột đếm)"""
+    from database import get_connection, is_postgresql
+    size = 'pg_column_size' if is_postgresql else 'length'
+    statuses = ' + '.join(f"COALESCE({size}({column}), 0)" for column in STATUS_COLUMNS)
+    counters = ' + '.join(f"COALESCE({size}({column}), 0)" for column in ('ok_count', 'nok_count', 'na_count'))
+    with get_connection() as conn:
+        return conn.exec_driver_sql(f"SELECT AVG({statuses}), AVG({counters}) FROM handovers").one()
+
+
+def explain_urgent(work_date):
+    """Kế hoạch thực thi của truy vấn danh sách khẩn cấp mới"""
+    from database import get_connection, is_postgresql
+    from db_operations import _SELECT_URGENT_PENDING_HANDOVERS
+    day_start = datetime(work_date.year, work_date.month, work_date.day)
+    params = {'day_start': day_start, 'day_end': day_start + timedelta(days=1)}
+    prefix = 'EXPLAIN' if is_postgresql else 'EXPLAIN QUERY PLAN'
+    with get_connection() as conn:
+        compiled = _SELECT_URGENT_PENDING_HANDOVERS.compile(conn)
+        rows = conn.exec_driver_sql(
+            f"{prefix} {compiled}",
+            tuple(params[name] for name in compiled.positiontup) if compiled.positional else params
+        ).all()
+    return [row[-1] for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--days', type=int, default=30)
+    args = parser.parse_args()
+
+    print(f"Database: {configure_database()}")
+    print(f"Seeded {args.rows} handovers in {seed_handovers(args.rows, days=args.days):.1f}s")
+
+    import db_operations as ops
+    from database import get_db, get_engine, Handover
+
+    # Cập nhật thống kê cho planner (PostgreSQL tự làm qua autovacuum)
+    with get_engine().begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+
+    with get_db() as db:
+        work_date = db.query(Handover.ngay_bao_cao).filter(
+            Handover.trang_thai_nhan == 'Chưa nhận'
+        ).first()[0].date()
+
+    print("Kế hoạch truy vấn KHẨN CẤP:")
+    for line in explain_urgent(work_date):
+        print(f"  {line}")
+
+    status_bytes, counter_bytes = column_bytes()
+    print(f"Byte/dòng: 6 cột trạng thái {status_bytes:.1f}, 3 cột đếm {counter_bytes:.1f}")
+
+    cases = [
+        ('Danh sách KHẨN CẤP', lambda: legacy_urgent_pending(work_date),
+         lambda: [h['ID Giao Ca'] for h in ops.get_pending_handovers(work_date, urgent_only=True)]),
+        ('Đếm bàn giao có NOK', lambda: legacy_nok_summary(work_date),
+         lambda: ops._load_dashboard_summary(work_date.strftime('%Y-%m-%d'))['with_nok']),
+    ]
+
+    print(f"{'Truy vấn':<24}{'Trước (ms)':>12}{'Sau (ms)':>12}{'Nhanh hơn':>12}  kết quả")
+    for name, before_func, after_func in cases:
+        before, before_result = timeit(before_func)
+        after, after_result = timeit(after_func)
+        same = sorted(before_result) == sorted(after_result) if isinstance(after_result, list) else before_result == after_result
+        print(f"{name:<24}{before * 1000:>12.2f}{after * 1000:>12.2f}{before / after:>11.2f}x  "
+              f"{'khớp' if same else 'KHÔNG KHỚP'}")
+
+
+if __name__ == '__main__':
+    main()
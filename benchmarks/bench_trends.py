@@ -0,0 +1,37 @@
+"""
+Benchmark truy vấn xu hướng NOK (db_analytics.get_nok_trends)
+
+Usage:
+    python benchmarks/bench_trends.py --rows 1000000
+"""
+import argparse
+from datetime import datetime, timedelta
+
+from common import configure_database, seed_handovers, timeit
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--no-seed', action='store_true', help='Dùng dữ liệu có sẵn trong BENCH_DATABASE_URL')
+    args = parser.parse_args()
+
+    url = configure_database()
+    print(f"Database: {url}")
+    if not args.no_seed:
+        seconds = seed_handovers(args.rows)
+        print(f"Seeded {args.rows} handovers in {seconds:.1f}s")
+
+    from db_analytics import get_nok_trends
+
+    to_date = datetime.now().date()
+    from_date = to_date - timedelta(days=365)
+    for bucket in ('day', 'week', 'month'):
+        best, result = timeit(lambda: get_nok_trends(
+            from_date.strftime('%Y-%m-%d'), to_date.strftime('%Y-%m-%d'), bucket=bucket
+        ))
+        print(f"get_nok_trends(bucket={bucket!r}, 1 năm, tất cả line): {best * 1000:.1f} ms -> {len(result)} dòng")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""
+Tiện ích dùng chung cho các script benchmark
+
+Mặc định benchmark chạy trên một file SQLite tạm để không đụng tới dữ liệu thật.
+Đặt BENCH_DATABASE_URL để chạy trên một bản sao database khác (ví dụ PostgreSQL).
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def configure_database():
+    """Đặt DATABASE_URL trước khi import database.py (engine đọc biến môi trường khi tạo)"""
+    url = os.getenv('BENCH_DATABASE_URL')
+    if not url:
+        tmp_dir = tempfile.mkdtemp(prefix='handover_bench_')
+        url = f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}"
+    os.environ['DATABASE_URL'] = url
+    if ROOT_DIR not in sys.path:
+        sys.path.insert(0, ROOT_DIR)
+    return url
+
+
+def _seed_lines(lines):
+    """Thêm các line chưa có vào danh mục, trả về {tên line: line_id}"""
+    from database import get_db, Line
+
+    with get_db() as db:
+        existing = {line.line_name: line for line in db.query(Line).all()}
+        for name in lines:
+            if name not in existing:
+                existing[name] = Line(line_code=name, line_name=name, is_active=True)
+                db.add(existing[name])
+        db.flush()
+        return {name: existing[name].id for name in lines}
+
+
+def seed_handovers(rows, days=365, lines=None, received_ratio=0.8, batch_size=20000):
+    """
+    Sinh dữ liệu giả cho bảng handovers/receives bằng executemany theo lô
+
+    Returns: số giây đã dùng để seed
+    """
+    from database import get_engine, Handover, Receive, init_db
+
+    init_db()
+    lines = lines or [f'Line {n}{s}' for n in (20, 30, 40, 50) for s in ('A', 'B')]
+    line_ids = _seed_lines(lines)
+    statuses = ['OK'] * 8 + ['NOK', 'NA']
+    start_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+    rnd = random.Random(42)
+
+    started = time.perf_counter()
+    handover_batch, receive_batch = [], []
+    with get_engine().begin() as conn:
+        for i in range(rows):
+            day = start_day + timedelta(days=rnd.randrange(days))
+            given_at = day + timedelta(hours=rnd.choice((7, 19)), minutes=rnd.randrange(60))
+            received = rnd.random() < received_ratio
+            handover_id = f"HO-BENCH-{i:08d}"
+            handover_batch.append({
+                'handover_id': handover_id,
+                'ma_nv_giao_ca': f"{rnd.randrange(100000, 999999)}",
+                'ten_nv_giao_ca': 'Nguyen Van A',
+                'line': rnd.choice(lines),
+                'ca': rnd.choice(('Ca Sáng (7h-19h)', 'Ca Tối (19h-7h)')),
+                'nhan_vien_thuoc_ca': rnd.choice('ABCD'),
+                'ngay_bao_cao': day,
+                'thoi_gian_giao_ca': given_at,
+                'trang_thai_nhan': 'Đã nhận' if received else 'Chưa nhận',
+                'status_5s': rnd.choice(statuses),
+                'status_an_toan': rnd.choice(statuses),
+                'status_chat_luong': rnd.choice(statuses),
+                'status_thiet_bi': rnd.choice(statuses),
+                'status_ke_hoach': rnd.choice(statuses),
+                'status_khac': rnd.choice(statuses),
+                'created_at': given_at,
+            })
+            row_statuses = [value for key, value in handover_batch[-1].items() if key.startswith('status_')]
+            handover_batch[-1].update(
+                line_id=line_ids[handover_batch[-1]['line']],
+                ok_count=row_statuses.count('OK'),
+                nok_count=row_statuses.count('NOK'),
+                na_count=row_statuses.count('NA'),
+            )
+            if received:
+                receive_batch.append({
+                    'ma_nv_nhan_ca': f"{rnd.randrange(100000, 999999)}",
+                    'ten_nv_nhan_ca': 'Tran Thi B',
+                    'line': handover_batch[-1]['line'],
+                    'line_id': handover_batch[-1]['line_id'],
+                    'ca': handover_batch[-1]['ca'],
+                    'nhan_vien_thuoc_ca': rnd.choice('ABCD'),
+                    'ngay_nhan_ca': day,
+                    'thoi_gian_nhan_ca': given_at + timedelta(minutes=rnd.randrange(5, 240)),
+                    'handover_id': handover_id,
+                    'created_at': given_at,
+                })
+            # Ghi receives cùng lúc với handovers của chúng (receives.handover_id là khóa ngoại)
+            if len(handover_batch) >= batch_size:
+                conn.execute(Handover.__table__.insert(), handover_batch)
+                handover_batch = []
+                if receive_batch:
+                    conn.execute(Receive.__table__.insert(), receive_batch)
+                    receive_batch = []
+        if handover_batch:
+            conn.execute(Handover.__table__.insert(), handover_batch)
+        if receive_batch:
+            conn.execute(Receive.__table__.insert(), receive_batch)
+    return time.perf_counter() - started
+
+
+def timeit(func, repeat=5):
+    """Chạy func nhiều lần, trả về (thời gian tốt nhất, kết quả lần cuối)"""
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
@@ -0,0 +1,189 @@
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import and_, exists, func, select
+from sqlalchemy.orm import aliased
+from database import get_connection, Handover, Receive
+from audit import record_audit
+from background_jobs import start_periodic_job, get_job_watermark, set_job_watermark
+
+# ===== CONSISTENCY CHECK =====
+# handovers.trang_thai_nhan là bản sao (denormalized) của "có phiếu nhận còn hiệu lực".
+# Job này tìm các chỗ lệch giữa hai bảng bằng anti-join/semi-join theo lô ngày báo cáo
+# (không tra từng dòng), báo cáo và (tùy chọn) sửa:
+#   - received_without_receive: bàn giao 'Đã nhận' nhưng không còn phiếu nhận
+#   - pending_with_receive: bàn giao 'Chưa nhận' nhưng đã có phiếu nhận
+#   - orphan_receive: phiếu nhận của bàn giao không tồn tại hoặc đã bị xóa
+#   - duplicate_receive: nhiều phiếu nhận còn hiệu lực cho một bàn giao
+#
+# Chạy tăng dần: mỗi lần chỉ quét các ngày có bàn giao thay đổi (updated_at) sau
+# watermark lưu trong job_state; quét toàn bộ khi chạy tay với full=True.
+
+# Chu kỳ chạy job (giây)
+CONSISTENCY_INTERVAL_SECONDS = int(os.getenv('CONSISTENCY_INTERVAL_SECONDS', '3600'))
+
+# Job nền tự sửa chỗ lệch (mặc định chỉ báo cáo)
+CONSISTENCY_AUTO_REPAIR = os.getenv('CONSISTENCY_AUTO_REPAIR', '').lower() in ('1', 'true', 'yes')
+
+# Lùi watermark để không bỏ sót transaction ghi updated_at trước nhưng commit sau lần đọc
+CONSISTENCY_OVERLAP_SECONDS = int(os.getenv('CONSISTENCY_OVERLAP_SECONDS', '60'))
+
+# Số ngày báo cáo quét trong một lô (một transaction)
+CONSISTENCY_BATCH_DAYS = 31
+
+# Số ID mẫu giữ lại cho mỗi loại lệch trong báo cáo
+CONSISTENCY_SAMPLE_SIZE = 20
+
+JOB_NAME = 'consistency_check'
+
+DRIFT_KINDS = ('received_without_receive', 'pending_with_receive', 'orphan_receive', 'duplicate_receive')
+
+_handovers = Handover.__table__
+_receives = Receive.__table__
+
+_HANDOVER_LIVE = _handovers.c.deleted_at.is_(None)
+_RECEIVE_LIVE = _receives.c.deleted_at.is_(None)
+_HAS_LIVE_RECEIVE = exists().where(_receives.c.handover_id == _handovers.c.handover_id, _RECEIVE_LIVE)
+_HAS_LIVE_HANDOVER = exists().where(_handovers.c.handover_id == _receives.c.handover_id, _HANDOVER_LIVE)
+
+
+def _drift_conditions(days):
+    """Điều kiện WHERE của từng loại lệch trong các ngày báo cáo `days`"""
+    in_days = _handovers.c.ngay_bao_cao.in_(days)
+    # Giữ phiếu nhận đầu tiên (id nhỏ nhất), các phiếu còn lại là bản trùng
+    earlier = aliased(_receives)
+    return {
+        'received_without_receive': and_(
+            in_days, _HANDOVER_LIVE, _handovers.c.trang_thai_nhan == 'Đã nhận', ~_HAS_LIVE_RECEIVE
+        ),
+        'pending_with_receive': and_(
+            in_days, _HANDOVER_LIVE, _handovers.c.trang_thai_nhan == 'Chưa nhận', _HAS_LIVE_RECEIVE
+        ),
+        'orphan_receive': and_(
+            _receives.c.ngay_nhan_ca.in_(days), _RECEIVE_LIVE, ~_HAS_LIVE_HANDOVER
+        ),
+        'duplicate_receive': and_(
+            _RECEIVE_LIVE,
+            exists().where(_handovers.c.handover_id == _receives.c.handover_id, in_days),
+            exists().where(
+                earlier.c.handover_id == _receives.c.handover_id,
+                earlier.c.deleted_at.is_(None),
+                earlier.c.id < _receives.c.id
+            )
+        ),
+    }
+
+
+def _check_batch(conn, days, repair, now):
+    """
+    Tìm (và sửa) chỗ lệch trong một lô ngày, mỗi loại lệch là 1 câu SELECT set-based
+    Returns: dict {loại lệch: list handover_id (orphan/duplicate: list (id phiếu nhận, handover_id))}
+    """
+    conditions = _drift_conditions(days)
+    found = {}
+    for kind in ('received_without_receive', 'pending_with_receive'):
+        found[kind] = conn.execute(select(_handovers.c.handover_id).where(conditions[kind])).scalars().all()
+    for kind in ('orphan_receive', 'duplicate_receive'):
+        found[kind] = [tuple(row) for row in conn.execute(
+            select(_receives.c.id, _receives.c.handover_id).where(conditions[kind])
+        )]
+
+    if not repair:
+        return found
+
+    # Xóa mềm phiếu nhận thừa trước (khôi phục được từ thùng rác), rồi mới đồng bộ trạng thái
+    for kind in ('orphan_receive', 'duplicate_receive'):
+        if found[kind]:
+            conn.execute(_receives.update().where(
+                _receives.c.id.in_([receive_id for receive_id, _ in found[kind]]), conditions[kind]
+            ).values(deleted_at=now))
+    for kind, status in (('received_without_receive', 'Chưa nhận'), ('pending_with_receive', 'Đã nhận')):
+        if found[kind]:
+            conn.execute(_handovers.update().where(
+                _handovers.c.handover_id.in_(found[kind]), conditions[kind]
+            ).values(trang_thai_nhan=status, version=_handovers.c.version + 1))
+    return found
+
+
+def _record_repairs(conn, found, now, actor):
+    """Ghi audit cho các chỗ lệch vừa sửa, trong transaction của lô sửa"""
+    for handover_id in found['received_without_receive']:
+        record_audit('handover', handover_id, 'repair',
+                     {'trang_thai_nhan': 'Đã nhận'}, {'trang_thai_nhan': 'Chưa nhận'}, actor, conn=conn)
+    for handover_id in found['pending_with_receive']:
+        record_audit('handover', handover_id, 'repair',
+                     {'trang_thai_nhan': 'Chưa nhận'}, {'trang_thai_nhan': 'Đã nhận'}, actor, conn=conn)
+    for kind in ('orphan_receive', 'duplicate_receive'):
+        for receive_id, handover_id in found[kind]:
+            record_audit('receive', handover_id, 'repair',
+                         {'id': receive_id, 'deleted_at': None}, {'id': receive_id, 'deleted_at': now}, actor,
+                         conn=conn)
+
+
+def run_consistency_check(repair=False, full=False, actor='consistency_check'):
+    """
+    Quét các chỗ lệch giữa handovers.trang_thai_nhan và bảng receives theo lô ngày báo cáo
+
+    Args:
+        repair: sửa các chỗ lệch tìm thấy (mặc định chỉ báo cáo)
+        full: quét mọi ngày thay vì chỉ các ngày có thay đổi sau watermark
+        actor: người thực hiện (ghi vào audit log khi sửa)
+
+    Returns: dict {'days': số ngày đã quét, 'repaired': bool,
+                   loại lệch: số chỗ lệch, 'samples': {loại lệch: vài ID mẫu}}
+    """
+    watermark = None if full else get_job_watermark(JOB_NAME)
+
+    with get_connection() as conn:
+        new_watermark = conn.execute(select(func.max(_handovers.c.updated_at))).scalar()
+        handover_days = select(_handovers.c.ngay_bao_cao).distinct()
+        if watermark is not None:
+            handover_days = handover_days.where(
+                _handovers.c.updated_at > watermark - timedelta(seconds=CONSISTENCY_OVERLAP_SECONDS)
+            )
+        days = set(conn.execute(handover_days).scalars())
+        if full:
+            # Phiếu nhận mồ côi có thể nằm ở ngày không còn bàn giao nào
+            days.update(conn.execute(
+                select(_receives.c.ngay_nhan_ca).where(_RECEIVE_LIVE, _receives.c.ngay_nhan_ca.isnot(None)).distinct()
+            ).scalars())
+    days = sorted(days)
+
+    now = datetime.now()
+    found = {kind: [] for kind in DRIFT_KINDS}
+    for start in range(0, len(days), CONSISTENCY_BATCH_DAYS):
+        batch = days[start:start + CONSISTENCY_BATCH_DAYS]
+        with get_connection() as conn:
+            with conn.begin():
+                batch_found = _check_batch(conn, batch, repair, now)
+                if repair:
+                    # Audit commit cùng lô sửa
+                    _record_repairs(conn, batch_found, now, actor)
+        for kind, ids in batch_found.items():
+            found[kind].extend(ids)
+
+    if new_watermark is not None:
+        set_job_watermark(JOB_NAME, new_watermark)
+
+    drift = sum(len(ids) for ids in found.values())
+    if drift:
+        print(f"Consistency check: {drift} drifted rows in {len(days)} days ({'repaired' if repair else 'report only'})")
+    return {
+        'days': len(days),
+        'repaired': repair,
+        **{kind: len(ids) for kind, ids in found.items()},
+        # Mẫu để tra cứu: handover_id của từng loại lệch
+        'samples': {
+            kind: [item[1] if isinstance(item, tuple) else item for item in ids[:CONSISTENCY_SAMPLE_SIZE]]
+            for kind, ids in found.items() if ids
+        }
+    }
+
+
+def start_consistency_job(interval_seconds=None, initial_delay=0):
+    """Khởi động job kiểm tra nhất quán chạy nền (mỗi process chỉ một lần)"""
+    return start_periodic_job(
+        JOB_NAME,
+        lambda: run_consistency_check(repair=CONSISTENCY_AUTO_REPAIR),
+        interval_seconds or CONSISTENCY_INTERVAL_SECONDS,
+        initial_delay=initial_delay
+    )
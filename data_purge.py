@@ -0,0 +1,89 @@
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import and_, select
+from database import get_connection, Handover, Receive
+from background_jobs import start_periodic_job
+
+# ===== PURGE DỮ LIỆU ĐÃ XÓA MỀM =====
+# delete_handover/delete_receive chỉ đánh dấu deleted_at (1 câu UPDATE có index).
+# Job này xóa hẳn các dòng đã nằm trong thùng rác quá thời gian lưu trữ, theo
+# từng lô nhỏ (mỗi lô 1 transaction ngắn) và chỉ trong khung giờ thấp điểm.
+
+# Số ngày giữ dữ liệu trong thùng rác trước khi xóa hẳn
+SOFT_DELETE_RETENTION_DAYS = int(os.getenv('SOFT_DELETE_RETENTION_DAYS', '30'))
+
+# Số dòng xóa trong mỗi transaction
+PURGE_BATCH_SIZE = int(os.getenv('PURGE_BATCH_SIZE', '500'))
+
+# Khung giờ thấp điểm được phép purge (giờ bắt đầu-giờ kết thúc, ví dụ "1-5")
+PURGE_OFF_PEAK_HOURS = os.getenv('PURGE_OFF_PEAK_HOURS', '1-5')
+
+# Chu kỳ kiểm tra của job (giây)
+PURGE_INTERVAL_SECONDS = int(os.getenv('PURGE_INTERVAL_SECONDS', '900'))
+
+
+def _is_off_peak(now=None):
+    """Giờ hiện tại có nằm trong khung PURGE_OFF_PEAK_HOURS không (hỗ trợ khung qua nửa đêm)"""
+    start, end = (int(hour) for hour in PURGE_OFF_PEAK_HOURS.split('-'))
+    hour = (now or datetime.now()).hour
+    if start <= end:
+        return start <= hour <= end
+    return hour >= start or hour <= end
+
+
+def _purge_table(table, cutoff, batch_size):
+    """Xóa theo lô các dòng có deleted_at < cutoff, trả về tổng số dòng đã xóa"""
+    total = 0
+    while True:
+        with get_connection() as conn:
+            with conn.begin():
+                ids = conn.execute(
+                    select(table.c.id).where(
+                        and_(table.c.deleted_at.isnot(None), table.c.deleted_at < cutoff)
+                    ).limit(batch_size)
+                ).scalars().all()
+
+                if not ids:
+                    return total
+
+                total += conn.execute(table.delete().where(table.c.id.in_(ids))).rowcount
+
+        if len(ids) < batch_size:
+            return total
+
+
+def purge_deleted_records(retention_days=None, batch_size=None, force=False):
+    """
+    Xóa hẳn các receive/handover đã xóa mềm quá thời gian lưu trữ
+
+    Args:
+        retention_days: Số ngày giữ trong thùng rác (mặc định SOFT_DELETE_RETENTION_DAYS)
+        batch_size: Số dòng mỗi lô (mặc định PURGE_BATCH_SIZE)
+        force: Chạy cả ngoài khung giờ thấp điểm
+
+    Returns: dict số dòng đã xóa theo bảng (None nếu bỏ qua vì đang giờ cao điểm)
+    """
+    if not force and not _is_off_peak():
+        return None
+
+    cutoff = datetime.now() - timedelta(days=retention_days or SOFT_DELETE_RETENTION_DAYS)
+    batch_size = batch_size or PURGE_BATCH_SIZE
+
+    # Khóa ngoại ON DELETE CASCADE xóa luôn phiếu nhận của bàn giao bị xóa hẳn;
+    # lượt thứ hai chỉ còn các phiếu nhận bị xóa riêng (delete_receive)
+    handovers = _purge_table(Handover.__table__, cutoff, batch_size)
+    receives = _purge_table(Receive.__table__, cutoff, batch_size)
+
+    if receives or handovers:
+        print(f"Purged {handovers} handovers, {receives} receives deleted before {cutoff:%Y-%m-%d}")
+    return {'handovers': handovers, 'receives': receives}
+
+
+def start_purge_job(interval_seconds=None, initial_delay=0):
+    """Khởi động job purge chạy nền (mỗi process chỉ một lần)"""
+    return start_periodic_job(
+        'purge_deleted',
+        purge_deleted_records,
+        interval_seconds or PURGE_INTERVAL_SECONDS,
+        initial_delay=initial_delay
+    )
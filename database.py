@@ -1,5 +1,7 @@
 import os
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Text
+import sys
+import threading
+from sqlalchemy import create_engine, event, Column, ForeignKey, Integer, SmallInteger, String, DateTime, Boolean, Text, Index, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime
@@ -21,42 +23,77 @@ if not DATABASE_URL:
 is_postgresql = 'postgresql' in DATABASE_URL
 is_sqlite = 'sqlite' in DATABASE_URL
 
-# Tạo engine với connection pooling tùy theo database type
-if is_postgresql:
-    # PostgreSQL: Production settings cho Render
-    engine = create_engine(
-        DATABASE_URL,
-        pool_size=10,           # Số connection cơ bản trong pool
-        max_overflow=20,        # Số connection bổ sung tối đa khi pool đầy
-        pool_pre_ping=True,     # Kiểm tra connection trước khi dùng (detect stale connections)
-        pool_recycle=3600,      # Recycle connection sau 1 giờ (tránh timeout)
-        echo=False,             # Set True để debug SQL queries
-        connect_args={
-            'connect_timeout': 10,
-            'options': '-c timezone=utc'
-        }
-    )
-    print("Connected to PostgreSQL (Production)")
-elif is_sqlite:
-    # SQLite: Local development settings
-    engine = create_engine(
-        DATABASE_URL,
-        pool_size=5,            # SQLite không cần pool lớn
-        max_overflow=10,
-        pool_pre_ping=True,
-        echo=False,
-        connect_args={
-            'check_same_thread': False,  # Cho phép multi-thread với SQLite
-            'timeout': 30                # Timeout cho lock contention
-        }
-    )
-    print("Connected to SQLite (Local Development)")
-else:
-    # Fallback generic
-    engine = create_engine(DATABASE_URL, echo=False)
-    print(f"Connected to database: {DATABASE_URL[:20]}...")
+# Chế độ khởi động nhanh: app không chạy create_all/seed ở lần render đầu tiên,
+# schema được tạo bằng lệnh riêng khi deploy (python database.py init)
+FAST_START = os.getenv('FAST_START', '').lower() in ('1', 'true', 'yes')
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def _create_engine():
+    """Tạo engine với connection pooling tùy theo database type"""
+    if is_postgresql:
+        # PostgreSQL: Production settings cho Render
+        new_engine = create_engine(
+            DATABASE_URL,
+            pool_size=10,           # Số connection cơ bản trong pool
+            max_overflow=20,        # Số connection bổ sung tối đa khi pool đầy
+            pool_pre_ping=True,     # Kiểm tra connection trước khi dùng (detect stale connections)
+            pool_recycle=3600,      # Recycle connection sau 1 giờ (tránh timeout)
+            echo=False,             # Set True để debug SQL queries
+            connect_args={
+                'connect_timeout': 10,
+                'options': '-c timezone=utc'
+            }
+        )
+        print("Connected to PostgreSQL (Production)")
+    elif is_sqlite:
+        # SQLite: Local development settings
+        new_engine = create_engine(
+            DATABASE_URL,
+            pool_size=5,            # SQLite không cần pool lớn
+            max_overflow=10,
+            pool_pre_ping=True,
+            echo=False,
+            connect_args={
+                'check_same_thread': False,  # Cho phép multi-thread với SQLite
+                'timeout': 30                # Timeout cho lock contention
+            }
+        )
+
+        @event.listens_for(new_engine, 'connect')
+        def _enable_foreign_keys(dbapi_connection, connection_record):
+            # SQLite mặc định không kiểm tra khóa ngoại (kể cả ON DELETE CASCADE): bật cho từng connection
+            cursor = dbapi_connection.cursor()
+            cursor.execute('PRAGMA foreign_keys=ON')
+            cursor.close()
+        
+        print("Connected to SQLite (Local Development)")
+    else:
+        # Fallback generic
+        new_engine = create_engine(DATABASE_URL, echo=False)
+        print(f"Connected to database: {DATABASE_URL[:20]}...")
+    return new_engine
+
+def get_engine():
+    """
+    Lấy engine, chỉ tạo ở lần dùng đầu tiên (lazy) để import database.py
+    không tốn thời gian nạp driver/khởi tạo pool lúc app khởi động
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = _create_engine()
+    return _engine
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def __getattr__(name):
+    # Giữ tương thích với code cũ dùng `database.engine` / `from database import engine`
+    if name == 'engine':
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
 # Context manager để tự động close session
@@ -70,7 +107,7 @@ def get_db():
         with get_db() as db:
             user = db.query(User).first()
     """
-    db = SessionLocal()
+    db = SessionLocal(bind=get_engine())
     try:
         yield db
         db.commit()
@@ -80,6 +117,20 @@ def get_db():
     finally:
         db.close()
 
+@contextmanager
+def get_connection():
+    """
+    Context manager cho Core connection (không qua ORM Session)
+    Dùng cho các truy vấn đọc nóng: trả về Row nhẹ thay vì ORM entity,
+    không có identity map / unit of work
+    
+    Usage:
+        with get_connection() as conn:
+            row = conn.execute(stmt, {'handover_id': handover_id}).first()
+    """
+    with get_engine().connect() as conn:
+        yield conn
+
 # ===== DATABASE MODELS =====
 
 class User(Base):
@@ -88,7 +139,7 @@ class User(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), unique=True, index=True, nullable=False)
-    password = Column(String(100), nullable=False)
+    password = Column(String(255), nullable=False)  # Hash PBKDF2 (auth.hash_password)
     full_name = Column(String(200))
     created_at = Column(DateTime, default=datetime.now)
 
@@ -102,6 +153,33 @@ class Line(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.now)
 
+class Employee(Base):
+    """Model cho bảng employees - danh bạ nhân viên (kiểm tra mã NV, tự điền tên)"""
+    __tablename__ = 'employees'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    ma_nv = Column(String(6), unique=True, index=True, nullable=False)
+    ten_nv = Column(String(200), nullable=False)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+# Các ca làm việc mặc định (lịch ca seed cho mọi line, mọi ngày trong tuần)
+DEFAULT_SHIFTS = ['Ca Sáng (7h-19h)', 'Ca Tối (19h-7h)']
+
+class ShiftRule(Base):
+    """Model cho bảng shift_rules - lịch ca dự kiến: line × ca × ngày sinh ra từ quy tắc"""
+    __tablename__ = 'shift_rules'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    line_id = Column(Integer, ForeignKey('lines.id'), index=True)  # NULL = áp dụng cho mọi line đang hoạt động
+    ca = Column(String(50), nullable=False)
+    weekdays = Column(String(7), default='1111111', nullable=False)  # Thứ 2..Chủ nhật, '1' = có ca
+    valid_from = Column(DateTime)  # NULL = không giới hạn
+    valid_to = Column(DateTime)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.now)
+
 class Handover(Base):
     """Model cho bảng handovers - lưu thông tin giao ca"""
     __tablename__ = 'handovers'
@@ -110,13 +188,23 @@ class Handover(Base):
     handover_id = Column(String(50), unique=True, index=True, nullable=False)
     ma_nv_giao_ca = Column(String(6), nullable=False)
     ten_nv_giao_ca = Column(String(200), nullable=False)
-    line = Column(String(100), index=True, nullable=False)
+    # Tên line lúc ghi (giữ nguyên khi đổi tên line): lọc, nhóm và join dùng line_id,
+    # tên hiển thị tra theo line_id từ danh mục lines lúc đọc
+    line = Column(String(100), nullable=False)
     ca = Column(String(50), nullable=False)
     nhan_vien_thuoc_ca = Column(String(10), nullable=False)
     ngay_bao_cao = Column(DateTime, index=True, nullable=False)
     thoi_gian_giao_ca = Column(DateTime, default=datetime.now, index=True)
     trang_thai_nhan = Column(String(20), default='Chưa nhận', index=True)
     
+    # Khóa ổn định tới bảng lines: đổi tên line trong Cài Đặt chỉ sửa một dòng của
+    # bảng lines, lịch sử không bị ghi lại
+    line_id = Column(Integer, ForeignKey('lines.id'), index=True)
+    
+    # Khóa idempotency do client tạo cho mỗi form giao ca: gửi lại cùng khóa
+    # sẽ trả về handover_id cũ thay vì tạo bàn giao trùng
+    request_key = Column(String(64), unique=True, index=True)
+    
     # Trạng thái các hạng mục
     status_5s = Column(String(10))
     comment_5s = Column(Text)
@@ -131,7 +219,50 @@ class Handover(Base):
     status_khac = Column(String(10))
     comment_khac = Column(Text)
     
+    # Số hạng mục OK/NOK/NA, tính một lần khi ghi (save_handover_safe/update_handover)
+    # để người đọc không phải đếm lại và lọc được "có NOK" ngay trong SQL
+    ok_count = Column(SmallInteger)
+    nok_count = Column(SmallInteger)
+    na_count = Column(SmallInteger)
+    
     created_at = Column(DateTime, default=datetime.now, index=True)
+    
+    # Lần thay đổi cuối (tạo, sửa, nhận/hủy nhận, xóa/khôi phục): onupdate chạy cho
+    # cả ORM flush lẫn Core update(), dùng làm high-water mark khi làm mới dashboard
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    
+    # Phiên bản của bàn giao, tăng 1 mỗi lần admin sửa, xóa/khôi phục hoặc trạng thái nhận thay đổi:
+    # mốc duy nhất cho sửa/xóa đồng thời (so sánh rồi ghi trong cùng câu
+    # UPDATE ... WHERE version = ?, không cần khóa dòng)
+    version = Column(Integer, nullable=False, default=1, server_default='1')
+    
+    # Xóa mềm: NULL = còn hiệu lực; job purge xóa hẳn sau thời gian lưu trữ
+    deleted_at = Column(DateTime)
+    
+    __table_args__ = (
+        # Covering index cho thống kê xu hướng NOK (db_analytics.get_nok_trends): số giao ca và tổng NOK
+        # theo (ngày, line) đọc thẳng từ index; chỉ các dòng có NOK mới phải đọc bảng.
+        # deleted_at nằm cuối (không dùng partial index) để điều kiện bỏ dòng đã xóa cũng đọc từ index
+        Index('ix_handovers_trend_counts', 'ngay_bao_cao', 'line_id', 'ok_count', 'nok_count', 'na_count', 'deleted_at'),
+        # Tìm bàn giao chờ nhận của một line trong ngày (màn hình nhận ca)
+        Index('ix_handovers_line_id_day_status', 'line_id', 'ngay_bao_cao', 'trang_thai_nhan'),
+        # Partial index chỉ chứa bàn giao chưa xóa: các truy vấn nóng (lọc deleted_at IS NULL)
+        # không phải quét qua các dòng đã xóa mềm
+        Index('ix_handovers_live_day_line_id_status', 'ngay_bao_cao', 'line_id', 'trang_thai_nhan',
+              postgresql_where=text('deleted_at IS NULL'), sqlite_where=text('deleted_at IS NULL')),
+        # Thùng rác và job purge chỉ đọc các dòng đã xóa
+        Index('ix_handovers_deleted_at', 'deleted_at',
+              postgresql_where=text('deleted_at IS NOT NULL'), sqlite_where=text('deleted_at IS NOT NULL')),
+        # Dashboard chỉ đọc các dòng thay đổi sau lần làm mới trước (updated_at > mốc)
+        Index('ix_handovers_updated_at', 'updated_at'),
+        # Partial index chỉ chứa bàn giao chờ nhận có NOK (KHẨN CẤP): danh sách khẩn cấp
+        # đọc thẳng từ index nhỏ này thay vì quét mọi bàn giao chờ nhận
+        Index('ix_handovers_urgent_pending_line_id', 'ngay_bao_cao', 'line_id', 'handover_id',
+              postgresql_where=text("trang_thai_nhan = 'Chưa nhận' AND nok_count > 0 AND deleted_at IS NULL"),
+              sqlite_where=text("trang_thai_nhan = 'Chưa nhận' AND nok_count > 0 AND deleted_at IS NULL")),
+        # Lịch sử bàn giao của một nhân viên (mới nhất trước)
+        Index('ix_handovers_ma_nv_giao_ca_time', 'ma_nv_giao_ca', 'thoi_gian_giao_ca'),
+    )
 
 class Receive(Base):
     """Model cho bảng receives - lưu thông tin nhận ca"""
@@ -140,12 +271,15 @@ class Receive(Base):
     id = Column(Integer, primary_key=True, index=True)
     ma_nv_nhan_ca = Column(String(6), nullable=False)
     ten_nv_nhan_ca = Column(String(200), nullable=False)
-    line = Column(String(100), index=True)
+    line = Column(String(100))  # Tên line lúc ghi, như handovers.line
+    line_id = Column(Integer, ForeignKey('lines.id'), index=True)
     ca = Column(String(50))
     nhan_vien_thuoc_ca = Column(String(10))
     ngay_nhan_ca = Column(DateTime, index=True)
     thoi_gian_nhan_ca = Column(DateTime, default=datetime.now, index=True)
-    handover_id = Column(String(50), index=True, nullable=False)
+    # Xóa hẳn bàn giao (job purge) thì các phiếu nhận của nó bị xóa theo trong cùng câu lệnh
+    handover_id = Column(String(50), ForeignKey('handovers.handover_id', ondelete='CASCADE', name='fk_receives_handover_id'),
+                         index=True, nullable=False)
     
     # Xác nhận các hạng mục
     xac_nhan_5s = Column(String(20))
@@ -162,6 +296,102 @@ class Receive(Base):
     comment_khac = Column(Text)
     
     created_at = Column(DateTime, default=datetime.now)
+    
+    # Xóa mềm: NULL = còn hiệu lực; job purge xóa hẳn sau thời gian lưu trữ
+    deleted_at = Column(DateTime)
+    
+    __table_args__ = (
+        # Mỗi bàn giao chỉ có một phiếu nhận còn hiệu lực (phiếu đã xóa mềm không tính)
+        Index('uq_receives_live_handover_id', 'handover_id', unique=True,
+              postgresql_where=text('deleted_at IS NULL'), sqlite_where=text('deleted_at IS NULL')),
+        Index('ix_receives_deleted_at', 'deleted_at',
+              postgresql_where=text('deleted_at IS NOT NULL'), sqlite_where=text('deleted_at IS NOT NULL')),
+        # Lịch sử nhận ca của một nhân viên (mới nhất trước)
+        Index('ix_receives_ma_nv_nhan_ca_time', 'ma_nv_nhan_ca', 'thoi_gian_nhan_ca'),
+    )
+
+class SlaAlert(Base):
+    """Model cho bảng sla_alerts - bàn giao chờ nhận quá thời hạn SLA (do sla_monitor ghi)"""
+    __tablename__ = 'sla_alerts'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    handover_id = Column(String(50), unique=True, index=True, nullable=False)
+    line = Column(String(100), nullable=False)  # Tên line lúc phát hiện
+    line_id = Column(Integer, ForeignKey('lines.id'))
+    ca = Column(String(50))
+    ngay_bao_cao = Column(DateTime, nullable=False)
+    thoi_gian_giao_ca = Column(DateTime, nullable=False)
+    sla_minutes = Column(Integer, nullable=False)
+    detected_at = Column(DateTime, default=datetime.now, nullable=False)
+    resolved_at = Column(DateTime)  # NULL = vẫn đang chờ nhận
+    
+    __table_args__ = (
+        # Dashboard chỉ đọc các cảnh báo đang mở của một ngày
+        Index('ix_sla_alerts_open', 'ngay_bao_cao', 'resolved_at'),
+    )
+
+class JobState(Base):
+    """Model cho bảng job_state - mốc (watermark) của các job nền chạy tăng dần"""
+    __tablename__ = 'job_state'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String(50), unique=True, index=True, nullable=False)
+    watermark = Column(DateTime)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+class DiscrepancySummary(Base):
+    """Model cho bảng discrepancy_summary - số hạng mục bên giao OK mà bên nhận không đồng ý (do discrepancy.py ghi)"""
+    __tablename__ = 'discrepancy_summary'
+    
+    id = Column(Integer, primary_key=True, index=True)
+    ngay_bao_cao = Column(DateTime, nullable=False)
+    line_id = Column(Integer)
+    ca = Column(String(50))
+    ma_nv_giao_ca = Column(String(6))
+    ma_nv_nhan_ca = Column(String(6))
+    category = Column(String(20), nullable=False)
+    compared = Column(Integer, nullable=False)  # Số phiếu nhận của bàn giao có hạng mục OK
+    not_confirmed = Column(Integer, nullable=False)  # Bên nhận không xác nhận
+    commented = Column(Integer, nullable=False)  # Bên nhận xác nhận nhưng ghi chú khác
+    
+    __table_args__ = (
+        # Làm mới theo ngày và báo cáo theo khoảng ngày / line
+        Index('ix_discrepancy_summary_day_line_id', 'ngay_bao_cao', 'line_id'),
+    )
+
+class DiscrepancyDirtyDay(Base):
+    """Model cho bảng discrepancy_dirty_days - ngày báo cáo cần tính lại bảng tổng hợp bất đồng"""
+    __tablename__ = 'discrepancy_dirty_days'
+    
+    day = Column(DateTime, primary_key=True)
+    # Lần đánh dấu cuối: job chỉ xóa đúng lần đánh dấu đã đọc, đánh dấu lại trong lúc tính vẫn còn
+    marked_at = Column(DateTime, nullable=False)
+
+class AuditLog(Base):
+    """Model cho bảng audit_log - lịch sử sửa/xóa của admin, chỉ thêm mới (do audit.py ghi)"""
+    __tablename__ = 'audit_log'
+    
+    id = Column(Integer, primary_key=True)
+    entity_type = Column(String(20), nullable=False)   # 'handover', 'receive', 'lines'
+    entity_id = Column(String(50), nullable=False)     # handover_id hoặc khóa của đối tượng
+    action = Column(String(20), nullable=False)        # 'update', 'delete', 'restore', ...
+    actor = Column(String(200))
+    changes = Column(Text)                             # JSON {cột: [giá trị cũ, giá trị mới]}
+    created_at = Column(DateTime, default=datetime.now, nullable=False)
+    
+    __table_args__ = (
+        # Tra lịch sử của một bàn giao theo thời gian
+        Index('ix_audit_log_entity_time', 'entity_id', 'created_at'),
+    )
+
+class SchemaMigration(Base):
+    """Model cho bảng schema_migrations - các phiên bản migration đã chạy (do migrations.py ghi)"""
+    __tablename__ = 'schema_migrations'
+    
+    version = Column(String(20), primary_key=True)
+    name = Column(String(200), nullable=False)
+    applied_at = Column(DateTime, default=datetime.now, nullable=False)
+    duration_ms = Column(Integer)
 
 def init_db():
     """
@@ -169,8 +399,9 @@ def init_db():
     Được gọi khi app khởi động lần đầu
     """
     try:
-        # Tạo tất cả tables
-        Base.metadata.create_all(bind=engine)
+        # Tạo/cập nhật schema bằng các migration chưa chạy (xem migrations.py)
+        from migrations import upgrade
+        upgrade()
         print("Database tables created successfully")
         
         # Tạo dữ liệu mặc định
@@ -178,9 +409,10 @@ def init_db():
             # Kiểm tra và tạo admin user
             admin = db.query(User).filter(User.username == 'admin').first()
             if not admin:
+                from auth import hash_password
                 admin = User(
                     username='admin',
-                    password='admin123',
+                    password=hash_password('admin123'),
                     full_name='Administrator'
                 )
                 db.add(admin)
@@ -198,9 +430,22 @@ def init_db():
                 db.add_all(default_lines)
                 print("Created default lines: 20A, 20B, 30A, 30B, 40A")
             
+            # Lịch ca mặc định: mọi line có đủ các ca mỗi ngày
+            if db.query(ShiftRule).count() == 0:
+                db.add_all([ShiftRule(ca=ca, weekdays='1111111', is_active=True) for ca in DEFAULT_SHIFTS])
+                print("Created default shift rules")
+            
             db.commit()
         
         return True
     except Exception as e:
         print(f"Error initializing database: {e}")
         return False
+
+if __name__ == '__main__':
+    # Lệnh tạo schema + dữ liệu mặc định khi deploy (dùng kèm FAST_START=1):
+    #   python database.py init
+    if len(sys.argv) > 1 and sys.argv[1] == 'init':
+        sys.exit(0 if init_db() else 1)
+    print("Usage: python database.py init")
+    sys.exit(2)
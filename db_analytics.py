@@ -0,0 +1,242 @@
+from database import get_db, Handover, Receive, is_postgresql
+from db_operations import get_line_id, get_line_names
+from sqlalchemy import and_, case, extract, func
+from datetime import datetime, date, timedelta
+
+# ===== ANALYTICS OPERATIONS =====
+# Các truy vấn thống kê được tổng hợp hoàn toàn trong SQL (GROUP BY),
+# chỉ trả về số dòng bằng số kỳ x số line thay vì toàn bộ bàn giao.
+# Nhóm và lọc theo line_id; tên line tra từ danh mục line lúc trả kết quả.
+
+# Cột trạng thái tương ứng với từng hạng mục kiểm tra
+CATEGORY_STATUS_COLUMNS = {
+    '5S': Handover.status_5s,
+    'An Toàn': Handover.status_an_toan,
+    'Chất Lượng': Handover.status_chat_luong,
+    'Thiết Bị': Handover.status_thiet_bi,
+    'Kế Hoạch': Handover.status_ke_hoach,
+    'Khác': Handover.status_khac,
+}
+
+# Các mức gom nhóm thời gian được hỗ trợ
+TREND_BUCKETS = ('day', 'week', 'month')
+
+
+def _bucket_expression(bucket, column):
+    """
+    Biểu thức SQL cắt cột thời gian về đầu kỳ
+    - PostgreSQL: date_trunc('day' | 'week' | 'month', ...)
+    - SQLite: date()/strftime() tương đương (tuần bắt đầu từ thứ Hai như date_trunc)
+    """
+    if bucket not in TREND_BUCKETS:
+        raise ValueError(f"bucket không hợp lệ: {bucket}")
+
+    if is_postgresql:
+        return func.date_trunc(bucket, column)
+
+    if bucket == 'day':
+        return func.date(column)
+    if bucket == 'week':
+        # 'weekday 0' nhảy tới Chủ Nhật (hoặc giữ nguyên nếu đã là CN), lùi 6 ngày về thứ Hai
+        return func.date(column, 'weekday 0', '-6 days')
+    return func.strftime('%Y-%m-01', column)
+
+
+def _to_date(value):
+    """Chuẩn hóa giá trị đầu kỳ (datetime của PostgreSQL / chuỗi của SQLite) về date"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _date_range_filter(from_date, to_date):
+    """
+    Điều kiện lọc theo khoảng ngày dạng so sánh trực tiếp trên cột
+    (thay vì func.date(...)) để database dùng được index ngay_bao_cao.
+    Bỏ qua các bàn giao đã xóa mềm.
+    """
+    start = datetime.strptime(from_date, '%Y-%m-%d')
+    end = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1)
+    return and_(Handover.ngay_bao_cao >= start, Handover.ngay_bao_cao < end, Handover.deleted_at.is_(None))
+
+
+def get_nok_trends(from_date, to_date, bucket='week', line_filter=None):
+    """
+    Thống kê số lượng NOK theo kỳ (ngày/tuần/tháng), theo line và theo hạng mục
+
+    Args:
+        from_date: Ngày bắt đầu (YYYY-MM-DD)
+        to_date: Ngày kết thúc (YYYY-MM-DD)
+        bucket: 'day', 'week' hoặc 'month'
+        line_filter: Lọc theo line (None = tất cả)
+
+    Returns:
+        List of dict, mỗi dict là một (kỳ, line) gồm số giao ca,
+        số NOK của từng hạng mục, tổng NOK và tỷ lệ NOK (%)
+    """
+    try:
+        with get_db() as db:
+            # Bước 1: gom theo (ngày, line)
+            # - Số giao ca và tổng NOK: quét thẳng covering index ix_handovers_trend_counts
+            # - NOK từng hạng mục: chỉ đọc bảng cho các dòng nok_count > 0
+            daily = db.query(
+                Handover.ngay_bao_cao.label('day'),
+                Handover.line_id.label('line_id'),
+                func.count().label('total'),
+                func.sum(Handover.nok_count).label('total_nok')
+            ).filter(
+                _date_range_filter(from_date, to_date)
+            )
+
+            nok_daily = db.query(
+                Handover.ngay_bao_cao.label('day'),
+                Handover.line_id.label('line_id'),
+                *[
+                    func.sum(case((column == 'NOK', 1), else_=0)).label(f'nok_{idx}')
+                    for idx, column in enumerate(CATEGORY_STATUS_COLUMNS.values())
+                ]
+            ).filter(
+                _date_range_filter(from_date, to_date), Handover.nok_count > 0
+            )
+
+            if line_filter:
+                line_id = get_line_id(line_filter)
+                daily = daily.filter(Handover.line_id == line_id)
+                nok_daily = nok_daily.filter(Handover.line_id == line_id)
+
+            daily = daily.group_by(Handover.ngay_bao_cao, Handover.line_id).subquery()
+            nok_daily = nok_daily.group_by(Handover.ngay_bao_cao, Handover.line_id).subquery()
+
+            # Bước 2: cắt ngày về đầu kỳ trên kết quả đã gom (tối đa số ngày x số line dòng)
+            bucket_expr = _bucket_expression(bucket, daily.c.day).label('bucket')
+
+            results = db.query(
+                bucket_expr,
+                daily.c.line_id,
+                func.sum(daily.c.total).label('total'),
+                func.sum(daily.c.total_nok).label('total_nok'),
+                *[func.sum(nok_daily.c[f'nok_{idx}']).label(f'nok_{idx}') for idx in range(len(CATEGORY_STATUS_COLUMNS))]
+            ).outerjoin(
+                nok_daily, and_(nok_daily.c.day == daily.c.day, nok_daily.c.line_id == daily.c.line_id)
+            ).group_by(
+                bucket_expr, daily.c.line_id
+            ).order_by(
+                bucket_expr, daily.c.line_id
+            ).all()
+
+            names = get_line_names()
+            trends = []
+            for row in results:
+                item = {
+                    'Kỳ': _to_date(row.bucket),
+                    'Line': names.get(row.line_id, ''),
+                    'Số Giao Ca': int(row.total),
+                }
+
+                for idx, category in enumerate(CATEGORY_STATUS_COLUMNS):
+                    item[f'{category} - NOK'] = int(getattr(row, f'nok_{idx}') or 0)
+
+                total_nok = int(row.total_nok or 0)
+                item['Tổng NOK'] = total_nok
+                total_items = int(row.total) * len(CATEGORY_STATUS_COLUMNS)
+                item['Tỷ Lệ NOK (%)'] = round(total_nok / total_items * 100, 2) if total_items > 0 else 0.0
+                trends.append(item)
+
+            return trends
+
+    except Exception as e:
+        print(f"Error getting NOK trends: {e}")
+        return []
+
+
+# Các phân vị thời gian chờ nhận ca được tính
+LATENCY_PERCENTILES = (50, 90, 95)
+
+
+def _latency_minutes_expression():
+    """Số phút từ lúc giao ca tới lúc nhận ca (thoi_gian_nhan_ca - thoi_gian_giao_ca)"""
+    if is_postgresql:
+        return extract('epoch', Receive.thoi_gian_nhan_ca - Handover.thoi_gian_giao_ca) / 60.0
+    return (func.julianday(Receive.thoi_gian_nhan_ca) - func.julianday(Handover.thoi_gian_giao_ca)) * 1440.0
+
+
+def get_receive_latency_stats(from_date, to_date, line_filter=None):
+    """
+    Thống kê thời gian chờ nhận ca theo (ngày, line, ca), tính hoàn toàn trong SQL
+
+    Phân vị dùng phương pháp nearest-rank bằng window function
+    (row_number/count OVER PARTITION), chạy được trên cả PostgreSQL và SQLite.
+
+    Args:
+        from_date: Ngày bắt đầu (YYYY-MM-DD)
+        to_date: Ngày kết thúc (YYYY-MM-DD)
+        line_filter: Lọc theo line (None = tất cả)
+
+    Returns:
+        List of dict gồm số lượt nhận, trung bình, P50/P90/P95 và tối đa (phút)
+    """
+    try:
+        with get_db() as db:
+            latency = _latency_minutes_expression()
+            partition = (Handover.ngay_bao_cao, Handover.line_id, Handover.ca)
+
+            ranked = db.query(
+                Handover.ngay_bao_cao.label('day'),
+                Handover.line_id.label('line_id'),
+                Handover.ca.label('ca'),
+                latency.label('latency'),
+                func.row_number().over(partition_by=partition, order_by=latency).label('rn'),
+                func.count().over(partition_by=partition).label('cnt')
+            ).join(
+                Receive, and_(Receive.handover_id == Handover.handover_id, Receive.deleted_at.is_(None))
+            ).filter(
+                _date_range_filter(from_date, to_date)
+            )
+
+            if line_filter:
+                ranked = ranked.filter(Handover.line_id == get_line_id(line_filter))
+
+            ranked = ranked.subquery()
+
+            # Giá trị nhỏ nhất trong các dòng có thứ hạng >= p% * n chính là phân vị nearest-rank
+            percentile_columns = [
+                func.min(case((ranked.c.rn >= ranked.c.cnt * (p / 100.0), ranked.c.latency))).label(f'p{p}')
+                for p in LATENCY_PERCENTILES
+            ]
+
+            results = db.query(
+                ranked.c.day,
+                ranked.c.line_id,
+                ranked.c.ca,
+                func.count().label('total'),
+                func.avg(ranked.c.latency).label('avg'),
+                *percentile_columns,
+                func.max(ranked.c.latency).label('max')
+            ).group_by(
+                ranked.c.day, ranked.c.line_id, ranked.c.ca
+            ).order_by(
+                ranked.c.day, ranked.c.line_id, ranked.c.ca
+            ).all()
+
+            names = get_line_names()
+            stats = []
+            for row in results:
+                item = {
+                    'Ngày': _to_date(row.day),
+                    'Line': names.get(row.line_id, ''),
+                    'Ca': row.ca,
+                    'Số Lượt Nhận': int(row.total),
+                    'Trung Bình (phút)': round(float(row.avg), 1),
+                }
+                for p in LATENCY_PERCENTILES:
+                    item[f'P{p} (phút)'] = round(float(getattr(row, f'p{p}')), 1)
+                item['Tối Đa (phút)'] = round(float(row.max), 1)
+                stats.append(item)
+
+            return stats
+
+    except Exception as e:
+        print(f"Error getting receive latency stats: {e}")
+        return []
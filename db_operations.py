@@ -1,9 +1,228 @@
-from database import get_db, Handover, Receive, User, Line
-from sqlalchemy import and_, func, or_
-from datetime import datetime
+from database import get_db, get_connection, Handover, Receive, User, Line, ShiftRule, Employee, DEFAULT_SHIFTS
+from auth import hash_password, verify_password, login_rate_limiter, login_rate_limit_keys
+from audit import record_audit
+from discrepancy import mark_summary_day_dirty
+from shared_state import get_shared_state, cached, invalidate
+from sqlalchemy import and_, bindparam, case, exists, func, literal, literal_column, or_, select, true, union_all, DateTime, Integer
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta
+import csv
+import io
+import os
+import threading
 import time
 import random
 
+# ===== SHARED CACHE =====
+# Danh sách line và snapshot dashboard được cache trong shared state (shared_state.py)
+# để nhiều worker không cùng truy vấn lại một dữ liệu.
+
+# Thời gian cache danh mục line (giây) - xóa ngay khi lưu cấu hình lines
+LINES_CACHE_TTL_SECONDS = int(os.getenv('LINES_CACHE_TTL_SECONDS', '300'))
+
+# Thời gian cache snapshot dashboard (giây)
+DASHBOARD_CACHE_TTL_SECONDS = int(os.getenv('DASHBOARD_CACHE_TTL_SECONDS', '15'))
+
+# Dashboard làm mới theo thay đổi: khoảng lùi lại trước mốc updated_at (giây)
+DASHBOARD_DELTA_OVERLAP_SECONDS = int(os.getenv('DASHBOARD_DELTA_OVERLAP_SECONDS', '5'))
+
+_LINE_CATALOG_KEY = 'lines:catalog'
+_EMPLOYEES_VERSION_KEY = 'employees:version'
+_DASHBOARD_VERSION_KEY = 'dashboard:version'
+
+
+def _notify_handovers_changed():
+    """
+    Tăng version dữ liệu giao/nhận ca: snapshot dashboard cũ (khóa theo version)
+    không còn được đọc nữa; backend xóa chúng ở lần dọn key hết hạn kế tiếp
+    (SHARED_STATE_SWEEP_INTERVAL_SECONDS, Redis tự xóa theo TTL)
+    """
+    try:
+        get_shared_state().incr(_DASHBOARD_VERSION_KEY)
+    except Exception as e:
+        print(f"Error bumping dashboard version: {e}")
+
+
+# ===== PREPARED STATEMENTS =====
+# Các truy vấn đọc nóng (luồng nhận ca, admin sửa/xóa) được dựng sẵn MỘT LẦN ở cấp
+# module bằng Core select() + bindparam. SQLAlchemy cache bản compile theo cache key
+# nên mỗi lần gọi chỉ còn bind tham số, và kết quả là Row nhẹ thay vì ORM entity.
+
+_handovers = Handover.__table__
+_receives = Receive.__table__
+
+# Chỉ lấy dòng chưa bị xóa mềm (khớp điều kiện của các partial index)
+_HANDOVER_LIVE = _handovers.c.deleted_at.is_(None)
+_RECEIVE_LIVE = _receives.c.deleted_at.is_(None)
+_RECEIVE_JOIN = and_(_receives.c.handover_id == _handovers.c.handover_id, _RECEIVE_LIVE)
+
+# Bàn giao chưa nhận mới nhất của một line trong một ngày
+# (lọc ngày bằng khoảng [day_start, day_end) để dùng được index ngay_bao_cao)
+_SELECT_LATEST_PENDING_HANDOVER = select(_handovers).where(
+    _handovers.c.line_id == bindparam('line_id'),
+    _handovers.c.ngay_bao_cao >= bindparam('day_start'),
+    _handovers.c.ngay_bao_cao < bindparam('day_end'),
+    _handovers.c.trang_thai_nhan == 'Chưa nhận',
+    _HANDOVER_LIVE
+).order_by(_handovers.c.thoi_gian_giao_ca.desc()).limit(1)
+
+# Trạng thái nhận + thông tin người nhận trong 1 câu lệnh (LEFT JOIN)
+_SELECT_HANDOVER_RECEIVE_STATUS = select(
+    _handovers.c.trang_thai_nhan,
+    _receives.c.ma_nv_nhan_ca,
+    _receives.c.ten_nv_nhan_ca,
+    _receives.c.thoi_gian_nhan_ca
+).select_from(
+    _handovers.outerjoin(_receives, _RECEIVE_JOIN)
+).where(
+    _handovers.c.handover_id == bindparam('handover_id'),
+    _HANDOVER_LIVE
+).limit(1)
+
+# Màn hình nhận ca: bàn giao chưa nhận mới nhất (nếu có), nếu không thì bàn giao
+# mới nhất của line/ngày, kèm thông tin phiếu nhận - 1 câu lệnh JOIN, 1 round trip
+_SELECT_RECEIVE_SCREEN = select(
+    _handovers,
+    _receives.c.ma_nv_nhan_ca,
+    _receives.c.ten_nv_nhan_ca,
+    _receives.c.thoi_gian_nhan_ca
+).select_from(
+    _handovers.outerjoin(_receives, _RECEIVE_JOIN)
+).where(
+    _handovers.c.line_id == bindparam('line_id'),
+    _handovers.c.ngay_bao_cao >= bindparam('day_start'),
+    _handovers.c.ngay_bao_cao < bindparam('day_end'),
+    _HANDOVER_LIVE
+).order_by(
+    case((_handovers.c.trang_thai_nhan == 'Chưa nhận', 0), else_=1),
+    _handovers.c.thoi_gian_giao_ca.desc()
+).limit(1)
+
+# Tất cả bàn giao chưa nhận trong ngày (chế độ nhận nhiều ca)
+_SELECT_PENDING_HANDOVERS = select(_handovers).where(
+    _handovers.c.ngay_bao_cao >= bindparam('day_start'),
+    _handovers.c.ngay_bao_cao < bindparam('day_end'),
+    _handovers.c.trang_thai_nhan == 'Chưa nhận',
+    _HANDOVER_LIVE
+).order_by(_handovers.c.line_id, _handovers.c.thoi_gian_giao_ca.desc())
+
+_SELECT_PENDING_HANDOVERS_BY_LINES = _SELECT_PENDING_HANDOVERS.where(
+    _handovers.c.line_id.in_(bindparam('line_ids', expanding=True))
+)
+
+# Bàn giao chờ nhận có NOK (KHẨN CẤP). Hằng số viết thẳng vào SQL (không bind) để
+# planner chứng minh được điều kiện của partial index ix_handovers_urgent_pending_line_id
+_URGENT_PENDING = and_(
+    _handovers.c.trang_thai_nhan == literal_column("'Chưa nhận'"),
+    _handovers.c.nok_count > literal_column('0'),
+    _HANDOVER_LIVE
+)
+
+_SELECT_URGENT_PENDING_HANDOVERS = select(_handovers).where(
+    _handovers.c.ngay_bao_cao >= bindparam('day_start'),
+    _handovers.c.ngay_bao_cao < bindparam('day_end'),
+    _URGENT_PENDING
+).order_by(_handovers.c.line_id, _handovers.c.thoi_gian_giao_ca.desc())
+
+_SELECT_URGENT_PENDING_HANDOVERS_BY_LINES = _SELECT_URGENT_PENDING_HANDOVERS.where(
+    _handovers.c.line_id.in_(bindparam('line_ids', expanding=True))
+)
+
+# Tra cứu bàn giao đã tạo theo khóa idempotency (unique index request_key)
+_SELECT_HANDOVER_ID_BY_REQUEST_KEY = select(_handovers.c.handover_id).where(
+    _handovers.c.request_key == bindparam('request_key')
+)
+
+_SELECT_HANDOVER_BY_ID = select(_handovers).where(
+    _handovers.c.handover_id == bindparam('handover_id'),
+    _HANDOVER_LIVE
+)
+
+# Dashboard: bàn giao trong ngày kèm phiếu nhận, thứ tự ổn định cho phân trang keyset
+_SELECT_DASHBOARD = select(
+    _handovers,
+    _receives.c.ma_nv_nhan_ca,
+    _receives.c.ten_nv_nhan_ca,
+    _receives.c.thoi_gian_nhan_ca
+).select_from(
+    _handovers.outerjoin(_receives, _RECEIVE_JOIN)
+).where(
+    _handovers.c.ngay_bao_cao >= bindparam('day_start'),
+    _handovers.c.ngay_bao_cao < bindparam('day_end'),
+    _HANDOVER_LIVE
+).order_by(_handovers.c.thoi_gian_giao_ca.desc(), _handovers.c.handover_id.desc())
+
+# Bàn giao thay đổi sau một mốc (kể cả đã xóa mềm) kèm phiếu nhận, dùng index updated_at
+_SELECT_DASHBOARD_CHANGES = select(
+    _handovers,
+    _receives.c.ma_nv_nhan_ca,
+    _receives.c.ten_nv_nhan_ca,
+    _receives.c.thoi_gian_nhan_ca
+).select_from(
+    _handovers.outerjoin(_receives, _RECEIVE_JOIN)
+).where(
+    _handovers.c.updated_at > bindparam('since')
+)
+
+_SELECT_RECEIVE_BY_HANDOVER_ID = select(_receives).where(
+    _receives.c.handover_id == bindparam('handover_id'),
+    _RECEIVE_LIVE
+).limit(1)
+
+
+def _day_range(work_date):
+    """Trả về (day_start, day_end) của một ngày (date hoặc chuỗi YYYY-MM-DD)"""
+    if isinstance(work_date, str):
+        day_start = datetime.strptime(work_date, '%Y-%m-%d')
+    else:
+        day_start = datetime(work_date.year, work_date.month, work_date.day)
+    return day_start, day_start + timedelta(days=1)
+
+
+def _row_values(row, table):
+    """Giá trị các cột của một dòng (Row hoặc ORM entity) dạng dict, dùng cho audit"""
+    return {column.name: getattr(row, column.name) for column in table.columns}
+
+
+def _status_counts(statuses):
+    """Số hạng mục OK/NOK/NA của một bàn giao (lưu vào ok_count/nok_count/na_count khi ghi)"""
+    return {
+        'ok_count': sum(1 for s in statuses if s == 'OK'),
+        'nok_count': sum(1 for s in statuses if s == 'NOK'),
+        'na_count': sum(1 for s in statuses if s == 'NA')
+    }
+
+
+def _line_name(row, names):
+    """Tên hiện tại của line của một dòng (tên lúc ghi nếu line_id không có trong danh mục)"""
+    return names.get(row.line_id, row.line)
+
+
+def _handover_row_to_receive_dict(handover, names):
+    """Chuyển dòng handover thành dict hiển thị trên màn hình nhận ca"""
+    return {
+        'ID Giao Ca': handover.handover_id,
+        'Mã NV Giao Ca': handover.ma_nv_giao_ca,
+        'Tên NV Giao Ca': handover.ten_nv_giao_ca,
+        'Line': _line_name(handover, names),
+        'Ca': handover.ca,
+        'Nhân viên thuộc ca': handover.nhan_vien_thuoc_ca,
+        'Ngày Báo Cáo': handover.ngay_bao_cao.date(),
+        'Thời Gian Giao Ca': handover.thoi_gian_giao_ca,
+        '5S - Tình Trạng': handover.status_5s,
+        '5S - Comments': handover.comment_5s or '',
+        'An Toàn - Tình Trạng': handover.status_an_toan,
+        'An Toàn - Comments': handover.comment_an_toan or '',
+        'Chất Lượng - Tình Trạng': handover.status_chat_luong,
+        'Chất Lượng - Comments': handover.comment_chat_luong or '',
+        'Thiết Bị - Tình Trạng': handover.status_thiet_bi,
+        'Thiết Bị - Comments': handover.comment_thiet_bi or '',
+        'Kế Hoạch - Tình Trạng': handover.status_ke_hoach,
+        'Kế Hoạch - Comments': handover.comment_ke_hoach or '',
+        'Khác - Tình Trạng': handover.status_khac,
+        'Khác - Comments': handover.comment_khac or ''
+    }
+
 # ===== HANDOVER OPERATIONS =====
 
 def generate_handover_id():
@@ -46,13 +265,27 @@ def generate_handover_id():
         return f"HO-{today}-{timestamp}-{random_num}"
 
 
-def save_handover_safe(data, max_retries=10):
+def find_handover_by_request_key(request_key):
+    """
+    Tìm handover_id đã được tạo với khóa idempotency
+    Returns: handover_id hoặc None
+    """
+    with get_connection() as conn:
+        return conn.execute(_SELECT_HANDOVER_ID_BY_REQUEST_KEY, {'request_key': request_key}).scalar()
+
+
+def save_handover_safe(data, max_retries=10, request_key=None, submitted_at=None):
     """
     Lưu handover với retry mechanism để xử lý concurrent access
     
     Args:
         data: dict chứa thông tin handover (KHÔNG bao gồm handover_id)
         max_retries: số lần thử lại tối đa
+        request_key: khóa idempotency của form (None = không chống gửi trùng).
+            Gửi lại cùng khóa (double-click, retry sau lỗi commit không rõ kết quả)
+            trả về handover_id đã tạo thay vì tạo bàn giao mới
+        submitted_at: thời điểm người dùng gửi form (None = bây giờ); bản ghi phát lại
+            từ hàng đợi ghi tạm giữ thời điểm gửi gốc
     
     Returns: 
         (success: bool, result: str)
@@ -62,6 +295,15 @@ def save_handover_safe(data, max_retries=10):
     retry_delay = 0.05  # 50ms
     
     for attempt in range(max_retries):
+        if request_key:
+            try:
+                existing_id = find_handover_by_request_key(request_key)
+                if existing_id:
+                    print(f"Request key {request_key} already saved as {existing_id}")
+                    return True, existing_id
+            except Exception as e:
+                print(f"Error checking request key: {e}")
+        
         try:
             with get_db() as db:
                 # Tạo ID MỚI cho mỗi lần thử
@@ -84,11 +326,13 @@ def save_handover_safe(data, max_retries=10):
                     ma_nv_giao_ca=data['ma_nv'],
                     ten_nv_giao_ca=data['ten_nv'],
                     line=data['line'],
+                    line_id=_line_id_for_write(data['line']),
                     ca=data['ca'],
                     nhan_vien_thuoc_ca=data['chu_ky'],
                     ngay_bao_cao=datetime.strptime(data['ngay'], '%Y-%m-%d'),
-                    thoi_gian_giao_ca=datetime.now(),
+                    thoi_gian_giao_ca=submitted_at or datetime.now(),
                     trang_thai_nhan='Chưa nhận',
+                    request_key=request_key,
                     status_5s=data.get('5S - Tình Trạng'),
                     comment_5s=data.get('5S - Comments'),
                     status_an_toan=data.get('An Toàn - Tình Trạng'),
@@ -100,14 +344,22 @@ def save_handover_safe(data, max_retries=10):
                     status_ke_hoach=data.get('Kế Hoạch - Tình Trạng'),
                     comment_ke_hoach=data.get('Kế Hoạch - Comments'),
                     status_khac=data.get('Khác - Tình Trạng'),
-                    comment_khac=data.get('Khác - Comments')
+                    comment_khac=data.get('Khác - Comments'),
+                    **_status_counts([
+                        data.get('5S - Tình Trạng'), data.get('An Toàn - Tình Trạng'),
+                        data.get('Chất Lượng - Tình Trạng'), data.get('Thiết Bị - Tình Trạng'),
+                        data.get('Kế Hoạch - Tình Trạng'), data.get('Khác - Tình Trạng')
+                    ])
                 )
                 
                 db.add(handover)
                 db.flush()  # Get ID trước khi commit
                 
                 print(f"✅ Successfully saved handover with ID: {handover_id}")
-                return True, handover.handover_id
+                saved_id = handover.handover_id
+            
+            _notify_handovers_changed()
+            return True, saved_id
                 
         except Exception as e:
             error_str = str(e).lower()
@@ -120,6 +372,12 @@ def save_handover_safe(data, max_retries=10):
                     continue
                 else:
                     return False, "ID đã tồn tại sau nhiều lần thử. Vui lòng thử lại sau vài giây."
+            elif request_key and attempt == 0:
+                # Lỗi khác (ví dụ mất kết nối lúc commit, không rõ đã lưu hay chưa):
+                # có request_key nên thử lại an toàn - lần thử sau sẽ tìm thấy bản ghi nếu đã lưu
+                print(f"Attempt {attempt + 1}: Error saving handover ({e}), retrying with request key...")
+                time.sleep(retry_delay)
+                continue
             else:
                 # Lỗi khác (không phải duplicate)
                 print(f"Error saving handover: {e}")
@@ -137,41 +395,18 @@ def get_latest_handover(line, work_date):
     Returns: dict hoặc None
     """
     try:
-        with get_db() as db:
-            handover = db.query(Handover).filter(
-                and_(
-                    Handover.line == line,
-                    func.date(Handover.ngay_bao_cao) == work_date,
-                    Handover.trang_thai_nhan == 'Chưa nhận'
-                )
-            ).order_by(Handover.thoi_gian_giao_ca.desc()).first()
+        day_start, day_end = _day_range(work_date)
+        with get_connection() as conn:
+            handover = conn.execute(_SELECT_LATEST_PENDING_HANDOVER, {
+                'line_id': get_line_id(line),
+                'day_start': day_start,
+                'day_end': day_end
+            }).first()
             
             if not handover:
                 return None
             
-            # Convert to dict
-            return {
-                'ID Giao Ca': handover.handover_id,
-                'Mã NV Giao Ca': handover.ma_nv_giao_ca,
-                'Tên NV Giao Ca': handover.ten_nv_giao_ca,
-                'Line': handover.line,
-                'Ca': handover.ca,
-                'Nhân viên thuộc ca': handover.nhan_vien_thuoc_ca,
-                'Ngày Báo Cáo': handover.ngay_bao_cao.date(),
-                'Thời Gian Giao Ca': handover.thoi_gian_giao_ca,
-                '5S - Tình Trạng': handover.status_5s,
-                '5S - Comments': handover.comment_5s or '',
-                'An Toàn - Tình Trạng': handover.status_an_toan,
-                'An Toàn - Comments': handover.comment_an_toan or '',
-                'Chất Lượng - Tình Trạng': handover.status_chat_luong,
-                'Chất Lượng - Comments': handover.comment_chat_luong or '',
-                'Thiết Bị - Tình Trạng': handover.status_thiet_bi,
-                'Thiết Bị - Comments': handover.comment_thiet_bi or '',
-                'Kế Hoạch - Tình Trạng': handover.status_ke_hoach,
-                'Kế Hoạch - Comments': handover.comment_ke_hoach or '',
-                'Khác - Tình Trạng': handover.status_khac,
-                'Khác - Comments': handover.comment_khac or ''
-            }
+            return _handover_row_to_receive_dict(handover, get_line_names())
     except Exception as e:
         print(f"Error getting latest handover: {e}")
         return None
@@ -183,26 +418,19 @@ def check_handover_received(handover_id):
     Returns: (is_received: bool, receive_info: dict/None)
     """
     try:
-        with get_db() as db:
-            handover = db.query(Handover).filter(
-                Handover.handover_id == handover_id
-            ).first()
+        with get_connection() as conn:
+            row = conn.execute(_SELECT_HANDOVER_RECEIVE_STATUS, {'handover_id': handover_id}).first()
             
-            if not handover:
+            if not row:
                 return False, None
             
-            if handover.trang_thai_nhan == 'Đã nhận':
-                # Lấy thông tin người nhận
-                receive = db.query(Receive).filter(
-                    Receive.handover_id == handover_id
-                ).first()
-                
-                if receive:
-                    return True, {
-                        'ma_nv': receive.ma_nv_nhan_ca,
-                        'ten_nv': receive.ten_nv_nhan_ca,
-                        'thoi_gian': receive.thoi_gian_nhan_ca
-                    }
+            # Đã nhận và có thông tin người nhận
+            if row.trang_thai_nhan == 'Đã nhận' and row.ma_nv_nhan_ca is not None:
+                return True, {
+                    'ma_nv': row.ma_nv_nhan_ca,
+                    'ten_nv': row.ten_nv_nhan_ca,
+                    'thoi_gian': row.thoi_gian_nhan_ca
+                }
             
             return False, None
     except Exception as e:
@@ -210,62 +438,126 @@ def check_handover_received(handover_id):
         return False, None
 
 
+def get_receive_screen_data(line, work_date):
+    """
+    Lấy dữ liệu cho màn hình nhận ca trong MỘT truy vấn (thay cho
+    get_latest_handover + check_handover_received)
+    
+    Ưu tiên bàn giao chưa nhận mới nhất; nếu line/ngày không còn bàn giao
+    chưa nhận thì trả về bàn giao mới nhất kèm thông tin người đã nhận.
+    
+    Args:
+        line: Tên line
+        work_date: datetime.date object
+    Returns:
+        dict {'handover': dict, 'is_received': bool, 'receive_info': dict/None}
+        hoặc None nếu không có bàn giao nào
+    """
+    try:
+        day_start, day_end = _day_range(work_date)
+        with get_connection() as conn:
+            row = conn.execute(_SELECT_RECEIVE_SCREEN, {
+                'line_id': get_line_id(line),
+                'day_start': day_start,
+                'day_end': day_end
+            }).first()
+            
+            if not row:
+                return None
+            
+            is_received = row.trang_thai_nhan == 'Đã nhận' and row.ma_nv_nhan_ca is not None
+            
+            return {
+                'handover': _handover_row_to_receive_dict(row, get_line_names()),
+                'is_received': is_received,
+                'receive_info': {
+                    'ma_nv': row.ma_nv_nhan_ca,
+                    'ten_nv': row.ten_nv_nhan_ca,
+                    'thoi_gian': row.thoi_gian_nhan_ca
+                } if is_received else None
+            }
+    except Exception as e:
+        print(f"Error getting receive screen data: {e}")
+        return None
+
+
 # ===== RECEIVE OPERATIONS =====
 
-def save_receive_safe(data, handover_id):
+def _build_receive_values(data, handover_id, submitted_at=None):
+    """Chuyển dữ liệu form nhận ca thành giá trị các cột của bảng receives (submitted_at: thời điểm gửi form, None = bây giờ)"""
+    return {
+        'ma_nv_nhan_ca': data['ma_nv'],
+        'ten_nv_nhan_ca': data['ten_nv'],
+        'line': data['line'],
+        'line_id': _line_id_for_write(data['line']),
+        'ca': data['ca'],
+        'nhan_vien_thuoc_ca': data['chu_ky'],
+        'ngay_nhan_ca': datetime.strptime(data['ngay'], '%Y-%m-%d'),
+        'thoi_gian_nhan_ca': submitted_at or datetime.now(),
+        'handover_id': handover_id,
+        'xac_nhan_5s': data.get('5S - Xác Nhận'),
+        'comment_5s': data.get('5S - Comments Nhận'),
+        'xac_nhan_an_toan': data.get('An Toàn - Xác Nhận'),
+        'comment_an_toan': data.get('An Toàn - Comments Nhận'),
+        'xac_nhan_chat_luong': data.get('Chất Lượng - Xác Nhận'),
+        'comment_chat_luong': data.get('Chất Lượng - Comments Nhận'),
+        'xac_nhan_thiet_bi': data.get('Thiết Bị - Xác Nhận'),
+        'comment_thiet_bi': data.get('Thiết Bị - Comments Nhận'),
+        'xac_nhan_ke_hoach': data.get('Kế Hoạch - Xác Nhận'),
+        'comment_ke_hoach': data.get('Kế Hoạch - Comments Nhận'),
+        'xac_nhan_khac': data.get('Khác - Xác Nhận'),
+        'comment_khac': data.get('Khác - Comments Nhận')
+    }
+
+
+def save_receive_safe(data, handover_id, submitted_at=None):
     """
-    Lưu receive với pessimistic locking để tránh double-receive
+    Lưu receive, chống double-receive bằng UPDATE có điều kiện (claim) trong cùng
+    transaction với lệnh INSERT phiếu nhận; unique index uq_receives_live_handover_id
+    là chốt chặn cuối ở tầng database
+    
+    Args:
+        data: dict dữ liệu form nhận ca
+        handover_id: ID bàn giao được nhận
+        submitted_at: thời điểm người nhận gửi form (None = bây giờ)
+    
     Returns: (success: bool, message: str)
     """
     max_retries = 3
     
     for attempt in range(max_retries):
         try:
-            with get_db() as db:
-                # LOCK handover row để tránh concurrent receive
-                handover = db.query(Handover).filter(
-                    Handover.handover_id == handover_id
-                ).with_for_update().first()
-                
-                if not handover:
-                    return False, "Không tìm thấy bàn giao"
-                
-                # Kiểm tra trạng thái (với lock)
-                if handover.trang_thai_nhan == 'Đã nhận':
-                    return False, "Bàn giao đã được nhận bởi người khác"
-                
-                # Tạo receive record
-                receive = Receive(
-                    ma_nv_nhan_ca=data['ma_nv'],
-                    ten_nv_nhan_ca=data['ten_nv'],
-                    line=data['line'],
-                    ca=data['ca'],
-                    nhan_vien_thuoc_ca=data['chu_ky'],
-                    ngay_nhan_ca=datetime.strptime(data['ngay'], '%Y-%m-%d'),
-                    thoi_gian_nhan_ca=datetime.now(),
-                    handover_id=handover_id,
-                    xac_nhan_5s=data.get('5S - Xác Nhận'),
-                    comment_5s=data.get('5S - Comments Nhận'),
-                    xac_nhan_an_toan=data.get('An Toàn - Xác Nhận'),
-                    comment_an_toan=data.get('An Toàn - Comments Nhận'),
-                    xac_nhan_chat_luong=data.get('Chất Lượng - Xác Nhận'),
-                    comment_chat_luong=data.get('Chất Lượng - Comments Nhận'),
-                    xac_nhan_thiet_bi=data.get('Thiết Bị - Xác Nhận'),
-                    comment_thiet_bi=data.get('Thiết Bị - Comments Nhận'),
-                    xac_nhan_ke_hoach=data.get('Kế Hoạch - Xác Nhận'),
-                    comment_ke_hoach=data.get('Kế Hoạch - Comments Nhận'),
-                    xac_nhan_khac=data.get('Khác - Xác Nhận'),
-                    comment_khac=data.get('Khác - Comments Nhận')
-                )
-                
-                # Update handover status
-                handover.trang_thai_nhan = 'Đã nhận'
-                
-                db.add(receive)
-                db.flush()
-                
-                return True, "Success"
-                
+            with get_connection() as conn:
+                with conn.begin():
+                    # Chỉ bàn giao còn 'Chưa nhận' mới được chuyển sang 'Đã nhận'
+                    claimed = conn.execute(
+                        _handovers.update().where(
+                            and_(
+                                _handovers.c.handover_id == handover_id,
+                                _handovers.c.trang_thai_nhan == 'Chưa nhận',
+                                _HANDOVER_LIVE
+                            )
+                        ).values(trang_thai_nhan='Đã nhận', version=_handovers.c.version + 1)
+                    ).rowcount
+                    
+                    if not claimed:
+                        exists_live = conn.execute(
+                            select(_handovers.c.handover_id).where(
+                                and_(_handovers.c.handover_id == handover_id, _HANDOVER_LIVE)
+                            )
+                        ).first()
+                        if not exists_live:
+                            return False, "Không tìm thấy bàn giao"
+                        return False, "Bàn giao đã được nhận bởi người khác"
+                    
+                    conn.execute(_receives.insert().values(**_build_receive_values(data, handover_id, submitted_at)))
+            
+            _notify_handovers_changed()
+            return True, "Success"
+        
+        except IntegrityError:
+            # Đã có phiếu nhận còn hiệu lực (unique index) - không thử lại
+            return False, "Bàn giao đã được nhận bởi người khác"
         except Exception as e:
             if attempt < max_retries - 1:
                 time.sleep(0.1 * (attempt + 1))
@@ -276,83 +568,393 @@ def save_receive_safe(data, handover_id):
     return False, "Max retries exceeded"
 
 
-# ===== DASHBOARD OPERATIONS =====
-
-def get_dashboard_data(filter_date, filter_line=None):
+def get_pending_handovers(work_date, lines=None, urgent_only=False):
     """
-    Lấy dữ liệu dashboard với filter
-    Returns: list of dict
+    Lấy tất cả bàn giao chưa nhận của một ngày (dùng cho chế độ nhận nhiều ca)
+    Args:
+        work_date: datetime.date object
+        lines: list tên line (None = tất cả)
+        urgent_only: chỉ lấy bàn giao có NOK (lọc bằng nok_count trong SQL)
+    Returns: list of dict (cùng định dạng với get_latest_handover)
     """
     try:
-        with get_db() as db:
-            query = db.query(Handover).filter(
-                func.date(Handover.ngay_bao_cao) == filter_date
-            )
-            
-            if filter_line and filter_line != "Tất cả":
-                query = query.filter(Handover.line == filter_line)
-            
-            handovers = query.order_by(Handover.thoi_gian_giao_ca.desc()).all()
+        day_start, day_end = _day_range(work_date)
+        params = {'day_start': day_start, 'day_end': day_end}
+        stmt = _SELECT_URGENT_PENDING_HANDOVERS if urgent_only else _SELECT_PENDING_HANDOVERS
+        if lines:
+            stmt = _SELECT_URGENT_PENDING_HANDOVERS_BY_LINES if urgent_only else _SELECT_PENDING_HANDOVERS_BY_LINES
+            params['line_ids'] = get_line_ids(lines)
+        
+        names = get_line_names()
+        with get_connection() as conn:
+            return [_handover_row_to_receive_dict(row, names) for row in conn.execute(stmt, params)]
+    except Exception as e:
+        print(f"Error getting pending handovers: {e}")
+        return []
+
+
+def save_receives_batch(items, max_retries=3):
+    """
+    Nhận nhiều bàn giao trong MỘT transaction
+    
+    - Claim tất cả bàn giao bằng 1 câu UPDATE có điều kiện
+      (chỉ những bàn giao còn 'Chưa nhận' mới được chuyển sang 'Đã nhận')
+    - Ghi tất cả phiếu nhận bằng 1 lệnh executemany
+    
+    Args:
+        items: list of dict {'handover_id': str, 'data': dict dữ liệu nhận ca
+               (cùng định dạng với save_receive_safe)}
+        max_retries: số lần thử lại khi lỗi database
+    
+    Returns:
+        (success: bool, results: dict {handover_id: (success: bool, message: str)})
+        - success = True nếu transaction thành công (có thể một số bàn giao bị từ chối)
+    """
+    # Bỏ trùng, giữ thứ tự
+    items_by_id = {}
+    for item in items:
+        items_by_id.setdefault(item['handover_id'], item['data'])
+    
+    if not items_by_id:
+        return True, {}
+    
+    handover_ids = list(items_by_id.keys())
+    
+    for attempt in range(max_retries):
+        try:
+            with get_connection() as conn:
+                with conn.begin():
+                    claim = _handovers.update().where(
+                        and_(
+                            _handovers.c.handover_id.in_(handover_ids),
+                            _handovers.c.trang_thai_nhan == 'Chưa nhận',
+                            _HANDOVER_LIVE
+                        )
+                    ).values(trang_thai_nhan='Đã nhận', version=_handovers.c.version + 1)
+                    
+                    if conn.dialect.update_returning:
+                        claimed = set(conn.execute(claim.returning(_handovers.c.handover_id)).scalars())
+                    else:
+                        # Database không hỗ trợ RETURNING: khóa các dòng chưa nhận trước khi update
+                        claimed = set(conn.execute(
+                            select(_handovers.c.handover_id).where(
+                                and_(
+                                    _handovers.c.handover_id.in_(handover_ids),
+                                    _handovers.c.trang_thai_nhan == 'Chưa nhận',
+                                    _HANDOVER_LIVE
+                                )
+                            ).with_for_update()
+                        ).scalars())
+                        conn.execute(claim)
+                    
+                    if claimed:
+                        conn.execute(_receives.insert(), [
+                            _build_receive_values(items_by_id[handover_id], handover_id)
+                            for handover_id in handover_ids if handover_id in claimed
+                        ])
+                    
+                    # Phân biệt "không tồn tại" và "đã được nhận" cho các bàn giao bị từ chối
+                    rejected = [handover_id for handover_id in handover_ids if handover_id not in claimed]
+                    existing = set()
+                    if rejected:
+                        existing = set(conn.execute(
+                            select(_handovers.c.handover_id).where(
+                                and_(_handovers.c.handover_id.in_(rejected), _HANDOVER_LIVE)
+                            )
+                        ).scalars())
             
-            if not handovers:
-                return None
+            results = {}
+            for handover_id in handover_ids:
+                if handover_id in claimed:
+                    results[handover_id] = (True, "Success")
+                elif handover_id in existing:
+                    results[handover_id] = (False, "Bàn giao đã được nhận bởi người khác")
+                else:
+                    results[handover_id] = (False, "Không tìm thấy bàn giao")
             
-            dashboard_data = []
-            for h in handovers:
-                # Lấy thông tin receive nếu đã nhận
-                receive_info = None
-                if h.trang_thai_nhan == 'Đã nhận':
-                    receive = db.query(Receive).filter(
-                        Receive.handover_id == h.handover_id
-                    ).first()
-                    if receive:
-                        receive_info = {
-                            'time': receive.thoi_gian_nhan_ca,
-                            'by': f"{receive.ma_nv_nhan_ca} - {receive.ten_nv_nhan_ca}"
-                        }
-                
-                # Đếm OK/NOK/NA
-                statuses = [h.status_5s, h.status_an_toan, h.status_chat_luong, 
-                           h.status_thiet_bi, h.status_ke_hoach, h.status_khac]
-                ok_count = sum(1 for s in statuses if s == 'OK')
-                nok_count = sum(1 for s in statuses if s == 'NOK')
-                na_count = sum(1 for s in statuses if s == 'NA')
-                
-                dashboard_data.append({
-                    'ID Giao Ca': h.handover_id,
-                    'Line': h.line,
-                    'Ca': h.ca,
-                    'Nhân viên thuộc ca': h.nhan_vien_thuoc_ca,
-                    'Mã NV Giao': h.ma_nv_giao_ca,
-                    'Tên NV Giao': h.ten_nv_giao_ca,
-                    'Thời Gian Giao': h.thoi_gian_giao_ca,
-                    'OK': ok_count,
-                    'NOK': nok_count,
-                    'NA': na_count,
-                    'Trạng Thái Nhận': h.trang_thai_nhan,
-                    'Thời Gian Nhận': receive_info['time'] if receive_info else None,
-                    'Người Nhận': receive_info['by'] if receive_info else None
-                })
+            if claimed:
+                _notify_handovers_changed()
+            print(f"✅ Batch receive: {len(claimed)}/{len(handover_ids)} handovers received")
+            return True, results
             
-            return dashboard_data
+        except Exception as e:
+            if attempt < max_retries - 1:
+                time.sleep(0.1 * (attempt + 1))
+                continue
+            print(f"Error saving batch receive: {e}")
+            return False, {handover_id: (False, str(e)) for handover_id in handover_ids}
+    
+    return False, {handover_id: (False, "Max retries exceeded") for handover_id in handover_ids}
+
+
+# ===== DASHBOARD OPERATIONS =====
+
+def get_dashboard_data(filter_date, filter_line=None, limit=None, cursor=None):
+    """
+    Lấy dữ liệu dashboard với filter (snapshot dùng chung giữa các worker trong
+    DASHBOARD_CACHE_TTL_SECONDS, làm mới ngay khi có giao/nhận ca mới)
+    
+    Phân trang phía server theo keyset (thời gian giao giảm dần, ID giao ca):
+    mỗi trang chỉ đọc `limit` dòng kể từ vị trí `cursor`, không phụ thuộc số
+    bàn giao trong ngày.
+    
+    Args:
+        filter_date: Ngày xem (YYYY-MM-DD)
+        filter_line: Line (None/"Tất cả" = tất cả)
+        limit: Số dòng mỗi trang (None = cả ngày)
+        cursor: Vị trí bắt đầu trang, lấy bằng dashboard_cursor(dòng cuối trang trước)
+    
+    Returns: list of dict (None nếu không có dữ liệu)
+    """
+    try:
+        version = get_shared_state().count(_DASHBOARD_VERSION_KEY)
+    except Exception as e:
+        print(f"Error reading dashboard version: {e}")
+        return _load_dashboard_data(filter_date, filter_line, limit, cursor)
+    
+    return cached(
+        f"dashboard:{version}:{filter_date}:{filter_line or 'Tất cả'}:{limit or 'all'}:{cursor or ''}",
+        lambda: _load_dashboard_data(filter_date, filter_line, limit, cursor),
+        DASHBOARD_CACHE_TTL_SECONDS
+    )
+
+
+def get_dashboard_summary(filter_date, filter_line=None):
+    """
+    Số liệu tổng của dashboard tính bằng 1 câu aggregate trong SQL
+    (không tải từng bàn giao, dùng kèm get_dashboard_data có phân trang)
+    
+    Returns: dict {'total', 'received', 'pending', 'with_nok'} hoặc None nếu lỗi
+    """
+    try:
+        version = get_shared_state().count(_DASHBOARD_VERSION_KEY)
+    except Exception as e:
+        print(f"Error reading dashboard version: {e}")
+        return _load_dashboard_summary(filter_date, filter_line)
+    
+    return cached(
+        f"dashboard_summary:{version}:{filter_date}:{filter_line or 'Tất cả'}",
+        lambda: _load_dashboard_summary(filter_date, filter_line),
+        DASHBOARD_CACHE_TTL_SECONDS
+    )
+
+
+def _load_dashboard_summary(filter_date, filter_line=None):
+    """Truy vấn số liệu tổng của dashboard từ database"""
+    try:
+        day_start, day_end = _day_range(filter_date)
+        query = select(
+            func.count(),
+            func.sum(case((_handovers.c.trang_thai_nhan == 'Đã nhận', 1), else_=0)),
+            func.sum(case((_handovers.c.nok_count > 0, 1), else_=0))
+        ).where(
+            _handovers.c.ngay_bao_cao >= day_start,
+            _handovers.c.ngay_bao_cao < day_end,
+            _HANDOVER_LIVE
+        )
+        if filter_line and filter_line != "Tất cả":
+            query = query.where(_handovers.c.line_id == get_line_id(filter_line))
+        
+        with get_connection() as conn:
+            total, received, with_nok = conn.execute(query).one()
+        
+        received = int(received or 0)
+        return {
+            'total': total,
+            'received': received,
+            'pending': total - received,
+            'with_nok': int(with_nok or 0)
+        }
+    except Exception as e:
+        print(f"Error getting dashboard summary: {e}")
+        return None
+
+
+def dashboard_cursor(item):
+    """Cursor của trang tiếp theo, tính từ dòng cuối cùng của trang hiện tại"""
+    return f"{item['Thời Gian Giao'].isoformat()}|{item['ID Giao Ca']}"
+
+
+def _load_dashboard_data(filter_date, filter_line=None, limit=None, cursor=None):
+    """Truy vấn dữ liệu dashboard từ database (1 câu lệnh JOIN phiếu nhận)"""
+    try:
+        day_start, day_end = _day_range(filter_date)
+        query = _SELECT_DASHBOARD
+        params = {'day_start': day_start, 'day_end': day_end}
+        
+        if filter_line and filter_line != "Tất cả":
+            query = query.where(_handovers.c.line_id == bindparam('line_id'))
+            params['line_id'] = get_line_id(filter_line)
+        
+        if cursor:
+            # Keyset: các dòng đứng sau (thời gian giao, ID) của dòng cuối trang trước
+            cursor_time, cursor_id = cursor.split('|', 1)
+            query = query.where(or_(
+                _handovers.c.thoi_gian_giao_ca < bindparam('cursor_time'),
+                and_(
+                    _handovers.c.thoi_gian_giao_ca == bindparam('cursor_time'),
+                    _handovers.c.handover_id < bindparam('cursor_id')
+                )
+            ))
+            params['cursor_time'] = datetime.fromisoformat(cursor_time)
+            params['cursor_id'] = cursor_id
+        
+        if limit:
+            query = query.limit(limit)
+        
+        with get_connection() as conn:
+            rows = conn.execute(query, params).all()
+        
+        if not rows:
+            return None
+        
+        names = get_line_names()
+        return [
+            _dashboard_item(
+                row,
+                names,
+                row.thoi_gian_nhan_ca,
+                f"{row.ma_nv_nhan_ca} - {row.ten_nv_nhan_ca}" if row.thoi_gian_nhan_ca is not None else None
+            )
+            for row in rows
+        ]
     except Exception as e:
         print(f"Error getting dashboard data: {e}")
         return None
 
 
+def _dashboard_item(h, names, receive_time=None, receive_by=None):
+    """Một dòng dashboard từ bàn giao (ORM entity hoặc Row) và thông tin người nhận"""
+    return {
+        'ID Giao Ca': h.handover_id,
+        'Line': _line_name(h, names),
+        'Ca': h.ca,
+        'Nhân viên thuộc ca': h.nhan_vien_thuoc_ca,
+        'Mã NV Giao': h.ma_nv_giao_ca,
+        'Tên NV Giao': h.ten_nv_giao_ca,
+        'Thời Gian Giao': h.thoi_gian_giao_ca,
+        'OK': h.ok_count,
+        'NOK': h.nok_count,
+        'NA': h.na_count,
+        'Trạng Thái Nhận': h.trang_thai_nhan,
+        'Thời Gian Nhận': receive_time,
+        'Người Nhận': receive_by
+    }
+
+
+def get_dashboard_changes(filter_date, filter_line=None, since=None):
+    """
+    Chỉ lấy các bàn giao thay đổi sau mốc `since` (high-water mark theo updated_at),
+    chi phí tỉ lệ với số thay đổi thay vì tổng số bàn giao trong ngày
+    
+    Bàn giao bị xóa, hoặc được sửa sang ngày/line khác bộ lọc, nằm trong `removed`
+    để client bỏ khỏi snapshot. Truy vấn lùi lại DASHBOARD_DELTA_OVERLAP_SECONDS
+    trước mốc (giao dịch commit muộn, lệch giờ giữa các worker); gộp lại một dòng
+    đã có trong snapshot không làm sai kết quả.
+    
+    Args:
+        filter_date: Ngày xem (YYYY-MM-DD)
+        filter_line: Line (None/"Tất cả" = tất cả)
+        since: Mốc trả về từ lần gọi trước (datetime)
+    
+    Returns: dict {'items': list of dict (cùng định dạng get_dashboard_data),
+                   'removed': list handover_id, 'watermark': datetime}
+                   hoặc None nếu lỗi (client nên tải lại toàn bộ)
+    """
+    try:
+        day_start, day_end = _day_range(filter_date)
+        with get_connection() as conn:
+            rows = conn.execute(_SELECT_DASHBOARD_CHANGES, {
+                'since': since - timedelta(seconds=DASHBOARD_DELTA_OVERLAP_SECONDS)
+            }).all()
+        
+        names = get_line_names()
+        filter_line_id = get_line_id(filter_line) if filter_line and filter_line != "Tất cả" else None
+        items, removed = [], []
+        watermark = since
+        for row in rows:
+            watermark = max(watermark, row.updated_at)
+            matches = (
+                row.deleted_at is None
+                and day_start <= row.ngay_bao_cao < day_end
+                and (not filter_line or filter_line == "Tất cả" or row.line_id == filter_line_id)
+            )
+            if not matches:
+                removed.append(row.handover_id)
+                continue
+            
+            received = row.thoi_gian_nhan_ca is not None
+            items.append(_dashboard_item(
+                row,
+                names,
+                row.thoi_gian_nhan_ca,
+                f"{row.ma_nv_nhan_ca} - {row.ten_nv_nhan_ca}" if received else None
+            ))
+        
+        return {'items': items, 'removed': removed, 'watermark': watermark}
+    except Exception as e:
+        print(f"Error getting dashboard changes: {e}")
+        return None
+
+
+def merge_dashboard_changes(snapshot, changes):
+    """
+    Gộp kết quả get_dashboard_changes vào snapshot dashboard của client
+    
+    Args:
+        snapshot: list of dict (kết quả get_dashboard_data hoặc lần gộp trước)
+        changes: dict từ get_dashboard_changes
+    
+    Returns: list of dict mới, sắp xếp như get_dashboard_data (giao ca mới nhất trước)
+    """
+    by_id = {item['ID Giao Ca']: item for item in snapshot or []}
+    for handover_id in changes['removed']:
+        by_id.pop(handover_id, None)
+    for item in changes['items']:
+        by_id[item['ID Giao Ca']] = item
+    
+    return sorted(
+        by_id.values(),
+        key=lambda item: (item['Thời Gian Giao'] or datetime.min, item['ID Giao Ca']),
+        reverse=True
+    )
+
+
 # ===== USER OPERATIONS =====
 
-def check_login(username, password):
-    """Kiểm tra đăng nhập"""
+def check_login(username, password, client_key=None):
+    """
+    Kiểm tra đăng nhập bằng mật khẩu đã hash (so sánh thời gian hằng)
+    
+    Username hoặc client đang bị khóa tạm do sai nhiều lần bị từ chối trước khi truy vấn DB.
+    Mật khẩu dạng text cũ (chưa migrate) được hash lại sau khi đăng nhập đúng.
+    
+    Args:
+        username: Tên đăng nhập
+        password: Mật khẩu
+        client_key: Key của client (IP / key của phiên), xem auth.login_rate_limit_keys
+    
+    Returns: (success, full_name)
+    """
+    keys = login_rate_limit_keys(username, client_key)
+    if login_rate_limiter.retry_after(*keys) > 0:
+        return False, None
+    
     try:
         with get_db() as db:
-            user = db.query(User).filter(
-                and_(User.username == username, User.password == password)
-            ).first()
+            user = db.query(User).filter(User.username == username).first()
+            matched, needs_rehash = verify_password(password, user.password if user else None)
             
-            if user:
-                return True, user.full_name
-            return False, None
+            if not matched:
+                login_rate_limiter.record_failure(*keys)
+                return False, None
+            
+            if needs_rehash:
+                user.password = hash_password(password)
+            # Chỉ xóa bộ đếm của tài khoản: client đang dò nhiều tài khoản
+            # không tự mở khóa được bằng cách đăng nhập đúng một tài khoản của mình
+            login_rate_limiter.reset(keys[0])
+            return True, user.full_name
     except Exception as e:
         print(f"Error checking login: {e}")
         return False, None
@@ -360,22 +962,88 @@ def check_login(username, password):
 
 # ===== LINE OPERATIONS =====
 
-def get_active_lines():
-    """Lấy danh sách lines đang active"""
+def get_line_catalog():
+    """
+    Danh mục line (cache dùng chung giữa các worker), gồm cả line ngừng hoạt động
+    để lịch sử vẫn tra được tên theo line_id
+    
+    Returns: list of dict {'id', 'line_code', 'line_name', 'is_active'} (None nếu lỗi)
+    """
+    return cached(_LINE_CATALOG_KEY, _load_line_catalog, LINES_CACHE_TTL_SECONDS)
+
+
+def _load_line_catalog():
+    """Truy vấn danh mục line (None khi lỗi để không cache kết quả rỗng)"""
     try:
-        with get_db() as db:
-            lines = db.query(Line).filter(Line.is_active == True).all()
-            return [line.line_name for line in lines]
+        with get_connection() as conn:
+            rows = conn.execute(select(Line.__table__).order_by(Line.__table__.c.id)).all()
+        return [{
+            'id': row.id,
+            'line_code': row.line_code,
+            'line_name': row.line_name,
+            'is_active': bool(row.is_active)
+        } for row in rows]
     except Exception as e:
-        print(f"Error getting active lines: {e}")
+        print(f"Error getting line catalog: {e}")
+        return None
+
+
+def get_line_id(line_name):
+    """line_id theo tên line trong danh mục (None nếu line không có trong danh mục)"""
+    for line in get_line_catalog() or []:
+        if line['line_name'] == line_name:
+            return line['id']
+    return None
+
+
+def get_line_names():
+    """{line_id: tên line hiện tại} từ danh mục line đã cache, đọc một lần cho mỗi kết quả"""
+    return {line['id']: line['line_name'] for line in get_line_catalog() or []}
+
+
+def get_line_ids(line_names):
+    """Danh sách line_id của các tên line (bỏ qua tên không có trong danh mục)"""
+    wanted = set(line_names)
+    return [line['id'] for line in get_line_catalog() or [] if line['line_name'] in wanted]
+
+
+def _line_id_for_write(line_name):
+    """
+    line_id ghi kèm bàn giao/phiếu nhận: tra danh mục đã cache, không có thì tra thẳng
+    database; tên chưa có trong danh mục được thêm vào ở trạng thái ngừng hoạt động
+    (như migration 0010) để mọi dòng đều lọc/nhóm được theo line_id
+    """
+    line_id = get_line_id(line_name)
+    if line_id is not None:
+        return line_id
+    
+    with get_db() as db:
+        line = db.query(Line).filter(Line.line_name == line_name).order_by(Line.id).first()
+        if line is None:
+            code = line_name[:50]
+            if db.query(Line.id).filter(Line.line_code == code).first():
+                code = f"{line_name[:40]}-{random.randint(100000, 999999)}"
+            line = Line(line_code=code, line_name=line_name, is_active=False)
+            db.add(line)
+            db.flush()
+        line_id = line.id
+    invalidate(_LINE_CATALOG_KEY)
+    return line_id
+
+
+def get_active_lines():
+    """Lấy danh sách lines đang active (từ danh mục line đã cache)"""
+    catalog = get_line_catalog()
+    if catalog is None:
         return ['Line 1', 'Line 2', 'Line 3', 'Line 4', 'Line 5']
+    return [line['line_name'] for line in catalog if line['is_active']]
 
 
 def get_all_lines():
     """Lấy tất cả lines để quản lý"""
     try:
         with get_db() as db:
-            lines = db.query(Line).all()
+            lines = db.query(Line).order_by(Line.id).all()
             return [{
                 'line_code': line.line_code,
                 'line_name': line.line_name,
@@ -386,88 +1054,591 @@ def get_all_lines():
         return []
 
 
-def save_lines_config(lines_data):
+def save_lines_config(lines_data, actor=None):
     """
-    Lưu cấu hình lines
+    Lưu cấu hình lines bằng cách so sánh với danh mục hiện có (theo line_code):
+    - line mới: thêm; line có sẵn: cập nhật tại chỗ, giữ nguyên id
+    - đổi tên: chỉ sửa dòng trong bảng lines; lịch sử tham chiếu theo line_id nên hiển thị
+      tên mới ngay mà không phải ghi lại bàn giao/phiếu nhận nào
+    - line bị bỏ khỏi bảng: xóa nếu chưa có dữ liệu, ngược lại chỉ ngừng hoạt động
+    
     Args:
         lines_data: list of dict với keys: line_code, line_name, is_active
+        actor: người thực hiện (ghi vào audit log)
     """
     try:
+        submitted = {}
+        for line_data in lines_data:
+            is_active = line_data.get('is_active', True)
+            submitted[line_data['line_code']] = {
+                'line_name': line_data['line_name'],
+                # Ô checkbox trống của dòng mới trong data_editor (None/NaN) = đang hoạt động
+                'is_active': bool(is_active) if is_active is not None and is_active == is_active else True
+            }
+        
+        renamed = []
         with get_db() as db:
-            # Xóa tất cả lines cũ
-            db.query(Line).delete()
-            
-            # Thêm lines mới
-            for line_data in lines_data:
-                line = Line(
-                    line_code=line_data['line_code'],
-                    line_name=line_data['line_name'],
-                    is_active=line_data.get('is_active', True)
-                )
-                db.add(line)
+            existing = {line.line_code: line for line in db.query(Line).all()}
+            before = {
+                code: {'line_name': line.line_name, 'is_active': line.is_active}
+                for code, line in existing.items()
+            }
+            
+            for code, values in submitted.items():
+                line = existing.get(code)
+                if line is None:
+                    db.add(Line(line_code=code, line_name=values['line_name'], is_active=values['is_active']))
+                    continue
+                if line.line_name != values['line_name']:
+                    renamed.append(code)
+                    line.line_name = values['line_name']
+                line.is_active = values['is_active']
+            
+            for code, line in existing.items():
+                if code in submitted:
+                    continue
+                in_use = db.query(Handover.id).filter(Handover.line_id == line.id).first() or \
+                    db.query(Receive.id).filter(Receive.line_id == line.id).first()
+                if in_use:
+                    # Giữ lại để lịch sử vẫn tham chiếu được
+                    line.is_active = False
+                else:
+                    db.query(ShiftRule).filter(ShiftRule.line_id == line.id).delete(synchronize_session=False)
+                    db.delete(line)
             
-            return True
+            db.flush()
+            after = {
+                line.line_code: {'line_name': line.line_name, 'is_active': line.is_active}
+                for line in db.query(Line).all()
+            }
+            record_audit('lines', 'config', 'update', before, after, actor, conn=db)
+        
+        invalidate(_LINE_CATALOG_KEY)
+        if renamed:
+            # Snapshot dashboard đã cache chứa tên line cũ
+            _notify_handovers_changed()
+        return True
     except Exception as e:
         print(f"Error saving lines config: {e}")
         return False
 
 
+# ===== SHIFT SCHEDULE OPERATIONS =====
+# Lịch ca dự kiến (line × ca × ngày) được sinh từ các quy tắc trong shift_rules rồi
+# anti-join với handovers ngay trong SQL để tìm các ca chưa nộp bàn giao.
+
+# Khoảng ngày tối đa của một truy vấn ca thiếu (mỗi ngày là một dòng tham số của bảng lịch)
+MISSING_HANDOVER_MAX_DAYS = int(os.getenv('MISSING_HANDOVER_MAX_DAYS', '93'))
+
+_lines = Line.__table__
+_shift_rules = ShiftRule.__table__
+
+
+def _calendar_subquery(day_start, day_count):
+    """
+    Bảng lịch tạm, mỗi ngày một dòng (day_start, day_end, weekday: 1 = Thứ 2 .. 7 = Chủ nhật),
+    dựng bằng UNION ALL các tham số nên chạy giống nhau trên PostgreSQL và SQLite
+    """
+    days = []
+    for offset in range(day_count):
+        day = day_start + timedelta(days=offset)
+        days.append(select(
+            literal(day, DateTime).label('day_start'),
+            literal(day + timedelta(days=1), DateTime).label('day_end'),
+            literal(day.isoweekday(), Integer).label('weekday')
+        ))
+    stmt = days[0] if len(days) == 1 else union_all(*days)
+    return stmt.subquery('calendar')
+
+
+def get_missing_handovers(from_date, to_date, lines=None):
+    """
+    Các ca có trong lịch ca dự kiến nhưng chưa có bàn giao (chỉ tính tới hôm nay)
+    Lịch line × ca × ngày được anti-join (NOT EXISTS) với handovers trong MỘT câu SQL
+    
+    Args:
+        from_date, to_date: datetime.date hoặc chuỗi YYYY-MM-DD (bao gồm cả hai đầu)
+        lines: list tên line (None = tất cả line đang hoạt động)
+    Returns: list of dict {'ngay', 'line', 'ca'} sắp theo ngày, line, ca (None nếu lỗi)
+    """
+    try:
+        day_start, _ = _day_range(from_date)
+        _, day_end = _day_range(to_date)
+        # Ca của những ngày chưa tới thì chưa thể thiếu
+        day_end = min(day_end, _day_range(datetime.now())[1])
+        day_count = min((day_end - day_start).days, MISSING_HANDOVER_MAX_DAYS)
+        if day_count <= 0:
+            return []
+        
+        calendar = _calendar_subquery(day_start, day_count)
+        submitted = exists().where(
+            _handovers.c.line_id == _lines.c.id,
+            _handovers.c.ca == _shift_rules.c.ca,
+            _handovers.c.ngay_bao_cao >= calendar.c.day_start,
+            _handovers.c.ngay_bao_cao < calendar.c.day_end,
+            _HANDOVER_LIVE
+        )
+        stmt = select(
+            calendar.c.day_start, _lines.c.line_name, _shift_rules.c.ca
+        ).distinct().select_from(
+            calendar.join(_shift_rules, true()).join(
+                _lines, or_(_shift_rules.c.line_id.is_(None), _shift_rules.c.line_id == _lines.c.id)
+            )
+        ).where(
+            _lines.c.is_active.is_(True),
+            _shift_rules.c.is_active.is_(True),
+            func.substr(_shift_rules.c.weekdays, calendar.c.weekday, 1) == '1',
+            or_(_shift_rules.c.valid_from.is_(None), _shift_rules.c.valid_from < calendar.c.day_end),
+            or_(_shift_rules.c.valid_to.is_(None), _shift_rules.c.valid_to >= calendar.c.day_start),
+            ~submitted
+        ).order_by(calendar.c.day_start, _lines.c.line_name, _shift_rules.c.ca)
+        if lines:
+            stmt = stmt.where(_lines.c.line_name.in_(list(lines)))
+        
+        with get_connection() as conn:
+            return [{
+                'ngay': row.day_start.strftime('%Y-%m-%d'),
+                'line': row.line_name,
+                'ca': row.ca
+            } for row in conn.execute(stmt)]
+    except Exception as e:
+        print(f"Error getting missing handovers: {e}")
+        return None
+
+
+def get_shift_grid(work_date, lines=None):
+    """
+    Lưới line × ca của một ngày cho dashboard
+    
+    Args:
+        work_date: datetime.date hoặc chuỗi YYYY-MM-DD
+        lines: list tên line (None = tất cả line đang hoạt động)
+    Returns: dict {'shifts': [ca], 'rows': [{'line', 'cells': {ca: trạng thái}}]} (None nếu lỗi)
+        trạng thái: 'received' | 'pending' (còn bàn giao chưa nhận) | 'missing' | None (không có lịch)
+    """
+    try:
+        day_start, day_end = _day_range(work_date)
+        missing = get_missing_handovers(work_date, work_date, lines)
+        if missing is None:
+            return None
+        
+        with get_connection() as conn:
+            rule_shifts = [row.ca for row in conn.execute(
+                select(_shift_rules.c.ca).where(_shift_rules.c.is_active.is_(True)).distinct()
+            )]
+            submitted = conn.execute(select(
+                _handovers.c.line_id,
+                _handovers.c.ca,
+                func.sum(case((_handovers.c.trang_thai_nhan == 'Chưa nhận', 1), else_=0)).label('pending')
+            ).where(
+                _handovers.c.ngay_bao_cao >= day_start,
+                _handovers.c.ngay_bao_cao < day_end,
+                _HANDOVER_LIVE
+            ).group_by(_handovers.c.line_id, _handovers.c.ca)).all()
+        
+        # Ca mặc định đứng trước theo thứ tự khai báo, các ca khác theo tên
+        shifts = [ca for ca in DEFAULT_SHIFTS if ca in rule_shifts]
+        shifts += sorted({ca for ca in rule_shifts if ca not in DEFAULT_SHIFTS})
+        names = get_line_names()
+        cells = {(item['line'], item['ca']): 'missing' for item in missing}
+        for row in submitted:
+            cells[(names.get(row.line_id), row.ca)] = 'pending' if row.pending else 'received'
+            if row.ca and row.ca not in shifts:
+                shifts.append(row.ca)
+        
+        grid_lines = [line for line in get_active_lines() if not lines or line in lines]
+        return {
+            'shifts': shifts,
+            'rows': [{
+                'line': line,
+                'cells': {ca: cells.get((line, ca)) for ca in shifts}
+            } for line in grid_lines]
+        }
+    except Exception as e:
+        print(f"Error getting shift grid: {e}")
+        return None
+
+
+def get_shift_rules():
+    """Lấy các quy tắc lịch ca để quản lý (line rỗng = mọi line)"""
+    try:
+        names = {line['id']: line['line_name'] for line in get_line_catalog() or []}
+        with get_db() as db:
+            rules = db.query(ShiftRule).order_by(ShiftRule.id).all()
+            return [{
+                'line': names.get(rule.line_id, '') if rule.line_id else '',
+                'ca': rule.ca,
+                'weekdays': rule.weekdays,
+                'valid_from': rule.valid_from.date() if rule.valid_from else None,
+                'valid_to': rule.valid_to.date() if rule.valid_to else None,
+                'is_active': rule.is_active
+            } for rule in rules]
+    except Exception as e:
+        print(f"Error getting shift rules: {e}")
+        return []
+
+
+def _shift_rules_snapshot(rules):
+    """Lịch ca (cùng định dạng get_shift_rules) dạng dict phẳng để ghi audit: {'line|ca': 'weekdays từ..đến bật/tắt'}"""
+    snapshot = {}
+    for rule in rules:
+        key = f"{rule['line'] or '*'}|{rule['ca']}"
+        value = f"{rule['weekdays']} {rule['valid_from'] or ''}..{rule['valid_to'] or ''} " \
+            f"{'on' if rule['is_active'] else 'off'}"
+        snapshot[key] = f"{snapshot[key]}; {value}" if key in snapshot else value
+    return snapshot
+
+
+def save_shift_rules(rules_data, actor=None):
+    """
+    Lưu lịch ca (thay toàn bộ quy tắc trong một transaction)
+    
+    Args:
+        rules_data: list of dict với keys: line (rỗng = mọi line), ca, weekdays
+            (7 ký tự 0/1 từ Thứ 2 tới Chủ nhật), valid_from, valid_to, is_active
+        actor: người thực hiện (ghi vào audit log)
+    Returns: (success, message)
+    """
+    try:
+        before = _shift_rules_snapshot(get_shift_rules())
+        rules, after = [], []
+        for rule_data in rules_data:
+            line_name = (rule_data.get('line') or '').strip()
+            ca = (rule_data.get('ca') or '').strip()
+            weekdays = (rule_data.get('weekdays') or '1111111').strip()
+            if not ca:
+                return False, "Thiếu tên ca trong lịch ca"
+            if len(weekdays) != 7 or set(weekdays) - {'0', '1'}:
+                return False, f"Ngày trong tuần của {ca} phải gồm 7 ký tự 0/1 (Thứ 2 → Chủ nhật)"
+            line_id = None
+            if line_name:
+                line_id = get_line_id(line_name)
+                if line_id is None:
+                    return False, f"Line '{line_name}' không có trong danh mục"
+            valid_from, valid_to = rule_data.get('valid_from'), rule_data.get('valid_to')
+            is_active = rule_data.get('is_active', True)
+            rule = ShiftRule(
+                line_id=line_id,
+                ca=ca,
+                weekdays=weekdays,
+                valid_from=_day_range(valid_from)[0] if valid_from else None,
+                valid_to=_day_range(valid_to)[0] if valid_to else None,
+                # Ô checkbox trống của dòng mới trong data_editor (None/NaN) = đang áp dụng
+                is_active=bool(is_active) if is_active is not None and is_active == is_active else True
+            )
+            rules.append(rule)
+            after.append({
+                'line': line_name, 'ca': ca, 'weekdays': weekdays,
+                'valid_from': rule.valid_from.date() if rule.valid_from else None,
+                'valid_to': rule.valid_to.date() if rule.valid_to else None,
+                'is_active': rule.is_active
+            })
+        
+        with get_db() as db:
+            db.query(ShiftRule).delete(synchronize_session=False)
+            db.add_all(rules)
+            record_audit('shift_rules', 'config', 'update', before, _shift_rules_snapshot(after), actor, conn=db)
+        
+        return True, f"Đã lưu {len(rules)} quy tắc lịch ca"
+    except Exception as e:
+        print(f"Error saving shift rules: {e}")
+        return False, f"Lỗi: {str(e)}"
+
+
+# ===== EMPLOYEE OPERATIONS =====
+# Danh bạ nhân viên được giữ nguyên trong bộ nhớ của process ({ma_nv: ten_nv}) để kiểm tra
+# mã NV và tự điền tên mà không truy vấn DB mỗi lần gõ. Import/sửa danh bạ tăng version
+# trong shared state; mỗi worker thấy version đổi thì nạp lại danh bạ một lần.
+
+_employees = Employee.__table__
+_employee_directory = {'version': None, 'names': {}}
+_employee_directory_lock = threading.Lock()
+
+# Tên cột chấp nhận trong file CSV import (tên kỹ thuật hoặc tiêu đề tiếng Việt)
+_EMPLOYEE_CSV_COLUMNS = {
+    'ma_nv': ('ma_nv', 'mã nv', 'mã nhân viên'),
+    'ten_nv': ('ten_nv', 'tên nv', 'tên nhân viên', 'họ tên'),
+    'is_active': ('is_active', 'đang làm việc'),
+}
+
+
+def _load_employee_directory():
+    """Nạp {ma_nv: ten_nv} của nhân viên đang làm việc (None khi lỗi)"""
+    try:
+        with get_connection() as conn:
+            rows = conn.execute(
+                select(_employees.c.ma_nv, _employees.c.ten_nv).where(_employees.c.is_active.is_(True))
+            ).all()
+        return {row.ma_nv: row.ten_nv for row in rows}
+    except Exception as e:
+        print(f"Error loading employee directory: {e}")
+        return None
+
+
+def get_employee_directory():
+    """
+    Danh bạ nhân viên đang làm việc trong bộ nhớ process, chỉ nạp lại khi danh bạ thay đổi
+    
+    Returns: dict {ma_nv: ten_nv} (rỗng nếu chưa import danh bạ)
+    """
+    try:
+        version = get_shared_state().count(_EMPLOYEES_VERSION_KEY)
+    except Exception as e:
+        print(f"Error reading employee directory version: {e}")
+        version = _employee_directory['version'] if _employee_directory['version'] is not None else 0
+    
+    if version != _employee_directory['version']:
+        with _employee_directory_lock:
+            if version != _employee_directory['version']:
+                names = _load_employee_directory()
+                if names is not None:
+                    _employee_directory['names'] = names
+                    _employee_directory['version'] = version
+    return _employee_directory['names']
+
+
+def lookup_employee_name(ma_nv):
+    """Tên nhân viên theo mã NV từ danh bạ trong bộ nhớ (None nếu không có)"""
+    return get_employee_directory().get((ma_nv or '').strip())
+
+
+def is_known_employee(ma_nv):
+    """Mã NV có trong danh bạ không (chưa import danh bạ thì chấp nhận mọi mã)"""
+    directory = get_employee_directory()
+    return not directory or (ma_nv or '').strip() in directory
+
+
+def _notify_employees_changed():
+    """Tăng version danh bạ để mọi worker nạp lại danh bạ trong bộ nhớ"""
+    try:
+        get_shared_state().incr(_EMPLOYEES_VERSION_KEY)
+    except Exception as e:
+        print(f"Error bumping employee directory version: {e}")
+
+
+def import_employees_csv(file_data, actor=None):
+    """
+    Import danh bạ nhân viên từ CSV (upsert theo mã NV, theo lô)
+    
+    Args:
+        file_data: bytes hoặc str nội dung CSV, cột ma_nv, ten_nv và tùy chọn is_active
+            (chấp nhận tiêu đề "Mã NV", "Tên NV", "Đang làm việc")
+        actor: người thực hiện (ghi vào audit log)
+    Returns: (success, message)
+    """
+    try:
+        if isinstance(file_data, bytes):
+            file_data = file_data.decode('utf-8-sig')
+        reader = csv.DictReader(io.StringIO(file_data))
+        headers = {(name or '').strip().lower(): name for name in reader.fieldnames or []}
+        columns = {}
+        for field, aliases in _EMPLOYEE_CSV_COLUMNS.items():
+            columns[field] = next((headers[alias] for alias in aliases if alias in headers), None)
+        if not columns['ma_nv'] or not columns['ten_nv']:
+            return False, "File CSV phải có cột ma_nv và ten_nv"
+        
+        employees = {}
+        for line_no, row in enumerate(reader, start=2):
+            ma_nv = (row.get(columns['ma_nv']) or '').strip()
+            ten_nv = (row.get(columns['ten_nv']) or '').strip()
+            if not ma_nv and not ten_nv:
+                continue
+            if not (ma_nv.isdigit() and len(ma_nv) == 6):
+                return False, f"Dòng {line_no}: mã NV '{ma_nv}' phải có đúng 6 chữ số"
+            if not ten_nv:
+                return False, f"Dòng {line_no}: thiếu tên nhân viên {ma_nv}"
+            active = (row.get(columns['is_active']) or '').strip().lower() if columns['is_active'] else ''
+            employees[ma_nv] = {
+                'ma_nv': ma_nv,
+                'ten_nv': ten_nv,
+                'is_active': active not in ('0', 'false', 'no', 'không')
+            }
+        if not employees:
+            return False, "File CSV không có nhân viên nào"
+        
+        now = datetime.now()
+        with get_connection() as conn:
+            with conn.begin():
+                existing = {
+                    row.ma_nv: (row.ten_nv, bool(row.is_active))
+                    for row in conn.execute(select(_employees.c.ma_nv, _employees.c.ten_nv, _employees.c.is_active))
+                }
+                new_rows = [
+                    {**values, 'created_at': now, 'updated_at': now}
+                    for ma_nv, values in employees.items() if ma_nv not in existing
+                ]
+                changed_rows = [
+                    {'b_ma_nv': ma_nv, 'ten_nv': values['ten_nv'], 'is_active': values['is_active'], 'updated_at': now}
+                    for ma_nv, values in employees.items()
+                    if ma_nv in existing and existing[ma_nv] != (values['ten_nv'], values['is_active'])
+                ]
+                # executemany: mỗi loại thao tác chỉ 1 lệnh gửi theo lô
+                if new_rows:
+                    conn.execute(_employees.insert(), new_rows)
+                if changed_rows:
+                    conn.execute(
+                        _employees.update().where(_employees.c.ma_nv == bindparam('b_ma_nv')),
+                        changed_rows
+                    )
+                record_audit('employees', 'import', 'import', None,
+                             {'inserted': len(new_rows), 'updated': len(changed_rows)}, actor, conn=conn)
+        
+        if new_rows or changed_rows:
+            _notify_employees_changed()
+        return True, f"Đã import {len(employees)} nhân viên (thêm mới {len(new_rows)}, cập nhật {len(changed_rows)})"
+    except Exception as e:
+        print(f"Error importing employees: {e}")
+        return False, f"Lỗi: {str(e)}"
+
+
+def get_employee_history(ma_nv, limit=50):
+    """
+    Lịch sử giao ca và nhận ca của một nhân viên, mới nhất trước
+    (đọc qua index (ma_nv, thời gian) của handovers và receives)
+    
+    Args:
+        ma_nv: mã nhân viên
+        limit: số dòng tối đa
+    Returns: list of dict
+    """
+    try:
+        given = select(
+            literal('Giao ca').label('role'),
+            _handovers.c.handover_id,
+            _handovers.c.line,
+            _handovers.c.line_id,
+            _handovers.c.ca,
+            _handovers.c.ngay_bao_cao.label('ngay'),
+            _handovers.c.thoi_gian_giao_ca.label('thoi_gian'),
+            _handovers.c.trang_thai_nhan.label('trang_thai'),
+            _handovers.c.nok_count
+        ).where(_handovers.c.ma_nv_giao_ca == bindparam('ma_nv'), _HANDOVER_LIVE).order_by(
+            _handovers.c.thoi_gian_giao_ca.desc()
+        ).limit(bindparam('limit'))
+        received = select(
+            literal('Nhận ca').label('role'),
+            _receives.c.handover_id,
+            _receives.c.line,
+            _receives.c.line_id,
+            _receives.c.ca,
+            _receives.c.ngay_nhan_ca.label('ngay'),
+            _receives.c.thoi_gian_nhan_ca.label('thoi_gian'),
+            literal('Đã nhận').label('trang_thai'),
+            literal(None, Integer).label('nok_count')
+        ).where(_receives.c.ma_nv_nhan_ca == bindparam('ma_nv'), _RECEIVE_LIVE).order_by(
+            _receives.c.thoi_gian_nhan_ca.desc()
+        ).limit(bindparam('limit'))
+        # Mỗi nhánh tự lấy tối đa `limit` dòng mới nhất trên index của nó rồi mới trộn
+        history = union_all(given.subquery().select(), received.subquery().select()).subquery()
+        stmt = select(history).order_by(history.c.thoi_gian.desc()).limit(bindparam('limit'))
+        
+        with get_connection() as conn:
+            rows = conn.execute(stmt, {'ma_nv': (ma_nv or '').strip(), 'limit': limit}).all()
+        names = get_line_names()
+        return [{
+            'Vai Trò': row.role,
+            'ID Giao Ca': row.handover_id,
+            'Line': _line_name(row, names),
+            'Ca': row.ca,
+            'Ngày': row.ngay.strftime('%d/%m/%Y') if row.ngay else '',
+            'Thời Gian': row.thoi_gian.strftime('%d/%m/%Y %H:%M:%S') if row.thoi_gian else '',
+            'Trạng Thái': row.trang_thai,
+            'NOK': row.nok_count if row.nok_count is not None else ''
+        } for row in rows]
+    except Exception as e:
+        print(f"Error getting employee history: {e}")
+        return []
+
+
 # ===== DATA EXPORT OPERATIONS =====
 
+def _handover_export_dict(h, names):
+    """Chuyển dòng handover (ORM entity hoặc Row) thành dict các cột export"""
+    return {
+        'ID Giao Ca': h.handover_id,
+        'Mã NV Giao Ca': h.ma_nv_giao_ca,
+        'Tên NV Giao Ca': h.ten_nv_giao_ca,
+        'Line': _line_name(h, names),
+        'Ca': h.ca,
+        'Nhân viên thuộc ca': h.nhan_vien_thuoc_ca,
+        'Ngày Báo Cáo': h.ngay_bao_cao,
+        'Thời Gian Giao Ca': h.thoi_gian_giao_ca,
+        'Trạng Thái Nhận': h.trang_thai_nhan,
+        '5S - Tình Trạng': h.status_5s,
+        '5S - Comments': h.comment_5s,
+        'An Toàn - Tình Trạng': h.status_an_toan,
+        'An Toàn - Comments': h.comment_an_toan,
+        'Chất Lượng - Tình Trạng': h.status_chat_luong,
+        'Chất Lượng - Comments': h.comment_chat_luong,
+        'Thiết Bị - Tình Trạng': h.status_thiet_bi,
+        'Thiết Bị - Comments': h.comment_thiet_bi,
+        'Kế Hoạch - Tình Trạng': h.status_ke_hoach,
+        'Kế Hoạch - Comments': h.comment_ke_hoach,
+        'Khác - Tình Trạng': h.status_khac,
+        'Khác - Comments': h.comment_khac
+    }
+
+
 def get_handover_data_for_export():
     """Lấy tất cả dữ liệu giao ca để export"""
     try:
         with get_db() as db:
-            handovers = db.query(Handover).order_by(
+            handovers = db.query(Handover).filter(
+                Handover.deleted_at.is_(None)
+            ).order_by(
                 Handover.created_at.desc()
             ).all()
             
-            data = []
-            for h in handovers:
-                data.append({
-                    'ID Giao Ca': h.handover_id,
-                    'Mã NV Giao Ca': h.ma_nv_giao_ca,
-                    'Tên NV Giao Ca': h.ten_nv_giao_ca,
-                    'Line': h.line,
-                    'Ca': h.ca,
-                    'Nhân viên thuộc ca': h.nhan_vien_thuoc_ca,
-                    'Ngày Báo Cáo': h.ngay_bao_cao,
-                    'Thời Gian Giao Ca': h.thoi_gian_giao_ca,
-                    'Trạng Thái Nhận': h.trang_thai_nhan,
-                    '5S - Tình Trạng': h.status_5s,
-                    '5S - Comments': h.comment_5s,
-                    'An Toàn - Tình Trạng': h.status_an_toan,
-                    'An Toàn - Comments': h.comment_an_toan,
-                    'Chất Lượng - Tình Trạng': h.status_chat_luong,
-                    'Chất Lượng - Comments': h.comment_chat_luong,
-                    'Thiết Bị - Tình Trạng': h.status_thiet_bi,
-                    'Thiết Bị - Comments': h.comment_thiet_bi,
-                    'Kế Hoạch - Tình Trạng': h.status_ke_hoach,
-                    'Kế Hoạch - Comments': h.comment_ke_hoach,
-                    'Khác - Tình Trạng': h.status_khac,
-                    'Khác - Comments': h.comment_khac
-                })
-            
-            return data
+            names = get_line_names()
+            return [_handover_export_dict(h, names) for h in handovers]
     except Exception as e:
         print(f"Error getting handover data: {e}")
         return []
 
 
+def iter_handover_export_rows(from_date=None, to_date=None, batch_size=1000):
+    """
+    Đọc dữ liệu giao ca để export theo kiểu stream (server-side cursor, từng lô
+    batch_size dòng) - không nạp toàn bộ bảng vào bộ nhớ như get_handover_data_for_export
+    
+    Args:
+        from_date: Từ ngày (YYYY-MM-DD, None = không giới hạn)
+        to_date: Đến ngày (YYYY-MM-DD, None = không giới hạn)
+        batch_size: Số dòng mỗi lần fetch
+    
+    Yields: dict (cùng các cột với get_handover_data_for_export)
+    """
+    stmt = select(_handovers).where(_HANDOVER_LIVE)
+    if from_date:
+        stmt = stmt.where(_handovers.c.ngay_bao_cao >= _day_range(from_date)[0])
+    if to_date:
+        stmt = stmt.where(_handovers.c.ngay_bao_cao < _day_range(to_date)[1])
+    stmt = stmt.order_by(_handovers.c.ngay_bao_cao, _handovers.c.thoi_gian_giao_ca)
+    
+    names = get_line_names()
+    with get_connection() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(stmt)
+        for row in result:
+            yield _handover_export_dict(row, names)
+
+
 def get_receive_data_for_export():
     """Lấy tất cả dữ liệu nhận ca để export"""
     try:
         with get_db() as db:
-            receives = db.query(Receive).order_by(
+            receives = db.query(Receive).filter(
+                Receive.deleted_at.is_(None)
+            ).order_by(
                 Receive.created_at.desc()
             ).all()
             
+            names = get_line_names()
             data = []
             for r in receives:
                 data.append({
                     'Mã NV Nhận Ca': r.ma_nv_nhan_ca,
                     'Tên NV Nhận Ca': r.ten_nv_nhan_ca,
-                    'Line': r.line,
+                    'Line': _line_name(r, names),
                     'Ca': r.ca,
                     'Nhân viên thuộc ca': r.nhan_vien_thuoc_ca,
                     'Ngày Nhận Ca': r.ngay_nhan_ca,
@@ -497,13 +1668,16 @@ def get_latest_handovers_for_display(limit=10):
     """Lấy N bàn giao gần nhất để hiển thị"""
     try:
         with get_db() as db:
-            handovers = db.query(Handover).order_by(
+            handovers = db.query(Handover).filter(
+                Handover.deleted_at.is_(None)
+            ).order_by(
                 Handover.thoi_gian_giao_ca.desc()
             ).limit(limit).all()
             
+            names = get_line_names()
             return [{
                 'ID Giao Ca': h.handover_id,
-                'Line': h.line,
+                'Line': _line_name(h, names),
                 'Ca': h.ca,
                 'Nhân viên thuộc ca': h.nhan_vien_thuoc_ca,
                 'Mã NV Giao Ca': h.ma_nv_giao_ca,
@@ -549,32 +1723,31 @@ def get_combined_handover_receive_data(from_date, to_date, line_filter=None, sta
                 Handover.ngay_bao_cao,
                 Handover.thoi_gian_giao_ca,
                 Handover.line,
+                Handover.line_id,
                 Handover.ca,
                 Handover.nhan_vien_thuoc_ca,
                 Handover.ma_nv_giao_ca,
                 Handover.ten_nv_giao_ca,
                 Handover.trang_thai_nhan,
-                Handover.status_5s,
-                Handover.status_an_toan,
-                Handover.status_chat_luong,
-                Handover.status_thiet_bi,
-                Handover.status_ke_hoach,
-                Handover.status_khac,
+                Handover.ok_count,
+                Handover.nok_count,
+                Handover.na_count,
                 Receive.ma_nv_nhan_ca,
                 Receive.ten_nv_nhan_ca,
                 Receive.thoi_gian_nhan_ca
             ).outerjoin(
-                Receive, Handover.handover_id == Receive.handover_id
+                Receive, and_(Handover.handover_id == Receive.handover_id, Receive.deleted_at.is_(None))
             ).filter(
                 and_(
                     func.date(Handover.ngay_bao_cao) >= from_date,
-                    func.date(Handover.ngay_bao_cao) <= to_date
+                    func.date(Handover.ngay_bao_cao) <= to_date,
+                    Handover.deleted_at.is_(None)
                 )
             )
             
             # Áp dụng filter
             if line_filter:
-                query = query.filter(Handover.line == line_filter)
+                query = query.filter(Handover.line_id == get_line_id(line_filter))
             
             if status_filter:
                 query = query.filter(Handover.trang_thai_nhan == status_filter)
@@ -585,27 +1758,21 @@ def get_combined_handover_receive_data(from_date, to_date, line_filter=None, sta
             results = query.all()
             
             # Convert to list of dict
+            names = get_line_names()
             combined_data = []
             for row in results:
-                # Đếm OK/NOK/NA
-                statuses = [row.status_5s, row.status_an_toan, row.status_chat_luong,
-                           row.status_thiet_bi, row.status_ke_hoach, row.status_khac]
-                ok_count = sum(1 for s in statuses if s == 'OK')
-                nok_count = sum(1 for s in statuses if s == 'NOK')
-                na_count = sum(1 for s in statuses if s == 'NA')
-                
                 combined_data.append({
                     'ID Giao Ca': row.handover_id,
                     'Ngày Giao': row.ngay_bao_cao,
                     'Thời Gian Giao': row.thoi_gian_giao_ca,
-                    'Line': row.line,
+                    'Line': _line_name(row, names),
                     'Ca': row.ca,
                     'Nhóm': row.nhan_vien_thuoc_ca,
                     'Mã NV Giao': row.ma_nv_giao_ca,
                     'Tên NV Giao': row.ten_nv_giao_ca,
-                    'Số OK': ok_count,
-                    'Số NOK': nok_count,
-                    'Số NA': na_count,
+                    'Số OK': row.ok_count,
+                    'Số NOK': row.nok_count,
+                    'Số NA': row.na_count,
                     'Trạng Thái Nhận': row.trang_thai_nhan,
                     'Mã NV Nhận': row.ma_nv_nhan_ca if row.ma_nv_nhan_ca else '',
                     'Tên NV Nhận': row.ten_nv_nhan_ca if row.ten_nv_nhan_ca else '',
@@ -619,16 +1786,16 @@ def get_combined_handover_receive_data(from_date, to_date, line_filter=None, sta
         return []
 # ===== ADMIN OPERATIONS - EDIT/DELETE =====
 
+HANDOVER_CHANGED_MESSAGE = "Bàn giao đã được thay đổi bởi người khác, vui lòng tải lại"
+
 def get_handover_by_id(handover_id):
     """
     Lấy thông tin chi tiết handover theo ID
     Returns: dict hoặc None
     """
     try:
-        with get_db() as db:
-            handover = db.query(Handover).filter(
-                Handover.handover_id == handover_id
-            ).first()
+        with get_connection() as conn:
+            handover = conn.execute(_SELECT_HANDOVER_BY_ID, {'handover_id': handover_id}).first()
             
             if not handover:
                 return None
@@ -637,7 +1804,7 @@ def get_handover_by_id(handover_id):
                 'handover_id': handover.handover_id,
                 'ma_nv': handover.ma_nv_giao_ca,
                 'ten_nv': handover.ten_nv_giao_ca,
-                'line': handover.line,
+                'line': _line_name(handover, get_line_names()),
                 'ca': handover.ca,
                 'chu_ky': handover.nhan_vien_thuoc_ca,
                 'ngay': handover.ngay_bao_cao,
@@ -654,117 +1821,254 @@ def get_handover_by_id(handover_id):
                 'Kế Hoạch - Tình Trạng': handover.status_ke_hoach,
                 'Kế Hoạch - Comments': handover.comment_ke_hoach or '',
                 'Khác - Tình Trạng': handover.status_khac,
-                'Khác - Comments': handover.comment_khac or ''
+                'Khác - Comments': handover.comment_khac or '',
+                # Mốc phiên bản: truyền lại khi lưu / xóa để phát hiện bàn giao đã bị người khác thay đổi
+                'version': handover.version
             }
     except Exception as e:
         print(f"Error getting handover by ID: {e}")
         return None
 
 
-def update_handover(handover_id, data):
+# Trường của form sửa bàn giao -> cột trong bảng handovers
+_HANDOVER_EDIT_FIELDS = {
+    'ma_nv': 'ma_nv_giao_ca',
+    'ten_nv': 'ten_nv_giao_ca',
+    'line': 'line',
+    'ca': 'ca',
+    'chu_ky': 'nhan_vien_thuoc_ca',
+    'ngay': 'ngay_bao_cao',
+    '5S - Tình Trạng': 'status_5s',
+    '5S - Comments': 'comment_5s',
+    'An Toàn - Tình Trạng': 'status_an_toan',
+    'An Toàn - Comments': 'comment_an_toan',
+    'Chất Lượng - Tình Trạng': 'status_chat_luong',
+    'Chất Lượng - Comments': 'comment_chat_luong',
+    'Thiết Bị - Tình Trạng': 'status_thiet_bi',
+    'Thiết Bị - Comments': 'comment_thiet_bi',
+    'Kế Hoạch - Tình Trạng': 'status_ke_hoach',
+    'Kế Hoạch - Comments': 'comment_ke_hoach',
+    'Khác - Tình Trạng': 'status_khac',
+    'Khác - Comments': 'comment_khac'
+}
+
+_HANDOVER_STATUS_COLUMNS = ('status_5s', 'status_an_toan', 'status_chat_luong',
+                            'status_thiet_bi', 'status_ke_hoach', 'status_khac')
+
+
+def _handover_changes(current, data):
+    """Chỉ các cột có giá trị mới khác giá trị hiện tại (kèm line_id và các cột đếm nếu bị ảnh hưởng)"""
+    changes = {}
+    for key, column in _HANDOVER_EDIT_FIELDS.items():
+        if key not in data:
+            continue
+        if column == 'line':
+            # Form hiển thị tên hiện tại của line: so sánh theo line_id, không theo tên lúc ghi
+            line_id = _line_id_for_write(data[key])
+            if line_id != current.line_id:
+                changes.update(line=data[key], line_id=line_id)
+            continue
+        value = datetime.strptime(data[key], '%Y-%m-%d') if column == 'ngay_bao_cao' else data[key]
+        old = getattr(current, column)
+        if column.startswith('comment_'):
+            # Form hiển thị ghi chú NULL thành chuỗi rỗng: không coi là thay đổi
+            value, old = value or None, old or None
+        if value != old:
+            changes[column] = value
+    
+    if any(column in changes for column in _HANDOVER_STATUS_COLUMNS):
+        counts = _status_counts([changes.get(column, getattr(current, column)) for column in _HANDOVER_STATUS_COLUMNS])
+        changes.update({column: value for column, value in counts.items() if value != getattr(current, column)})
+    return changes
+
+
+def update_handover(handover_id, data, actor=None, expected_version=None):
     """
-    Cập nhật thông tin handover
+    Cập nhật thông tin handover bằng compare-and-swap trên cột version:
+    UPDATE ... WHERE handover_id = ? AND version = ? chỉ ghi các cột thay đổi,
+    không khóa dòng; 0 dòng được cập nhật = đã có người khác sửa trước
     
     Args:
         handover_id: ID của handover cần update
         data: dict chứa thông tin cần update
+        actor: người thực hiện (ghi vào audit log)
+        expected_version: version lúc đọc bản ghi (get_handover_by_id);
+                          None = dùng version hiện tại trong database
     
     Returns:
         (success: bool, message: str)
     """
     try:
-        with get_db() as db:
-            # Tìm handover
-            handover = db.query(Handover).filter(
-                Handover.handover_id == handover_id
-            ).first()
-            
-            if not handover:
-                return False, "Không tìm thấy bàn giao"
-            
-            # Kiểm tra xem đã được nhận chưa
-            if handover.trang_thai_nhan == 'Đã nhận':
-                return False, "Không thể sửa bàn giao đã được nhận. Vui lòng xóa phiếu nhận ca trước."
-            
-            # Update thông tin
-            handover.ma_nv_giao_ca = data.get('ma_nv', handover.ma_nv_giao_ca)
-            handover.ten_nv_giao_ca = data.get('ten_nv', handover.ten_nv_giao_ca)
-            handover.line = data.get('line', handover.line)
-            handover.ca = data.get('ca', handover.ca)
-            handover.nhan_vien_thuoc_ca = data.get('chu_ky', handover.nhan_vien_thuoc_ca)
-            
-            if 'ngay' in data:
-                handover.ngay_bao_cao = datetime.strptime(data['ngay'], '%Y-%m-%d')
-            
-            # Update các hạng mục
-            handover.status_5s = data.get('5S - Tình Trạng', handover.status_5s)
-            handover.comment_5s = data.get('5S - Comments', handover.comment_5s)
-            handover.status_an_toan = data.get('An Toàn - Tình Trạng', handover.status_an_toan)
-            handover.comment_an_toan = data.get('An Toàn - Comments', handover.comment_an_toan)
-            handover.status_chat_luong = data.get('Chất Lượng - Tình Trạng', handover.status_chat_luong)
-            handover.comment_chat_luong = data.get('Chất Lượng - Comments', handover.comment_chat_luong)
-            handover.status_thiet_bi = data.get('Thiết Bị - Tình Trạng', handover.status_thiet_bi)
-            handover.comment_thiet_bi = data.get('Thiết Bị - Comments', handover.comment_thiet_bi)
-            handover.status_ke_hoach = data.get('Kế Hoạch - Tình Trạng', handover.status_ke_hoach)
-            handover.comment_ke_hoach = data.get('Kế Hoạch - Comments', handover.comment_ke_hoach)
-            handover.status_khac = data.get('Khác - Tình Trạng', handover.status_khac)
-            handover.comment_khac = data.get('Khác - Comments', handover.comment_khac)
-            
-            db.flush()
-            
-            return True, "Cập nhật thành công"
+        with get_connection() as conn:
+            with conn.begin():
+                current = conn.execute(_SELECT_HANDOVER_BY_ID, {'handover_id': handover_id}).first()
+                
+                if not current:
+                    return False, "Không tìm thấy bàn giao"
+                
+                # Kiểm tra xem đã được nhận chưa
+                if current.trang_thai_nhan == 'Đã nhận':
+                    return False, "Không thể sửa bàn giao đã được nhận. Vui lòng xóa phiếu nhận ca trước."
+                
+                version = current.version if expected_version is None else expected_version
+                if current.version != version:
+                    return False, HANDOVER_CHANGED_MESSAGE
+                
+                changes = _handover_changes(current, data)
+                if not changes:
+                    return True, "Không có thay đổi"
+                
+                updated = conn.execute(
+                    _handovers.update().where(
+                        and_(
+                            _handovers.c.handover_id == handover_id,
+                            _handovers.c.version == version,
+                            _handovers.c.trang_thai_nhan == 'Chưa nhận',
+                            _HANDOVER_LIVE
+                        )
+                    ).values(**changes, version=_handovers.c.version + 1)
+                ).rowcount
+                
+                if updated != 1:
+                    # Bị chen ngang giữa lúc đọc và lúc ghi (sửa, nhận ca hoặc xóa)
+                    return False, HANDOVER_CHANGED_MESSAGE
+                
+                if 'ngay_bao_cao' in changes:
+                    # Ngày cũ không còn bàn giao này: bảng tổng hợp bất đồng phải tính lại cả ngày cũ
+                    mark_summary_day_dirty(conn, current.ngay_bao_cao)
+                
+                # Audit commit cùng thay đổi
+                record_audit('handover', handover_id, 'update',
+                             {'version': version, **{column: getattr(current, column) for column in changes}},
+                             {'version': version + 1, **changes}, actor, conn=conn)
+        
+        _notify_handovers_changed()
+        return True, "Cập nhật thành công"
             
     except Exception as e:
         print(f"Error updating handover: {e}")
         return False, f"Lỗi: {str(e)}"
 
 
-def delete_handover(handover_id):
+def _soft_delete_returning(conn, table, condition, deleted_at, **values):
+    """
+    Đánh dấu deleted_at (kèm các cột trong values) và trả về các dòng để ghi audit:
+    UPDATE ... RETURNING nếu database hỗ trợ, nếu không thì SELECT FOR UPDATE trước
+    """
+    update = table.update().where(condition).values(deleted_at=deleted_at, **values)
+    if conn.dialect.update_returning:
+        return conn.execute(update.returning(*table.columns)).all()
+    rows = conn.execute(select(table).where(condition).with_for_update()).all()
+    conn.execute(update)
+    return rows
+
+
+def delete_handover(handover_id, actor=None, expected_version=None):
     """
-    Xóa handover và receive liên quan
+    Xóa mềm handover và receive liên quan (đánh dấu deleted_at, cùng một mốc thời gian
+    để khôi phục được cả hai). Job purge (data_purge.py) sẽ xóa hẳn sau thời gian lưu trữ.
     
     Args:
         handover_id: ID của handover cần xóa
+        actor: người thực hiện (ghi vào audit log)
+        expected_version: version lúc hiển thị xác nhận xóa (get_handover_by_id; None = không kiểm tra)
     
     Returns:
         (success: bool, message: str)
     """
     try:
-        with get_db() as db:
-            # Tìm handover
-            handover = db.query(Handover).filter(
-                Handover.handover_id == handover_id
-            ).first()
-            
-            if not handover:
-                return False, "Không tìm thấy bàn giao"
-            
-            # Xóa receive liên quan (nếu có)
-            db.query(Receive).filter(
-                Receive.handover_id == handover_id
-            ).delete()
-            
-            # Xóa handover
-            db.delete(handover)
-            db.flush()
-            
-            return True, "Đã xóa bàn giao thành công"
-            
+        deleted_at = datetime.now()
+        condition = and_(_handovers.c.handover_id == handover_id, _HANDOVER_LIVE)
+        if expected_version is not None:
+            condition = and_(condition, _handovers.c.version == expected_version)
+        
+        with get_connection() as conn:
+            with conn.begin():
+                # Xóa/khôi phục cũng tăng version: form sửa đang mở từ trước không ghi đè được
+                handovers = _soft_delete_returning(
+                    conn, _handovers, condition, deleted_at, version=_handovers.c.version + 1
+                )
+                
+                if not handovers:
+                    if expected_version is not None and conn.execute(
+                        _SELECT_HANDOVER_BY_ID, {'handover_id': handover_id}
+                    ).first():
+                        return False, HANDOVER_CHANGED_MESSAGE
+                    return False, "Không tìm thấy bàn giao"
+                
+                receives = _soft_delete_returning(
+                    conn, _receives,
+                    and_(_receives.c.handover_id == handover_id, _RECEIVE_LIVE),
+                    deleted_at
+                )
+                
+                # Lưu toàn bộ giá trị trước khi xóa: dữ liệu vẫn còn trong audit sau khi bị purge
+                record_audit('handover', handover_id, 'delete', _row_values(handovers[0], _handovers), None, actor,
+                             conn=conn)
+                for receive in receives:
+                    record_audit('receive', handover_id, 'delete', _row_values(receive, _receives), None, actor,
+                                 conn=conn)
+        
+        _notify_handovers_changed()
+        return True, "Đã chuyển bàn giao vào thùng rác"
+        
     except Exception as e:
         print(f"Error deleting handover: {e}")
         return False, f"Lỗi: {str(e)}"
 
 
+def restore_handover(handover_id, actor=None):
+    """
+    Khôi phục handover đã xóa mềm cùng các receive bị xóa theo nó
+    
+    Args:
+        handover_id: ID của handover
+        actor: người thực hiện (ghi vào audit log)
+    
+    Returns:
+        (success: bool, message: str)
+    """
+    try:
+        with get_connection() as conn:
+            with conn.begin():
+                deleted_at = conn.execute(
+                    select(_handovers.c.deleted_at).where(
+                        and_(_handovers.c.handover_id == handover_id, _handovers.c.deleted_at.isnot(None))
+                    )
+                ).scalar()
+                
+                if deleted_at is None:
+                    return False, "Không tìm thấy bàn giao trong thùng rác"
+                
+                conn.execute(
+                    _handovers.update().where(
+                        _handovers.c.handover_id == handover_id
+                    ).values(deleted_at=None, version=_handovers.c.version + 1)
+                )
+                conn.execute(
+                    _receives.update().where(
+                        and_(_receives.c.handover_id == handover_id, _receives.c.deleted_at == deleted_at)
+                    ).values(deleted_at=None)
+                )
+                record_audit('handover', handover_id, 'restore', {'deleted_at': deleted_at}, {'deleted_at': None},
+                             actor, conn=conn)
+        
+        _notify_handovers_changed()
+        return True, "Đã khôi phục bàn giao"
+        
+    except Exception as e:
+        print(f"Error restoring handover: {e}")
+        return False, f"Lỗi: {str(e)}"
+
+
 def get_receive_by_handover_id(handover_id):
     """
     Lấy thông tin receive theo handover_id
     Returns: dict hoặc None
     """
     try:
-        with get_db() as db:
-            receive = db.query(Receive).filter(
-                Receive.handover_id == handover_id
-            ).first()
+        with get_connection() as conn:
+            receive = conn.execute(_SELECT_RECEIVE_BY_HANDOVER_ID, {'handover_id': handover_id}).first()
             
             if not receive:
                 return None
@@ -773,7 +2077,7 @@ def get_receive_by_handover_id(handover_id):
                 'id': receive.id,
                 'ma_nv': receive.ma_nv_nhan_ca,
                 'ten_nv': receive.ten_nv_nhan_ca,
-                'line': receive.line,
+                'line': _line_name(receive, get_line_names()),
                 'ca': receive.ca,
                 'chu_ky': receive.nhan_vien_thuoc_ca,
                 'ngay': receive.ngay_nhan_ca,
@@ -797,43 +2101,159 @@ def get_receive_by_handover_id(handover_id):
         return None
 
 
-def delete_receive(handover_id):
+def delete_receive(handover_id, actor=None, expected_receive_id=None):
     """
-    Xóa phiếu nhận ca và cập nhật trạng thái handover
+    Xóa mềm phiếu nhận ca và cập nhật trạng thái handover về "Chưa nhận"
     
     Args:
         handover_id: ID của handover
+        actor: người thực hiện (ghi vào audit log)
+        expected_receive_id: id phiếu nhận lúc hiển thị xác nhận xóa; phiếu đã bị thay
+                             (xóa rồi nhận lại) thì từ chối (None = không kiểm tra)
     
     Returns:
         (success: bool, message: str)
     """
     try:
-        with get_db() as db:
-            # Xóa receive
-            deleted = db.query(Receive).filter(
-                Receive.handover_id == handover_id
-            ).delete()
-            
-            if deleted == 0:
-                return False, "Không tìm thấy phiếu nhận ca"
-            
-            # Cập nhật trạng thái handover về "Chưa nhận"
-            handover = db.query(Handover).filter(
-                Handover.handover_id == handover_id
-            ).first()
-            
-            if handover:
-                handover.trang_thai_nhan = 'Chưa nhận'
-            
-            db.flush()
-            
-            return True, "Đã xóa phiếu nhận ca thành công"
-            
+        condition = and_(_receives.c.handover_id == handover_id, _RECEIVE_LIVE)
+        if expected_receive_id is not None:
+            condition = and_(condition, _receives.c.id == expected_receive_id)
+        
+        with get_connection() as conn:
+            with conn.begin():
+                receives = _soft_delete_returning(conn, _receives, condition, datetime.now())
+                
+                if not receives:
+                    if expected_receive_id is not None and conn.execute(
+                        _SELECT_RECEIVE_BY_HANDOVER_ID, {'handover_id': handover_id}
+                    ).first():
+                        return False, "Phiếu nhận ca đã được thay đổi bởi người khác, vui lòng tải lại"
+                    return False, "Không tìm thấy phiếu nhận ca"
+                
+                conn.execute(
+                    _handovers.update().where(
+                        and_(_handovers.c.handover_id == handover_id, _HANDOVER_LIVE)
+                    ).values(trang_thai_nhan='Chưa nhận', version=_handovers.c.version + 1)
+                )
+                
+                for receive in receives:
+                    record_audit('receive', handover_id, 'delete', _row_values(receive, _receives), None, actor,
+                                 conn=conn)
+                record_audit('handover', handover_id, 'update',
+                             {'trang_thai_nhan': 'Đã nhận'}, {'trang_thai_nhan': 'Chưa nhận'}, actor, conn=conn)
+        
+        _notify_handovers_changed()
+        return True, "Đã chuyển phiếu nhận ca vào thùng rác"
+        
     except Exception as e:
         print(f"Error deleting receive: {e}")
         return False, f"Lỗi: {str(e)}"
 
 
+def restore_receive(receive_id, actor=None):
+    """
+    Khôi phục phiếu nhận ca đã xóa mềm - chỉ khi bàn giao vẫn còn và chưa được nhận lại
+    
+    Args:
+        receive_id: ID (khóa chính) của phiếu nhận
+        actor: người thực hiện (ghi vào audit log)
+    
+    Returns:
+        (success: bool, message: str)
+    """
+    try:
+        with get_connection() as conn:
+            with conn.begin():
+                handover_id = conn.execute(
+                    select(_receives.c.handover_id).where(
+                        and_(_receives.c.id == receive_id, _receives.c.deleted_at.isnot(None))
+                    )
+                ).scalar()
+                
+                if handover_id is None:
+                    return False, "Không tìm thấy phiếu nhận ca trong thùng rác"
+                
+                # Claim lại bàn giao bằng UPDATE có điều kiện (như khi nhận ca)
+                claimed = conn.execute(
+                    _handovers.update().where(
+                        and_(
+                            _handovers.c.handover_id == handover_id,
+                            _handovers.c.trang_thai_nhan == 'Chưa nhận',
+                            _HANDOVER_LIVE
+                        )
+                    ).values(trang_thai_nhan='Đã nhận', version=_handovers.c.version + 1)
+                ).rowcount
+                
+                if claimed == 0:
+                    return False, "Bàn giao đã bị xóa hoặc đã được nhận lại, không thể khôi phục phiếu nhận"
+                
+                conn.execute(
+                    _receives.update().where(_receives.c.id == receive_id).values(deleted_at=None)
+                )
+                
+                record_audit('receive', handover_id, 'restore', {'id': receive_id, 'deleted': True},
+                             {'id': receive_id, 'deleted': False}, actor, conn=conn)
+                record_audit('handover', handover_id, 'update',
+                             {'trang_thai_nhan': 'Chưa nhận'}, {'trang_thai_nhan': 'Đã nhận'}, actor, conn=conn)
+        
+        _notify_handovers_changed()
+        return True, "Đã khôi phục phiếu nhận ca"
+        
+    except Exception as e:
+        print(f"Error restoring receive: {e}")
+        return False, f"Lỗi: {str(e)}"
+
+
+def get_deleted_items(limit=100):
+    """
+    Lấy các bàn giao và phiếu nhận ca trong thùng rác (đọc qua partial index deleted_at)
+    
+    Returns:
+        dict {'handovers': list of dict, 'receives': list of dict}, mới xóa trước
+    """
+    try:
+        with get_connection() as conn:
+            handovers = conn.execute(
+                select(_handovers).where(
+                    _handovers.c.deleted_at.isnot(None)
+                ).order_by(_handovers.c.deleted_at.desc()).limit(limit)
+            ).all()
+            
+            # Phiếu nhận bị xóa riêng lẻ (phiếu xóa kèm bàn giao được khôi phục cùng bàn giao)
+            receives = conn.execute(
+                select(_receives).select_from(
+                    _receives.join(_handovers, _handovers.c.handover_id == _receives.c.handover_id)
+                ).where(
+                    and_(_receives.c.deleted_at.isnot(None), _HANDOVER_LIVE)
+                ).order_by(_receives.c.deleted_at.desc()).limit(limit)
+            ).all()
+        
+        names = get_line_names()
+        return {
+            'handovers': [{
+                'ID Giao Ca': h.handover_id,
+                'Line': _line_name(h, names),
+                'Ca': h.ca,
+                'Ngày': h.ngay_bao_cao,
+                'Người Giao': f"{h.ma_nv_giao_ca} - {h.ten_nv_giao_ca}",
+                'Trạng Thái': h.trang_thai_nhan,
+                'Thời Gian Xóa': h.deleted_at
+            } for h in handovers],
+            'receives': [{
+                'ID Phiếu Nhận': r.id,
+                'ID Giao Ca': r.handover_id,
+                'Line': _line_name(r, names),
+                'Ca': r.ca,
+                'Người Nhận': f"{r.ma_nv_nhan_ca} - {r.ten_nv_nhan_ca}",
+                'Thời Gian Nhận': r.thoi_gian_nhan_ca,
+                'Thời Gian Xóa': r.deleted_at
+            } for r in receives]
+        }
+    except Exception as e:
+        print(f"Error getting deleted items: {e}")
+        return {'handovers': [], 'receives': []}
+
+
 def search_handovers(search_term=None, from_date=None, to_date=None, line=None, status=None, limit=50):
     """
     Tìm kiếm handovers với nhiều tiêu chí
@@ -851,7 +2271,7 @@ def search_handovers(search_term=None, from_date=None, to_date=None, line=None,
     """
     try:
         with get_db() as db:
-            query = db.query(Handover)
+            query = db.query(Handover).filter(Handover.deleted_at.is_(None))
             
             # Tìm kiếm theo search_term
             if search_term:
@@ -871,7 +2291,7 @@ def search_handovers(search_term=None, from_date=None, to_date=None, line=None,
             
             # Lọc theo line
             if line and line != "Tất cả":
-                query = query.filter(Handover.line == line)
+                query = query.filter(Handover.line_id == get_line_id(line))
             
             # Lọc theo trạng thái
             if status and status != "Tất cả":
@@ -881,27 +2301,21 @@ def search_handovers(search_term=None, from_date=None, to_date=None, line=None,
             handovers = query.order_by(Handover.thoi_gian_giao_ca.desc()).limit(limit).all()
             
             # Convert to list of dict
+            names = get_line_names()
             results = []
             for h in handovers:
-                # Đếm OK/NOK/NA
-                statuses = [h.status_5s, h.status_an_toan, h.status_chat_luong,
-                           h.status_thiet_bi, h.status_ke_hoach, h.status_khac]
-                ok_count = sum(1 for s in statuses if s == 'OK')
-                nok_count = sum(1 for s in statuses if s == 'NOK')
-                na_count = sum(1 for s in statuses if s == 'NA')
-                
                 results.append({
                     'ID Giao Ca': h.handover_id,
                     'Ngày': h.ngay_bao_cao,
                     'Thời Gian': h.thoi_gian_giao_ca,
-                    'Line': h.line,
+                    'Line': _line_name(h, names),
                     'Ca': h.ca,
                     'Nhóm': h.nhan_vien_thuoc_ca,
                     'Mã NV': h.ma_nv_giao_ca,
                     'Tên NV': h.ten_nv_giao_ca,
-                    'OK': ok_count,
-                    'NOK': nok_count,
-                    'NA': na_count,
+                    'OK': h.ok_count,
+                    'NOK': h.nok_count,
+                    'NA': h.na_count,
                     'Trạng Thái': h.trang_thai_nhan
                 })
             
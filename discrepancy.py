@@ -0,0 +1,223 @@
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import and_, bindparam, case, func, literal, select, union_all, String
+from database import get_connection, Handover, Receive, DiscrepancySummary, DiscrepancyDirtyDay
+from background_jobs import start_periodic_job, get_job_watermark, set_job_watermark
+
+# ===== DISCREPANCY ANALYTICS =====
+# So sánh trạng thái bên giao (status_*) với xác nhận của bên nhận (xac_nhan_*,
+# comment_*) ngay trong SQL: hạng mục bên giao báo OK nhưng bên nhận không xác nhận,
+# hoặc xác nhận kèm ghi chú. Job nền tổng hợp theo ngày/line/ca/người giao/người
+# nhận/hạng mục vào bảng discrepancy_summary; báo cáo chỉ cộng các dòng tổng hợp.
+# Line được lưu theo line_id, tên line tra từ danh mục lúc trả báo cáo.
+#
+# Làm mới tăng dần: nhận ca, xóa/khôi phục phiếu nhận, sửa/xóa bàn giao đều cập nhật
+# handovers.updated_at, nên mỗi lần chạy chỉ tính lại các ngày có bàn giao thay đổi
+# sau watermark lưu trong job_state. Bàn giao bị sửa sang ngày khác thì ngày cũ không
+# còn dòng nào thay đổi: update_handover ghi ngày cũ vào bảng discrepancy_dirty_days
+# (mark_summary_day_dirty), mỗi ngày một dòng.
+
+# Chu kỳ làm mới bảng tổng hợp (giây)
+DISCREPANCY_INTERVAL_SECONDS = int(os.getenv('DISCREPANCY_INTERVAL_SECONDS', '300'))
+
+# Lùi watermark để không bỏ sót transaction ghi updated_at trước nhưng commit sau lần đọc
+DISCREPANCY_OVERLAP_SECONDS = int(os.getenv('DISCREPANCY_OVERLAP_SECONDS', '60'))
+
+# Số ngày tính lại trong một transaction
+DISCREPANCY_BATCH_DAYS = 31
+
+JOB_NAME = 'discrepancy_summary'
+
+# Hạng mục -> (cột trạng thái bên giao, cột xác nhận bên nhận, cột ghi chú bên nhận)
+CATEGORY_COLUMNS = {
+    '5S': ('status_5s', 'xac_nhan_5s', 'comment_5s'),
+    'An Toàn': ('status_an_toan', 'xac_nhan_an_toan', 'comment_an_toan'),
+    'Chất Lượng': ('status_chat_luong', 'xac_nhan_chat_luong', 'comment_chat_luong'),
+    'Thiết Bị': ('status_thiet_bi', 'xac_nhan_thiet_bi', 'comment_thiet_bi'),
+    'Kế Hoạch': ('status_ke_hoach', 'xac_nhan_ke_hoach', 'comment_ke_hoach'),
+    'Khác': ('status_khac', 'xac_nhan_khac', 'comment_khac'),
+}
+
+# Các chiều gom nhóm của báo cáo: key -> (tên cột hiển thị, cột trong bảng tổng hợp)
+DISCREPANCY_GROUPS = {
+    'line': ('Line', DiscrepancySummary.line_id),
+    'ca': ('Ca', DiscrepancySummary.ca),
+    'giver': ('NV Giao', DiscrepancySummary.ma_nv_giao_ca),
+    'receiver': ('NV Nhận', DiscrepancySummary.ma_nv_nhan_ca),
+}
+
+_SUMMARY_COLUMNS = ['ngay_bao_cao', 'line_id', 'ca', 'ma_nv_giao_ca', 'ma_nv_nhan_ca',
+                    'category', 'compared', 'not_confirmed', 'commented']
+
+
+def _summary_select(days):
+    """
+    SELECT tổng hợp cho các ngày báo cáo: mỗi hạng mục một nhánh UNION ALL, join bàn
+    giao với phiếu nhận còn hiệu lực và chỉ so sánh các hạng mục bên giao báo OK
+    """
+    handovers = Handover.__table__
+    receives = Receive.__table__
+    joined = handovers.join(
+        receives, and_(receives.c.handover_id == handovers.c.handover_id, receives.c.deleted_at.is_(None))
+    )
+    group_columns = [handovers.c.ngay_bao_cao, handovers.c.line_id, handovers.c.ca,
+                     handovers.c.ma_nv_giao_ca, receives.c.ma_nv_nhan_ca]
+
+    branches = []
+    for category, (status_column, confirm_column, comment_column) in CATEGORY_COLUMNS.items():
+        confirmed = receives.c[confirm_column] == 'Đã xác nhận'
+        has_comment = func.trim(func.coalesce(receives.c[comment_column], '')) != ''
+        branches.append(select(
+            *group_columns,
+            literal(category, String).label('category'),
+            func.count().label('compared'),
+            func.sum(case((confirmed, 0), else_=1)).label('not_confirmed'),
+            func.sum(case((and_(confirmed, has_comment), 1), else_=0)).label('commented')
+        ).select_from(joined).where(
+            handovers.c.ngay_bao_cao.in_(days),
+            handovers.c.deleted_at.is_(None),
+            handovers.c[status_column] == 'OK'
+        ).group_by(*group_columns))
+    return union_all(*branches)
+
+
+def mark_summary_day_dirty(conn, day):
+    """
+    Ghi ngày báo cáo cũ của bàn giao vừa bị chuyển sang ngày khác vào discrepancy_dirty_days
+    (trong transaction của update_handover) để lần làm mới sau tính lại cả ngày cũ.
+    Upsert theo ngày (INSERT ... ON CONFLICT): nhiều lần sửa cùng ngày không bao giờ
+    làm lỗi transaction, chỉ cập nhật marked_at.
+    """
+    if conn.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(DiscrepancyDirtyDay.__table__).values(day=day, marked_at=datetime.now())
+    conn.execute(stmt.on_conflict_do_update(index_elements=['day'], set_={'marked_at': stmt.excluded.marked_at}))
+
+
+def refresh_discrepancy_summary():
+    """
+    Tính lại bảng discrepancy_summary cho các ngày có bàn giao thay đổi sau watermark
+    (lần đầu: mọi ngày) và các ngày cũ của bàn giao bị chuyển ngày, mỗi lô ngày là một
+    transaction DELETE + INSERT ... SELECT
+
+    Returns: dict {'days': số ngày đã tính lại, 'rows': số dòng tổng hợp đã ghi}
+    """
+    handovers = Handover.__table__
+    summary = DiscrepancySummary.__table__
+    dirty_days = DiscrepancyDirtyDay.__table__
+    watermark = get_job_watermark(JOB_NAME)
+
+    with get_connection() as conn:
+        new_watermark = conn.execute(select(func.max(handovers.c.updated_at))).scalar()
+        if new_watermark is None:
+            return {'days': 0, 'rows': 0}
+        changed_days = select(handovers.c.ngay_bao_cao).distinct()
+        if watermark is not None:
+            changed_days = changed_days.where(
+                handovers.c.updated_at > watermark - timedelta(seconds=DISCREPANCY_OVERLAP_SECONDS)
+            )
+        dirty = conn.execute(select(dirty_days.c.day, dirty_days.c.marked_at)).all()
+        days = sorted(set(conn.execute(changed_days).scalars()) | {row.day for row in dirty})
+
+    rows = 0
+    for start in range(0, len(days), DISCREPANCY_BATCH_DAYS):
+        batch = days[start:start + DISCREPANCY_BATCH_DAYS]
+        with get_connection() as conn:
+            with conn.begin():
+                conn.execute(summary.delete().where(summary.c.ngay_bao_cao.in_(batch)))
+                rows += conn.execute(
+                    summary.insert().from_select(_SUMMARY_COLUMNS, _summary_select(batch))
+                ).rowcount
+
+    if dirty:
+        # Chỉ xóa các lần đánh dấu đã đọc: ngày được đánh dấu lại trong lúc đang tính
+        # (marked_at đã đổi) vẫn còn cho lần sau
+        with get_connection() as conn:
+            with conn.begin():
+                conn.execute(
+                    dirty_days.delete().where(
+                        dirty_days.c.day == bindparam('dirty_day'),
+                        dirty_days.c.marked_at == bindparam('dirty_marked_at')
+                    ),
+                    [{'dirty_day': row.day, 'dirty_marked_at': row.marked_at} for row in dirty]
+                )
+
+    set_job_watermark(JOB_NAME, new_watermark)
+    return {'days': len(days), 'rows': rows}
+
+
+def get_discrepancy_report(from_date, to_date, group_by='line', line_filter=None):
+    """
+    Báo cáo bất đồng giao-nhận theo hạng mục, đọc từ bảng tổng hợp
+
+    Args:
+        from_date: Ngày bắt đầu (YYYY-MM-DD)
+        to_date: Ngày kết thúc (YYYY-MM-DD)
+        group_by: 'line', 'ca', 'giver' (người giao) hoặc 'receiver' (người nhận)
+        line_filter: Lọc theo line (None = tất cả)
+
+    Returns:
+        List of dict, mỗi dict là một (nhóm, hạng mục) gồm số phiếu so sánh, số lần
+        không xác nhận, số lần xác nhận kèm ghi chú và tỷ lệ bất đồng (%),
+        sắp theo số bất đồng giảm dần
+    """
+    if group_by not in DISCREPANCY_GROUPS:
+        raise ValueError(f"group_by không hợp lệ: {group_by}")
+    label, group_column = DISCREPANCY_GROUPS[group_by]
+    # db_operations import module này (mark_summary_day_dirty): import lúc gọi
+    from db_operations import get_line_id, get_line_names
+
+    try:
+        start = datetime.strptime(from_date, '%Y-%m-%d')
+        end = datetime.strptime(to_date, '%Y-%m-%d') + timedelta(days=1)
+        disagreements = func.sum(DiscrepancySummary.not_confirmed + DiscrepancySummary.commented)
+        query = select(
+            group_column.label('group_value'),
+            DiscrepancySummary.category,
+            func.sum(DiscrepancySummary.compared).label('compared'),
+            func.sum(DiscrepancySummary.not_confirmed).label('not_confirmed'),
+            func.sum(DiscrepancySummary.commented).label('commented'),
+            disagreements.label('disagreements')
+        ).where(
+            DiscrepancySummary.ngay_bao_cao >= start,
+            DiscrepancySummary.ngay_bao_cao < end
+        )
+        if line_filter:
+            query = query.where(DiscrepancySummary.line_id == get_line_id(line_filter))
+        query = query.group_by(group_column, DiscrepancySummary.category).order_by(
+            disagreements.desc(), group_column, DiscrepancySummary.category
+        )
+
+        with get_connection() as conn:
+            rows = conn.execute(query).all()
+
+        names = get_line_names() if group_by == 'line' else None
+        report = []
+        for row in rows:
+            compared = int(row.compared or 0)
+            disagreed = int(row.disagreements or 0)
+            report.append({
+                label: names.get(row.group_value, '') if names is not None else row.group_value,
+                'Hạng Mục': row.category,
+                'Số Phiếu So Sánh': compared,
+                'Không Xác Nhận': int(row.not_confirmed or 0),
+                'Xác Nhận Kèm Ghi Chú': int(row.commented or 0),
+                'Tỷ Lệ Bất Đồng (%)': round(disagreed / compared * 100, 2) if compared > 0 else 0.0
+            })
+        return report
+
+    except Exception as e:
+        print(f"Error getting discrepancy report: {e}")
+        return []
+
+
+def start_discrepancy_job(interval_seconds=None, initial_delay=0):
+    """Khởi động job làm mới bảng tổng hợp chạy nền (mỗi process chỉ một lần)"""
+    return start_periodic_job(
+        JOB_NAME,
+        refresh_discrepancy_summary,
+        interval_seconds or DISCREPANCY_INTERVAL_SECONDS,
+        initial_delay=initial_delay
+    )
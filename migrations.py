@@ -0,0 +1,559 @@
+import json
+import sys
+import time
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from database import get_engine, Base, SchemaMigration, is_postgresql, is_sqlite
+
+# ===== SCHEMA MIGRATIONS =====
+# create_all chỉ tạo bảng chưa tồn tại, không thêm cột/index vào bảng đã có.
+# Mỗi thay đổi schema là một migration có version tăng dần; phiên bản đã chạy
+# được ghi vào bảng schema_migrations nên mỗi migration chỉ chạy một lần.
+#
+# Các bước trong migration đều idempotent (kiểm tra trước khi tạo) để chạy được
+# cả trên database mới (baseline đã tạo đủ schema) lẫn database cũ của production.
+#
+# Usage:
+#   python migrations.py status
+#   python migrations.py upgrade [--target VERSION]
+# Chạy thử trên bản sao production: DATABASE_URL=<bản sao> python migrations.py upgrade
+
+# Khóa advisory của PostgreSQL: nhiều process khởi động cùng lúc chỉ một process chạy migration
+MIGRATION_LOCK_ID = 872_301_415
+
+
+class MigrationContext:
+    """Các thao tác schema dùng trong migration, tự chọn cách làm theo loại database"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.dialect = engine.dialect
+
+    def _inspector(self):
+        # Tạo inspector mới mỗi lần để không đọc cache cũ sau khi schema thay đổi
+        return inspect(self.engine)
+
+    def has_table(self, table_name):
+        return self._inspector().has_table(table_name)
+
+    def has_column(self, table_name, column_name):
+        return any(column['name'] == column_name for column in self._inspector().get_columns(table_name))
+
+    def has_index(self, table_name, index_name):
+        return any(index['name'] == index_name for index in self._inspector().get_indexes(table_name))
+
+    def has_foreign_key(self, table_name, constraint_name):
+        return any(fk['name'] == constraint_name for fk in self._inspector().get_foreign_keys(table_name))
+
+    def execute(self, sql, params=None):
+        """Chạy một câu lệnh SQL trong transaction riêng (SELECT trả về list các Row, còn lại trả về rowcount)"""
+        with self.engine.begin() as conn:
+            result = conn.execute(text(sql), params or {})
+            return result.all() if result.returns_rows else result.rowcount
+
+    def create_tables(self):
+        """Tạo các bảng (kèm index) có trong model nhưng chưa có trong database"""
+        Base.metadata.create_all(bind=self.engine)
+
+    def create_table(self, table_name):
+        """Tạo một bảng (kèm index) đã khai báo trong model nếu chưa có"""
+        if self.has_table(table_name):
+            return False
+        Base.metadata.tables[table_name].create(bind=self.engine)
+        return True
+
+    def add_column(self, table_name, column_name):
+        """ALTER TABLE ADD COLUMN cho cột (nullable, hoặc NOT NULL có server_default) đã khai báo trong model"""
+        if self.has_column(table_name, column_name):
+            return False
+        column = Base.metadata.tables[table_name].c[column_name]
+        column_type = column.type.compile(dialect=self.dialect)
+        # DEFAULT hằng số: PostgreSQL 11+ chỉ ghi metadata, không viết lại bảng
+        if column.server_default is not None:
+            column_type += f" DEFAULT {column.server_default.arg}"
+            if not column.nullable:
+                column_type += ' NOT NULL'
+        # Khóa ngoại khai báo trong model (SQLite chỉ cho ADD COLUMN ... REFERENCES khi cột mặc định NULL)
+        for foreign_key in column.foreign_keys:
+            column_type += f' REFERENCES {foreign_key.column.table.name}({foreign_key.column.name})'
+        self.execute(f'ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}')
+        return True
+
+    def create_index(self, table_name, index_name):
+        """
+        Tạo index đã khai báo trong model nếu chưa có
+        - PostgreSQL: CREATE INDEX CONCURRENTLY (không khóa ghi bảng, chạy ngoài transaction)
+        - SQLite: CREATE INDEX thường
+        """
+        index = next((i for i in Base.metadata.tables[table_name].indexes if i.name == index_name), None)
+        if index is None:
+            # Index đã được thay thế ở migration sau (không còn trong model)
+            return False
+
+        if is_postgresql:
+            # CONCURRENTLY bị gián đoạn để lại index INVALID: xóa để tạo lại
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                invalid = conn.execute(text(
+                    "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                    "WHERE c.relname = :name AND NOT i.indisvalid"
+                ), {'name': index_name}).first()
+                if invalid:
+                    conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
+
+                if self.has_index(table_name, index_name):
+                    return False
+
+                # Dùng DDL do SQLAlchemy sinh (giữ UNIQUE, WHERE của partial index), thêm CONCURRENTLY
+                ddl = str(CreateIndex(index, if_not_exists=True).compile(dialect=self.dialect))
+                conn.exec_driver_sql(ddl.replace('INDEX', 'INDEX CONCURRENTLY', 1))
+            return True
+
+        if self.has_index(table_name, index_name):
+            return False
+        index.create(bind=self.engine)
+        return True
+
+    def drop_index(self, table_name, index_name):
+        """Xóa index nếu có (PostgreSQL: DROP INDEX CONCURRENTLY, không khóa ghi bảng)"""
+        if not self.has_index(table_name, index_name):
+            return False
+        if is_postgresql:
+            with self.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.exec_driver_sql(f'DROP INDEX CONCURRENTLY IF EXISTS {index_name}')
+        else:
+            self.execute(f'DROP INDEX IF EXISTS {index_name}')
+        return True
+
+    def add_foreign_key(self, table_name, column_name):
+        """
+        Thêm khóa ngoại đã khai báo trong model cho cột
+        - PostgreSQL: ADD CONSTRAINT ... NOT VALID rồi VALIDATE (kiểm tra dữ liệu cũ không khóa ghi bảng)
+        - SQLite: không hỗ trợ ADD CONSTRAINT, dựng lại bảng (rebuild_table)
+        """
+        foreign_key = next(iter(Base.metadata.tables[table_name].c[column_name].foreign_keys))
+        name = foreign_key.constraint.name
+        if self.has_foreign_key(table_name, name):
+            return False
+        if is_sqlite:
+            self.rebuild_table(table_name)
+            return True
+        target = foreign_key.column
+        on_delete = f' ON DELETE {foreign_key.ondelete}' if foreign_key.ondelete else ''
+        self.execute(
+            f'ALTER TABLE {table_name} ADD CONSTRAINT {name} FOREIGN KEY ({column_name}) '
+            f'REFERENCES {target.table.name}({target.name}){on_delete} NOT VALID'
+        )
+        self.execute(f'ALTER TABLE {table_name} VALIDATE CONSTRAINT {name}')
+        return True
+
+    def alter_column_type(self, table_name, column_name):
+        """
+        Đổi kiểu cột theo model nếu kiểu hiện tại khác (so theo DDL của kiểu, ví dụ VARCHAR(255))
+        - PostgreSQL: ALTER COLUMN ... TYPE
+        - SQLite: không hỗ trợ ALTER COLUMN, dựng lại bảng (rebuild_table)
+        """
+        column = Base.metadata.tables[table_name].c[column_name]
+        column_type = column.type.compile(dialect=self.dialect)
+        current = next(c['type'] for c in self._inspector().get_columns(table_name) if c['name'] == column_name)
+        if current.compile(dialect=self.dialect) == column_type:
+            return False
+        if is_sqlite:
+            self.rebuild_table(table_name)
+            return True
+        self.execute(f'ALTER TABLE {table_name} ALTER COLUMN {column_name} TYPE {column_type}')
+        return True
+
+    def rebuild_table(self, table_name):
+        """
+        Batch rebuild cho SQLite: đổi tên bảng cũ, tạo bảng mới theo model,
+        chép dữ liệu các cột chung rồi xóa bảng cũ - tất cả trong một transaction
+        """
+        table = Base.metadata.tables[table_name]
+        old_name = f'_old_{table_name}'
+
+        inspector = self._inspector()
+        existing_columns = {column['name'] for column in inspector.get_columns(table_name)}
+        old_indexes = [index['name'] for index in inspector.get_indexes(table_name)]
+        common = ', '.join(column.name for column in table.columns if column.name in existing_columns)
+
+        with self.engine.connect() as conn:
+            # Trong lúc dựng lại: DROP bảng cũ không kích hoạt ON DELETE CASCADE và RENAME không
+            # sửa khóa ngoại của bảng khác sang tên bảng tạm (PRAGMA chỉ có hiệu lực ngoài transaction)
+            dbapi_connection = conn.connection.dbapi_connection
+            dbapi_connection.execute('PRAGMA foreign_keys=OFF')
+            dbapi_connection.execute('PRAGMA legacy_alter_table=ON')
+            try:
+                with conn.begin():
+                    # Index đi theo bảng khi đổi tên, xóa trước để bảng mới tạo lại cùng tên
+                    for index_name in old_indexes:
+                        conn.exec_driver_sql(f'DROP INDEX IF EXISTS {index_name}')
+                    conn.exec_driver_sql(f'ALTER TABLE {table_name} RENAME TO {old_name}')
+                    table.create(bind=conn)
+                    conn.exec_driver_sql(f'INSERT INTO {table_name} ({common}) SELECT {common} FROM {old_name}')
+                    conn.exec_driver_sql(f'DROP TABLE {old_name}')
+            finally:
+                dbapi_connection.execute('PRAGMA legacy_alter_table=OFF')
+                dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
+
+# ===== DANH SÁCH MIGRATION =====
+# Thêm migration mới vào cuối danh sách, không sửa migration đã phát hành
+
+def _0001_baseline(ctx):
+    """Tạo các bảng chưa có (database mới nhận luôn schema mới nhất)"""
+    ctx.create_tables()
+
+
+def _0002_handover_request_key(ctx):
+    """Cột khóa idempotency cho giao ca"""
+    ctx.add_column('handovers', 'request_key')
+    ctx.create_index('handovers', 'ix_handovers_request_key')
+
+
+def _0003_analytics_indexes(ctx):
+    """Index cho thống kê xu hướng NOK và cảnh báo SLA"""
+    ctx.create_index('handovers', 'ix_handovers_trend_cover')
+    ctx.create_index('sla_alerts', 'ix_sla_alerts_open')
+
+
+def _0004_handover_line_day_status_index(ctx):
+    """Index cho truy vấn bàn giao chờ nhận theo line + ngày"""
+    ctx.create_index('handovers', 'ix_handovers_line_day_status')
+
+
+def _0005_hash_user_passwords(ctx):
+    """Mở rộng cột password và hash các mật khẩu đang lưu dạng text"""
+    from auth import hash_password, is_password_hash
+
+    ctx.alter_column_type('users', 'password')
+    users = ctx.execute('SELECT id, password FROM users')
+    for user_id, password in users:
+        if password and not is_password_hash(password):
+            ctx.execute(
+                'UPDATE users SET password = :password WHERE id = :id',
+                {'password': hash_password(password), 'id': user_id}
+            )
+
+
+def _0006_soft_delete(ctx):
+    """Cột deleted_at (xóa mềm) và partial index bỏ qua các dòng đã xóa"""
+    ctx.add_column('handovers', 'deleted_at')
+    ctx.add_column('receives', 'deleted_at')
+    ctx.create_index('handovers', 'ix_handovers_live_day_line_status')
+    ctx.create_index('handovers', 'ix_handovers_deleted_at')
+    ctx.create_index('receives', 'ix_receives_live_handover_id')
+    ctx.create_index('receives', 'ix_receives_deleted_at')
+
+
+def _0007_audit_log(ctx):
+    """Bảng audit_log cho lịch sử sửa/xóa của admin"""
+    ctx.create_table('audit_log')
+
+
+def _0008_handover_updated_at(ctx):
+    """Cột updated_at (mốc làm mới dashboard theo thay đổi) và index"""
+    ctx.add_column('handovers', 'updated_at')
+    ctx.execute('UPDATE handovers SET updated_at = COALESCE(created_at, thoi_gian_giao_ca) WHERE updated_at IS NULL')
+    ctx.create_index('handovers', 'ix_handovers_updated_at')
+
+
+def _0009_handover_status_counts(ctx):
+    """Cột ok_count/nok_count/na_count, backfill theo lô và partial index bàn giao khẩn cấp"""
+    for column in ('ok_count', 'nok_count', 'na_count'):
+        ctx.add_column('handovers', column)
+
+    statuses = ('status_5s', 'status_an_toan', 'status_chat_luong',
+                'status_thiet_bi', 'status_ke_hoach', 'status_khac')
+
+    def count_expr(value):
+        return ' + '.join(f"(CASE WHEN {column} = '{value}' THEN 1 ELSE 0 END)" for column in statuses)
+
+    # Backfill theo khoảng id để mỗi câu UPDATE chỉ giữ khóa trên một lô nhỏ
+    min_id, max_id = ctx.execute('SELECT MIN(id), MAX(id) FROM handovers')[0]
+    batch_size = 10000
+    for start in range(min_id or 0, (max_id or 0) + 1, batch_size):
+        ctx.execute(
+            f"UPDATE handovers SET ok_count = {count_expr('OK')}, "
+            f"nok_count = {count_expr('NOK')}, na_count = {count_expr('NA')} "
+            f"WHERE id >= :start AND id < :end AND ok_count IS NULL",
+            {'start': start, 'end': start + batch_size}
+        )
+
+    ctx.create_index('handovers', 'ix_handovers_urgent_pending')
+
+
+def _add_history_lines(ctx, table_names):
+    """
+    Line đã bị xóa khỏi cấu hình (kiểu xóa hết rồi thêm lại cũ) nhưng còn trong lịch sử:
+    thêm lại vào danh mục ở trạng thái ngừng hoạt động để mọi dòng đều có line_id
+    """
+    known = {row[0] for row in ctx.execute('SELECT line_name FROM lines')}
+    codes = {row[0] for row in ctx.execute('SELECT line_code FROM lines')}
+    history = ctx.execute(' UNION '.join(
+        f'SELECT DISTINCT line FROM {table_name} WHERE line IS NOT NULL' for table_name in table_names
+    ))
+    for (name,) in history:
+        if name in known:
+            continue
+        code, suffix = name[:50], 1
+        while code in codes:
+            suffix += 1
+            code = f'{name[:45]}-{suffix}'
+        ctx.execute(
+            'INSERT INTO lines (line_code, line_name, is_active, created_at) VALUES (:code, :name, :active, :now)',
+            {'code': code, 'name': name, 'active': False, 'now': datetime.now()}
+        )
+        known.add(name)
+        codes.add(code)
+
+
+def _backfill_line_id(ctx, table_name):
+    """Điền line_id còn NULL theo tên line lúc ghi, theo lô id"""
+    min_id, max_id = ctx.execute(f'SELECT MIN(id), MAX(id) FROM {table_name}')[0]
+    batch_size = 10000
+    for start in range(min_id or 0, (max_id or 0) + 1, batch_size):
+        ctx.execute(
+            f'UPDATE {table_name} SET line_id = '
+            f'(SELECT MIN(lines.id) FROM lines WHERE lines.line_name = {table_name}.line) '
+            f'WHERE id >= :start AND id < :end AND line_id IS NULL',
+            {'start': start, 'end': start + batch_size}
+        )
+
+
+def _0010_line_foreign_keys(ctx):
+    """Cột line_id (khóa ngoại tới lines) cho handovers/receives và backfill theo tên line"""
+    _add_history_lines(ctx, ('handovers', 'receives'))
+    for table_name in ('handovers', 'receives'):
+        ctx.add_column(table_name, 'line_id')
+        _backfill_line_id(ctx, table_name)
+        ctx.create_index(table_name, f'ix_{table_name}_line_id')
+
+
+def _0011_shift_rules(ctx):
+    """Bảng shift_rules (lịch ca dự kiến để phát hiện ca thiếu bàn giao)"""
+    ctx.create_table('shift_rules')
+
+
+def _0012_employees(ctx):
+    """Bảng employees (danh bạ nhân viên) và index lịch sử giao/nhận theo mã NV"""
+    ctx.create_table('employees')
+    ctx.create_index('handovers', 'ix_handovers_ma_nv_giao_ca_time')
+    ctx.create_index('receives', 'ix_receives_ma_nv_nhan_ca_time')
+
+
+def _0013_discrepancy_summary(ctx):
+    """Bảng job_state (watermark job nền) và discrepancy_summary (bất đồng giao-nhận)"""
+    ctx.create_table('job_state')
+    ctx.create_table('discrepancy_summary')
+
+
+def _0014_receive_handover_foreign_key(ctx):
+    """Khóa ngoại receives.handover_id -> handovers (ON DELETE CASCADE), mỗi bàn giao một phiếu nhận còn hiệu lực"""
+    # Phiếu nhận trùng: giữ phiếu đầu tiên, xóa mềm các phiếu sau (vẫn khôi phục được từ thùng rác)
+    ctx.execute(
+        'UPDATE receives SET deleted_at = :now WHERE deleted_at IS NULL AND EXISTS ('
+        'SELECT 1 FROM receives earlier WHERE earlier.handover_id = receives.handover_id '
+        'AND earlier.deleted_at IS NULL AND earlier.id < receives.id)',
+        {'now': datetime.now()}
+    )
+    # Phiếu nhận trỏ tới bàn giao không còn tồn tại (đã bị xóa hẳn) không thể thỏa khóa ngoại:
+    # chép toàn bộ giá trị vào audit_log rồi mới xóa (cùng một transaction)
+    from audit import compute_changes
+
+    with ctx.engine.begin() as conn:
+        orphans = conn.execute(text(
+            'SELECT * FROM receives WHERE NOT EXISTS '
+            '(SELECT 1 FROM handovers WHERE handovers.handover_id = receives.handover_id)'
+        )).all()
+        if orphans:
+            now = datetime.now()
+            conn.execute(
+                text('INSERT INTO audit_log (entity_type, entity_id, action, actor, changes, created_at) '
+                     'VALUES (:entity_type, :entity_id, :action, :actor, :changes, :created_at)'),
+                [{
+                    'entity_type': 'receive',
+                    'entity_id': str(row.handover_id),
+                    'action': 'delete',
+                    'actor': 'migration 0014',
+                    'changes': json.dumps(compute_changes(dict(row._mapping), None),
+                                          ensure_ascii=False, separators=(',', ':'), default=str),
+                    'created_at': now
+                } for row in orphans]
+            )
+            conn.execute(
+                text('DELETE FROM receives WHERE id IN (' + ', '.join(str(int(row.id)) for row in orphans) + ')')
+            )
+            print(f"Deleted {len(orphans)} receives without handover (archived in audit_log)")
+    ctx.drop_index('receives', 'ix_receives_live_handover_id')
+    ctx.add_foreign_key('receives', 'handover_id')
+    ctx.create_index('receives', 'uq_receives_live_handover_id')
+
+
+def _0015_handover_version(ctx):
+    """Cột version cho compare-and-swap khi sửa bàn giao (dòng cũ nhận DEFAULT 1)"""
+    ctx.add_column('handovers', 'version')
+
+
+def _0016_line_id_dimension(ctx):
+    """
+    Lọc, nhóm và join theo line_id thay cho tên line: điền line_id còn NULL, thêm
+    sla_alerts.line_id, tính lại discrepancy_summary theo line_id và thay các index
+    theo tên line bằng index theo line_id
+    """
+    _add_history_lines(ctx, ('handovers', 'receives', 'sla_alerts'))
+    _backfill_line_id(ctx, 'handovers')
+    # Phiếu nhận theo line của bàn giao trước, còn lại theo tên line lúc ghi
+    ctx.execute(
+        'UPDATE receives SET line_id = (SELECT handovers.line_id FROM handovers '
+        'WHERE handovers.handover_id = receives.handover_id) WHERE line_id IS NULL'
+    )
+    _backfill_line_id(ctx, 'receives')
+
+    ctx.add_column('sla_alerts', 'line_id')
+    _backfill_line_id(ctx, 'sla_alerts')
+
+    # Bảng tổng hợp dựng lại được từ handovers/receives: tạo lại theo schema mới,
+    # xóa watermark để job nền tính lại mọi ngày ở lần chạy kế tiếp
+    if not ctx.has_column('discrepancy_summary', 'line_id'):
+        ctx.execute('DROP TABLE discrepancy_summary')
+        ctx.create_table('discrepancy_summary')
+        ctx.execute("DELETE FROM job_state WHERE name = 'discrepancy_summary' OR name LIKE 'discrepancy_summary:%'")
+
+    for index_name in ('ix_handovers_trend_cover_line_id', 'ix_handovers_line_id_day_status',
+                       'ix_handovers_live_day_line_id_status', 'ix_handovers_urgent_pending_line_id'):
+        ctx.create_index('handovers', index_name)
+    for index_name in ('ix_handovers_line', 'ix_handovers_trend_cover', 'ix_handovers_line_day_status',
+                       'ix_handovers_live_day_line_status', 'ix_handovers_urgent_pending'):
+        ctx.drop_index('handovers', index_name)
+    ctx.drop_index('receives', 'ix_receives_line')
+
+
+def _0017_discrepancy_dirty_days(ctx):
+    """Bảng discrepancy_dirty_days (ngày cần tính lại bảng tổng hợp) thay cho các dòng đánh dấu trong job_state"""
+    ctx.create_table('discrepancy_dirty_days')
+    # Chuyển các ngày còn đánh dấu theo cách cũ (dòng job_state 'discrepancy_summary:<id>:<version>')
+    ctx.execute(
+        'INSERT INTO discrepancy_dirty_days (day, marked_at) '
+        'SELECT watermark, COALESCE(MAX(updated_at), :now) FROM job_state '
+        "WHERE name LIKE 'discrepancy_summary:%' AND watermark IS NOT NULL "
+        'AND watermark NOT IN (SELECT day FROM discrepancy_dirty_days) GROUP BY watermark',
+        {'now': datetime.now()}
+    )
+    ctx.execute("DELETE FROM job_state WHERE name LIKE 'discrepancy_summary:%'")
+
+
+def _0018_trend_counts_index(ctx):
+    """Thay covering index 8 cột của thống kê xu hướng NOK bằng index (ngày, line_id, ok/nok/na_count)"""
+    ctx.create_index('handovers', 'ix_handovers_trend_counts')
+    ctx.drop_index('handovers', 'ix_handovers_trend_cover_line_id')
+
+
+MIGRATIONS = [
+    ('0001', 'baseline', _0001_baseline),
+    ('0002', 'handover_request_key', _0002_handover_request_key),
+    ('0003', 'analytics_indexes', _0003_analytics_indexes),
+    ('0004', 'handover_line_day_status_index', _0004_handover_line_day_status_index),
+    ('0005', 'hash_user_passwords', _0005_hash_user_passwords),
+    ('0006', 'soft_delete', _0006_soft_delete),
+    ('0007', 'audit_log', _0007_audit_log),
+    ('0008', 'handover_updated_at', _0008_handover_updated_at),
+    ('0009', 'handover_status_counts', _0009_handover_status_counts),
+    ('0010', 'line_foreign_keys', _0010_line_foreign_keys),
+    ('0011', 'shift_rules', _0011_shift_rules),
+    ('0012', 'employees', _0012_employees),
+    ('0013', 'discrepancy_summary', _0013_discrepancy_summary),
+    ('0014', 'receive_handover_foreign_key', _0014_receive_handover_foreign_key),
+    ('0015', 'handover_version', _0015_handover_version),
+    ('0016', 'line_id_dimension', _0016_line_id_dimension),
+    ('0017', 'discrepancy_dirty_days', _0017_discrepancy_dirty_days),
+    ('0018', 'trend_counts_index', _0018_trend_counts_index),
+]
+
+
+def get_applied_versions(engine=None):
+    """Trả về dict {version: SchemaMigration row} các migration đã chạy"""
+    engine = engine or get_engine()
+    SchemaMigration.__table__.create(bind=engine, checkfirst=True)
+    with engine.connect() as conn:
+        rows = conn.execute(SchemaMigration.__table__.select()).all()
+    return {row.version: row for row in rows}
+
+
+def get_pending_migrations(engine=None, target=None):
+    """Các migration chưa chạy (tới version target nếu có), theo thứ tự version"""
+    applied = get_applied_versions(engine)
+    return [
+        (version, name, func) for version, name, func in MIGRATIONS
+        if version not in applied and (target is None or version <= target)
+    ]
+
+
+def upgrade(target=None, verbose=True):
+    """
+    Chạy các migration chưa áp dụng theo thứ tự version và ghi lại thời gian chạy
+
+    Args:
+        target: Chạy tới version này (None = tới mới nhất)
+        verbose: In tiến trình và thời gian từng migration
+
+    Returns: list các (version, name, duration_ms) đã chạy
+    """
+    engine = get_engine()
+    ctx = MigrationContext(engine)
+    applied_now = []
+
+    lock_conn = None
+    if is_postgresql:
+        lock_conn = engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        lock_conn.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATION_LOCK_ID})
+
+    try:
+        # Đọc lại danh sách sau khi có khóa: process khác có thể vừa chạy xong
+        for version, name, func in get_pending_migrations(engine, target):
+            if verbose:
+                print(f"Applying migration {version}_{name} ...", flush=True)
+            started = time.perf_counter()
+            func(ctx)
+            duration_ms = int((time.perf_counter() - started) * 1000)
+
+            with engine.begin() as conn:
+                conn.execute(SchemaMigration.__table__.insert().values(
+                    version=version, name=name, applied_at=datetime.now(), duration_ms=duration_ms
+                ))
+            applied_now.append((version, name, duration_ms))
+            if verbose:
+                print(f"  done in {duration_ms / 1000:.2f}s")
+    finally:
+        if lock_conn is not None:
+            lock_conn.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATION_LOCK_ID})
+            lock_conn.close()
+
+    if verbose and not applied_now:
+        print("Schema is up to date")
+    return applied_now
+
+
+def print_status():
+    """In trạng thái từng migration (đã chạy lúc nào, mất bao lâu)"""
+    applied = get_applied_versions()
+    for version, name, _ in MIGRATIONS:
+        row = applied.get(version)
+        if row:
+            print(f"[x] {version}_{name:<40} {row.applied_at:%Y-%m-%d %H:%M:%S}  {row.duration_ms or 0} ms")
+        else:
+            print(f"[ ] {version}_{name:<40} pending")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    if args and args[0] == 'status':
+        print_status()
+    elif args and args[0] == 'upgrade':
+        target = args[args.index('--target') + 1] if '--target' in args else None
+        started = time.perf_counter()
+        upgrade(target=target)
+        print(f"Total: {time.perf_counter() - started:.2f}s")
+    else:
+        print("Usage: python migrations.py status | upgrade [--target VERSION]")
+        sys.exit(2)
@@ -0,0 +1,339 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, datetime
+
+# ===== SHARED STATE =====
+# Cache/state dùng chung giữa các worker Streamlit chạy sau load balancer.
+# st.cache_resource và st.session_state chỉ sống trong một process; dữ liệu cần
+# chia sẻ (danh sách line, snapshot dashboard, khóa ký session, đếm đăng nhập sai,
+# khóa leader của job nền) đi qua backend chọn bằng SHARED_STATE_URL:
+#
+#   (không đặt) / memory://        - bộ nhớ trong process (1 worker, mặc định)
+#   sqlite:////đường/dẫn/state.db  - file SQLite dùng chung (nhiều worker trên cùng máy)
+#   redis://host:6379/0            - Redis hoặc server tương thích (cần package redis)
+#
+# Load balancer vẫn phải bật session affinity (sticky session): kết nối websocket
+# và st.session_state của một phiên trình duyệt gắn với một worker.
+#
+# Giá trị trong backend SQLite/Redis được lưu dạng JSON (không dùng pickle: ai ghi được
+# vào file/Redis dùng chung không thể chạy code trong worker). Chỉ hỗ trợ dict, list,
+# chuỗi, số, bool, None và datetime/date.
+
+SHARED_STATE_URL = os.getenv('SHARED_STATE_URL', 'memory://')
+
+# Chu kỳ dọn các key đã hết hạn khi ghi (giây). Key cũ (vd. snapshot dashboard của version
+# trước) không bao giờ được đọc lại, nên không thể chỉ xóa khi đọc lại đúng key đó
+SHARED_STATE_SWEEP_INTERVAL_SECONDS = float(os.getenv('SHARED_STATE_SWEEP_INTERVAL_SECONDS', '60'))
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return {'__datetime__': value.isoformat()}
+    if isinstance(value, date):
+        return {'__date__': value.isoformat()}
+    raise TypeError(f"Không lưu được giá trị kiểu {type(value).__name__} vào shared state")
+
+
+def _json_object_hook(obj):
+    if len(obj) == 1:
+        if '__datetime__' in obj:
+            return datetime.fromisoformat(obj['__datetime__'])
+        if '__date__' in obj:
+            return date.fromisoformat(obj['__date__'])
+    return obj
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'), default=_json_default)
+
+
+def _loads(raw):
+    """Giải mã giá trị đã lưu; giá trị không phải JSON (vd. pickle của phiên bản cũ) coi như chưa có"""
+    try:
+        return json.loads(raw, object_hook=_json_object_hook)
+    except (ValueError, TypeError):
+        return None
+
+
+class MemoryBackend:
+    """Backend trong bộ nhớ của process (mặc định khi chỉ chạy 1 worker)"""
+
+    def __init__(self, sweep_interval=None):
+        self._data = {}
+        self._lock = threading.Lock()
+        self._sweep_interval = SHARED_STATE_SWEEP_INTERVAL_SECONDS if sweep_interval is None else sweep_interval
+        self._next_sweep = 0.0
+
+    def _sweep(self, now):
+        """Xóa mọi key đã hết hạn, tối đa một lần mỗi chu kỳ (gọi khi đang giữ lock)"""
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self._sweep_interval
+        for key in [key for key, (_, expires_at) in self._data.items() if expires_at is not None and expires_at <= now]:
+            del self._data[key]
+
+    def _get_entry(self, key, now):
+        entry = self._data.get(key)
+        if entry and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def get(self, key):
+        with self._lock:
+            entry = self._get_entry(key, time.time())
+            return entry[0] if entry else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            now = time.time()
+            self._sweep(now)
+            self._data[key] = (value, now + ttl if ttl else None)
+
+    def add(self, key, value, ttl=None):
+        """Chỉ ghi nếu key chưa tồn tại. Returns: True nếu đã ghi"""
+        with self._lock:
+            now = time.time()
+            self._sweep(now)
+            if self._get_entry(key, now):
+                return False
+            self._data[key] = (value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key, ttl=None):
+        """Tăng bộ đếm, đặt hạn ttl khi key mới được tạo. Returns: giá trị mới"""
+        with self._lock:
+            now = time.time()
+            self._sweep(now)
+            entry = self._get_entry(key, now)
+            value = (entry[0] if entry else 0) + 1
+            expires_at = entry[1] if entry else (now + ttl if ttl else None)
+            self._data[key] = (value, expires_at)
+            return value
+
+    def count(self, key):
+        """Giá trị hiện tại của bộ đếm tạo bằng incr (0 nếu chưa có)"""
+        return self.get(key) or 0
+
+    def ttl(self, key):
+        """Số giây còn lại trước khi key hết hạn (None = không có hạn hoặc không tồn tại)"""
+        with self._lock:
+            entry = self._get_entry(key, time.time())
+            if not entry or entry[1] is None:
+                return None
+            return max(0, int(entry[1] - time.time()))
+
+
+class SQLiteFileBackend:
+    """Backend trên một file SQLite (WAL) dùng chung cho các worker trên cùng máy"""
+
+    def __init__(self, path, sweep_interval=None):
+        self.path = path
+        self._local = threading.local()
+        self._sweep_interval = SHARED_STATE_SWEEP_INTERVAL_SECONDS if sweep_interval is None else sweep_interval
+        self._next_sweep = 0.0
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS shared_state ("
+                "key TEXT PRIMARY KEY, value BLOB, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_shared_state_expires_at ON shared_state (expires_at)")
+
+    def _sweep(self, conn, now):
+        """Xóa các dòng đã hết hạn, tối đa một lần mỗi chu kỳ trong mỗi process (trong transaction đang mở)"""
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + self._sweep_interval
+        conn.execute("DELETE FROM shared_state WHERE expires_at <= ?", (now,))
+
+    def _connect(self):
+        # Mỗi thread một connection (sqlite3 connection không dùng chung giữa các thread)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        return _Transaction(self._connect())
+
+    def get(self, key):
+        row = self._connect().execute(
+            "SELECT value FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return _loads(row[0]) if row else None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        with self._transaction() as conn:
+            self._sweep(conn, now)
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, _dumps(value), now + ttl if ttl else None)
+            )
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        with self._transaction() as conn:
+            self._sweep(conn, now)
+            conn.execute("DELETE FROM shared_state WHERE key = ? AND expires_at <= ?", (key, now))
+            inserted = conn.execute(
+                "INSERT OR IGNORE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, _dumps(value), now + ttl if ttl else None)
+            ).rowcount
+        return inserted == 1
+
+    def delete(self, key):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM shared_state WHERE key = ?", (key,))
+
+    def incr(self, key, ttl=None):
+        now = time.time()
+        with self._transaction() as conn:
+            self._sweep(conn, now)
+            row = conn.execute(
+                "SELECT value, expires_at FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            ).fetchone()
+            value = ((_loads(row[0]) if row else None) or 0) + 1
+            expires_at = row[1] if row else (now + ttl if ttl else None)
+            conn.execute(
+                "INSERT OR REPLACE INTO shared_state (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, _dumps(value), expires_at)
+            )
+        return value
+
+    def count(self, key):
+        return self.get(key) or 0
+
+    def ttl(self, key):
+        row = self._connect().execute(
+            "SELECT expires_at FROM shared_state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        if not row or row[0] is None:
+            return None
+        return max(0, int(row[0] - time.time()))
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT quanh một nhóm lệnh (khóa ghi giữa các process)"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+class RedisBackend:
+    """Backend Redis (hoặc server tương thích giao thức Redis)"""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SHARED_STATE_URL dùng redis:// nhưng chưa cài package redis (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        value = self.client.get(key)
+        return _loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, _dumps(value), ex=ttl)
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(key, _dumps(value), ex=ttl, nx=True))
+
+    def delete(self, key):
+        self.client.delete(key)
+
+    def incr(self, key, ttl=None):
+        # Bộ đếm lưu dạng số nguyên của Redis để INCR nguyên tử
+        value = self.client.incr(key)
+        if value == 1 and ttl:
+            self.client.expire(key, ttl)
+        return int(value)
+
+    def count(self, key):
+        value = self.client.get(key)
+        return int(value) if value is not None else 0
+
+    def ttl(self, key):
+        remaining = self.client.ttl(key)
+        return remaining if remaining is not None and remaining >= 0 else None
+
+
+def create_backend(url):
+    """Tạo backend theo URL (memory://, sqlite:///path, redis://...)"""
+    if not url or url.startswith('memory://'):
+        return MemoryBackend()
+    if url.startswith('sqlite:///'):
+        return SQLiteFileBackend(url[len('sqlite:///'):])
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f"SHARED_STATE_URL không hỗ trợ: {url}")
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_shared_state():
+    """Backend dùng chung của process (tạo ở lần dùng đầu tiên)"""
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = create_backend(SHARED_STATE_URL)
+                print(f"Shared state backend: {type(_backend).__name__}")
+    return _backend
+
+
+def cached(key, loader, ttl=None):
+    """
+    Đọc key từ shared state, nếu chưa có thì gọi loader() và lưu lại.
+    Lỗi của backend không làm hỏng request: khi đó gọi thẳng loader().
+    """
+    try:
+        state = get_shared_state()
+        value = state.get(key)
+        if value is not None:
+            return value
+    except Exception as e:
+        print(f"Error reading shared state {key}: {e}")
+        return loader()
+
+    value = loader()
+    if value is not None:
+        try:
+            state.set(key, value, ttl)
+        except Exception as e:
+            print(f"Error writing shared state {key}: {e}")
+    return value
+
+
+def invalidate(*keys):
+    """Xóa các key khỏi shared state (bỏ qua lỗi backend)"""
+    try:
+        state = get_shared_state()
+        for key in keys:
+            state.delete(key)
+    except Exception as e:
+        print(f"Error invalidating shared state: {e}")
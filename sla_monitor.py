@@ -0,0 +1,131 @@
+import os
+from database import get_db, Handover, Receive, SlaAlert
+from sqlalchemy import and_, exists, func, literal, select
+from datetime import datetime, timedelta
+from background_jobs import start_periodic_job
+from db_operations import get_line_id, get_line_names
+
+# ===== SLA MONITOR =====
+# Định kỳ phát hiện bàn giao ở trạng thái 'Chưa nhận' quá thời hạn SLA và ghi
+# vào bảng sla_alerts. Dashboard chỉ đọc bảng này (có index) thay vì tự quét
+# toàn bộ bàn giao chưa nhận ở mỗi lần rerun.
+
+# Thời hạn nhận ca (phút) kể từ lúc giao ca
+SLA_MINUTES = int(os.getenv('SLA_MINUTES', '60'))
+
+# Chu kỳ chạy evaluator (giây)
+SLA_CHECK_INTERVAL_SECONDS = int(os.getenv('SLA_CHECK_INTERVAL_SECONDS', '60'))
+
+
+def evaluate_sla_breaches(sla_minutes=None):
+    """
+    Cập nhật bảng sla_alerts bằng các câu lệnh set-based (không lặp từng dòng):
+    1. Mở lại cảnh báo nếu bàn giao quay về 'Chưa nhận' (phiếu nhận bị xóa)
+    2. Thêm cảnh báo cho bàn giao chưa nhận đã quá hạn và chưa có cảnh báo
+    3. Đóng cảnh báo của bàn giao đã được nhận (hoặc đã bị xóa)
+
+    Returns: dict số dòng thay đổi theo từng bước
+    """
+    sla_minutes = sla_minutes or SLA_MINUTES
+    now = datetime.now()
+    cutoff = now - timedelta(minutes=sla_minutes)
+
+    still_pending = exists().where(
+        and_(
+            Handover.handover_id == SlaAlert.handover_id,
+            Handover.trang_thai_nhan == 'Chưa nhận',
+            Handover.deleted_at.is_(None)
+        )
+    )
+
+    with get_db() as db:
+        reopened = db.query(SlaAlert).filter(
+            and_(SlaAlert.resolved_at.isnot(None), still_pending)
+        ).update({SlaAlert.resolved_at: None}, synchronize_session=False)
+
+        breached = select(
+            Handover.handover_id,
+            Handover.line,
+            Handover.line_id,
+            Handover.ca,
+            Handover.ngay_bao_cao,
+            Handover.thoi_gian_giao_ca,
+            literal(sla_minutes, SlaAlert.sla_minutes.type),
+            literal(now, SlaAlert.detected_at.type)
+        ).where(
+            and_(
+                Handover.trang_thai_nhan == 'Chưa nhận',
+                Handover.deleted_at.is_(None),
+                Handover.thoi_gian_giao_ca < cutoff,
+                ~exists().where(SlaAlert.handover_id == Handover.handover_id)
+            )
+        )
+        inserted = db.execute(
+            SlaAlert.__table__.insert().from_select(
+                ['handover_id', 'line', 'line_id', 'ca', 'ngay_bao_cao', 'thoi_gian_giao_ca', 'sla_minutes', 'detected_at'],
+                breached
+            )
+        ).rowcount
+
+        # Thời điểm đóng = thời gian nhận ca thực tế (nếu có phiếu nhận)
+        receive_time = select(func.min(Receive.thoi_gian_nhan_ca)).where(
+            Receive.handover_id == SlaAlert.handover_id,
+            Receive.deleted_at.is_(None)
+        ).scalar_subquery()
+        resolved = db.query(SlaAlert).filter(
+            and_(SlaAlert.resolved_at.is_(None), ~still_pending)
+        ).update({SlaAlert.resolved_at: func.coalesce(receive_time, now)}, synchronize_session=False)
+
+    return {'reopened': reopened, 'new': inserted, 'resolved': resolved}
+
+
+def get_open_sla_alerts(filter_date, filter_line=None):
+    """
+    Lấy các cảnh báo SLA đang mở của một ngày (đọc từ bảng sla_alerts)
+
+    Args:
+        filter_date: Ngày báo cáo (YYYY-MM-DD)
+        filter_line: Lọc theo line (None/"Tất cả" = tất cả)
+
+    Returns: dict {handover_id: dict thông tin cảnh báo}
+    """
+    try:
+        with get_db() as db:
+            day_start = datetime.strptime(filter_date, '%Y-%m-%d')
+            query = db.query(SlaAlert).filter(
+                and_(
+                    SlaAlert.ngay_bao_cao >= day_start,
+                    SlaAlert.ngay_bao_cao < day_start + timedelta(days=1),
+                    SlaAlert.resolved_at.is_(None)
+                )
+            )
+
+            if filter_line and filter_line != "Tất cả":
+                query = query.filter(SlaAlert.line_id == get_line_id(filter_line))
+
+            names = get_line_names()
+            now = datetime.now()
+            return {
+                alert.handover_id: {
+                    'line': names.get(alert.line_id, alert.line),
+                    'ca': alert.ca,
+                    'thoi_gian_giao': alert.thoi_gian_giao_ca,
+                    'sla_minutes': alert.sla_minutes,
+                    'detected_at': alert.detected_at,
+                    'wait_minutes': int((now - alert.thoi_gian_giao_ca).total_seconds() // 60)
+                }
+                for alert in query.all()
+            }
+    except Exception as e:
+        print(f"Error getting SLA alerts: {e}")
+        return {}
+
+
+def start_sla_monitor(interval_seconds=None, initial_delay=0):
+    """Khởi động evaluator chạy nền (mỗi process chỉ một lần)"""
+    return start_periodic_job(
+        'sla_monitor',
+        evaluate_sla_breaches,
+        interval_seconds or SLA_CHECK_INTERVAL_SECONDS,
+        initial_delay=initial_delay
+    )
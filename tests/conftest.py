@@ -0,0 +1,48 @@
+"""
+Cấu hình chung cho test: chạy trên một file SQLite tạm (DATABASE_URL phải được đặt
+trước khi import database.py vì engine đọc biến môi trường khi tạo)
+"""
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='handover_test_'), 'test.db')}"
+os.environ.setdefault('WRITE_SPOOL_PATH', os.path.join(tempfile.mkdtemp(prefix='handover_spool_'), 'spool.db'))
+os.environ.setdefault('AUDIT_JOURNAL_PATH', os.path.join(tempfile.mkdtemp(prefix='handover_audit_'), 'audit_journal.db'))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture(scope='session', autouse=True)
+def database():
+    from database import init_db
+    init_db()
+
+
+CATEGORIES = ['5S', 'An Toàn', 'Chất Lượng', 'Thiết Bị', 'Kế Hoạch', 'Khác']
+
+
+def handover_data(line='Line 20A', ngay='2026-01-05', **overrides):
+    """Dữ liệu form giao ca hợp lệ (mọi hạng mục OK)"""
+    data = {'ma_nv': '123456', 'ten_nv': 'Nguyen Van A', 'line': line,
+            'ca': 'Ca Sáng (7h-19h)', 'chu_ky': 'A', 'ngay': ngay}
+    for category in CATEGORIES:
+        data[f'{category} - Tình Trạng'] = 'OK'
+        data[f'{category} - Comments'] = ''
+    data.update(overrides)
+    return data
+
+
+def receive_data(line='Line 20A', ngay='2026-01-05', **overrides):
+    """Dữ liệu form nhận ca xác nhận mọi hạng mục"""
+    data = {'ma_nv': '234567', 'ten_nv': 'Tran Thi B', 'line': line,
+            'ca': 'Ca Tối (19h-7h)', 'chu_ky': 'B', 'ngay': ngay}
+    for category in CATEGORIES:
+        data[f'{category} - Xác Nhận'] = 'Đã xác nhận'
+        data[f'{category} - Comments'] = ''
+    data.update(overrides)
+    return data
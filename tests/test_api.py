@@ -0,0 +1,54 @@
+"""Kiểm tra dữ liệu đầu vào của API tạo giao ca / nhận ca"""
+import pytest
+from starlette.testclient import TestClient
+
+import api
+from conftest import handover_data, receive_data
+from db_operations import get_active_lines
+
+API_KEY = 'test-key'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api, 'API_KEYS', {API_KEY})
+    return TestClient(api.app, headers={'X-API-Key': API_KEY})
+
+
+def test_create_handover_rejects_invalid_input(client):
+    data = handover_data(line='Nope', ma_nv='1234567890', ngay='2026-02-01', **{'5S - Tình Trạng': 'BAD'})
+    response = client.post('/api/handovers', json=data)
+    assert response.status_code == 422
+    details = response.json()['details']
+    assert any('6 chữ số' in message for message in details)
+    assert any("'Nope'" in message for message in details)
+    assert any("'5S'" in message for message in details)
+
+
+def test_create_and_receive_handover(client):
+    line = get_active_lines()[0]
+    response = client.post('/api/handovers', json=handover_data(line=line, ngay='2026-02-02'))
+    assert response.status_code == 201
+    handover_id = response.json()['handover_id']
+
+    incomplete = receive_data(line=line, ngay='2026-02-02', **{'An Toàn - Xác Nhận': 'Chưa xác nhận'})
+    response = client.post(f'/api/handovers/{handover_id}/receive', json=incomplete)
+    assert response.status_code == 422
+
+    response = client.post(f'/api/handovers/{handover_id}/receive', json=receive_data(line=line, ngay='2026-02-02'))
+    assert response.status_code == 201
+
+
+
+def test_search_limit_has_lower_bound(client):
+    line = get_active_lines()[0]
+    client.post('/api/handovers', json=handover_data(line=line, ngay='2026-02-03'))
+    response = client.get('/api/handovers/search', params={'limit': '-5', 'line': line})
+    assert response.status_code == 200
+    assert len(response.json()['items']) == 1
+
+
+def test_export_requires_api_key(monkeypatch):
+    monkeypatch.setattr(api, 'API_KEYS', set())
+    response = TestClient(api.app).get('/api/export/handovers.csv')
+    assert response.status_code == 403
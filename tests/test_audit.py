@@ -0,0 +1,42 @@
+"""Audit log: ghi trong transaction của thao tác, journal cục bộ là đường dự phòng"""
+import audit
+import db_operations
+from audit import flush_audit, get_audit_log, record_audit
+from conftest import handover_data
+from db_operations import delete_handover, get_handover_by_id, save_handover_safe
+
+
+def test_failed_batch_is_kept_and_written_later(monkeypatch):
+    def fail(batch):
+        raise RuntimeError('database unavailable')
+
+    monkeypatch.setattr(audit, '_write_batch', fail)
+    record_audit('handover', 'AUDIT-1', 'update', {'line': 'Line 1'}, {'line': 'Line 2'}, actor='admin')
+    assert audit.flush_journal() is None
+    assert get_audit_log('AUDIT-1') == []
+
+    monkeypatch.undo()
+    assert flush_audit()
+    entries = get_audit_log('AUDIT-1')
+    assert len(entries) == 1
+    assert entries[0]['Thay Đổi'] == {'line': ['Line 1', 'Line 2']}
+
+
+def test_audit_commits_with_the_change():
+    success, handover_id = save_handover_safe(handover_data(ngay='2026-03-10'))
+    assert success
+    assert delete_handover(handover_id, actor='admin')[0]
+    # Không cần chờ writer nền: bản ghi đã nằm trong audit_log cùng lúc với thao tác xóa
+    assert [entry['Thao Tác'] for entry in get_audit_log(handover_id)] == ['delete']
+
+
+def test_change_rolls_back_when_audit_fails(monkeypatch):
+    success, handover_id = save_handover_safe(handover_data(ngay='2026-03-11'))
+    assert success
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('audit_log unavailable')
+
+    monkeypatch.setattr(db_operations, 'record_audit', fail)
+    assert not delete_handover(handover_id, actor='admin')[0]
+    assert get_handover_by_id(handover_id) is not None
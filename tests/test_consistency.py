@@ -0,0 +1,59 @@
+"""Quét và sửa chỗ lệch giữa handovers.trang_thai_nhan và bảng receives"""
+from datetime import datetime
+
+from audit import get_audit_log
+from conftest import handover_data, receive_data
+from consistency import run_consistency_check
+from database import get_connection, Handover
+from db_operations import (
+    check_handover_received,
+    get_handover_by_id,
+    get_receive_by_handover_id,
+    save_handover_safe,
+    save_receive_safe
+)
+
+DAY = '2026-06-25'
+
+
+def _create(received):
+    success, handover_id = save_handover_safe(handover_data(line='Line 20B', ngay=DAY))
+    assert success
+    if received:
+        assert save_receive_safe(receive_data(line='Line 20B', ngay=DAY), handover_id)[0]
+    return handover_id
+
+
+def _force(handover_id, **values):
+    """Ghi thẳng vào bảng, bỏ qua db_operations (giả lập lệch do lỗi/ghi tay)"""
+    table = Handover.__table__
+    with get_connection() as conn:
+        with conn.begin():
+            conn.execute(table.update().where(table.c.handover_id == handover_id).values(**values))
+
+
+def test_report_then_repair_drifted_rows():
+    pending_with_receive = _create(received=True)
+    _force(pending_with_receive, trang_thai_nhan='Chưa nhận')
+    received_without_receive = _create(received=False)
+    _force(received_without_receive, trang_thai_nhan='Đã nhận')
+    orphan = _create(received=True)
+    _force(orphan, deleted_at=datetime.now())
+
+    report = run_consistency_check(full=True)
+    assert not report['repaired']
+    assert pending_with_receive in report['samples']['pending_with_receive']
+    assert received_without_receive in report['samples']['received_without_receive']
+    assert orphan in report['samples']['orphan_receive']
+    # Chỉ báo cáo: dữ liệu chưa bị sửa
+    assert get_handover_by_id(pending_with_receive)['trang_thai'] == 'Chưa nhận'
+
+    run_consistency_check(repair=True, full=True, actor='tester')
+    assert check_handover_received(pending_with_receive)[0]
+    assert get_handover_by_id(received_without_receive)['trang_thai'] == 'Chưa nhận'
+    assert get_receive_by_handover_id(orphan) is None
+    assert [(item['Thao Tác'], item['Người Thực Hiện']) for item in get_audit_log(orphan)] == [('repair', 'tester')]
+
+    after = run_consistency_check(full=True)
+    for kind in ('pending_with_receive', 'received_without_receive', 'orphan_receive', 'duplicate_receive'):
+        assert after[kind] == 0
@@ -0,0 +1,45 @@
+"""Làm mới dashboard tăng dần: snapshot + các thay đổi từ mốc updated_at khớp với tải lại toàn bộ"""
+from datetime import datetime
+
+from conftest import handover_data, receive_data
+from db_operations import (
+    delete_handover,
+    get_dashboard_changes,
+    get_dashboard_data,
+    merge_dashboard_changes,
+    save_handover_safe,
+    save_receive_safe
+)
+
+DAY = '2026-06-15'
+
+
+def _create(ngay=DAY):
+    success, handover_id = save_handover_safe(handover_data(line='Line 20B', ngay=ngay))
+    assert success
+    return handover_id
+
+
+def test_merged_changes_match_full_reload():
+    received_id, deleted_id = _create(), _create()
+    # Mốc lấy trước khi tải snapshot (như load_dashboard_snapshot)
+    watermark = datetime.now()
+    snapshot = get_dashboard_data(DAY, 'Line 20B')
+    assert {item['ID Giao Ca'] for item in snapshot} == {received_id, deleted_id}
+
+    assert save_receive_safe(receive_data(line='Line 20B', ngay=DAY), received_id)[0]
+    assert delete_handover(deleted_id)[0]
+    new_id = _create()
+    other_day_id = _create(ngay='2026-06-16')
+
+    changes = get_dashboard_changes(DAY, 'Line 20B', watermark)
+    assert {item['ID Giao Ca'] for item in changes['items']} == {received_id, new_id}
+    assert {deleted_id, other_day_id} <= set(changes['removed'])
+    assert changes['watermark'] > watermark
+
+    merged = merge_dashboard_changes(snapshot, changes)
+    assert merged == get_dashboard_data(DAY, 'Line 20B')
+
+    # Lần làm mới kế tiếp không có thay đổi mới: gộp lại phần chồng lấn không làm sai snapshot
+    again = get_dashboard_changes(DAY, 'Line 20B', changes['watermark'])
+    assert merge_dashboard_changes(merged, again) == merged
@@ -0,0 +1,29 @@
+"""Phân trang keyset của dashboard: đi hết các trang không bị sót hay lặp dòng"""
+from datetime import datetime
+
+from conftest import handover_data
+from db_operations import dashboard_cursor, get_dashboard_data, save_handover_safe
+
+
+def test_keyset_pages_cover_day_without_gaps_or_duplicates():
+    # Nhiều bàn giao cùng thời điểm giao: thứ tự trong trang phải phân định bằng ID
+    times = [datetime(2026, 5, 25, 7, 0)] * 4 + [datetime(2026, 5, 25, 19, minute) for minute in (0, 5, 5)]
+    for submitted_at in times:
+        assert save_handover_safe(handover_data(line='Line 20B', ngay='2026-05-25'), submitted_at=submitted_at)[0]
+
+    full = get_dashboard_data('2026-05-25', 'Line 20B')
+    assert len(full) == len(times)
+
+    pages, cursor = [], None
+    while True:
+        page = get_dashboard_data('2026-05-25', 'Line 20B', limit=3, cursor=cursor)
+        if not page:
+            break
+        assert len(page) <= 3
+        pages.append(page)
+        cursor = dashboard_cursor(page[-1])
+
+    paged_ids = [item['ID Giao Ca'] for page in pages for item in page]
+    assert paged_ids == [item['ID Giao Ca'] for item in full]
+    assert len(set(paged_ids)) == len(times)
+    assert [len(page) for page in pages] == [3, 3, 1]
@@ -0,0 +1,55 @@
+from conftest import handover_data, receive_data
+
+
+def _compared(report):
+    return sum(row['Số Phiếu So Sánh'] for row in report)
+
+
+def test_handover_moved_to_another_day_is_counted_once():
+    import db_operations as ops
+    from discrepancy import refresh_discrepancy_summary, get_discrepancy_report
+
+    ok, handover_id = ops.save_handover_safe(handover_data(line='Line 30B', ngay='2026-02-10'))
+    assert ok
+    assert ops.save_receive_safe(receive_data(line='Line 30B', ngay='2026-02-10'), handover_id)[0]
+    refresh_discrepancy_summary()
+    assert _compared(get_discrepancy_report('2026-02-10', '2026-02-11', line_filter='Line 30B')) == 6
+
+    # Hủy nhận, chuyển bàn giao sang ngày hôm sau rồi nhận lại
+    assert ops.delete_receive(handover_id)[0]
+    version = ops.get_handover_by_id(handover_id)['version']
+    assert ops.update_handover(handover_id, {'ngay': '2026-02-11'}, expected_version=version)[0]
+    assert ops.save_receive_safe(receive_data(line='Line 30B', ngay='2026-02-11'), handover_id)[0]
+    refresh_discrepancy_summary()
+
+    assert _compared(get_discrepancy_report('2026-02-10', '2026-02-10', line_filter='Line 30B')) == 0
+    assert _compared(get_discrepancy_report('2026-02-11', '2026-02-11', line_filter='Line 30B')) == 6
+    assert _compared(get_discrepancy_report('2026-02-10', '2026-02-11', line_filter='Line 30B')) == 6
+
+
+def test_two_handovers_moved_off_the_same_day():
+    import db_operations as ops
+    from database import get_connection, DiscrepancyDirtyDay
+    from discrepancy import refresh_discrepancy_summary, get_discrepancy_report
+
+    handover_ids = []
+    for _ in range(2):
+        ok, handover_id = ops.save_handover_safe(handover_data(line='Line 30A', ngay='2026-02-20'))
+        assert ok
+        assert ops.save_receive_safe(receive_data(line='Line 30A', ngay='2026-02-20'), handover_id)[0]
+        handover_ids.append(handover_id)
+    refresh_discrepancy_summary()
+    assert _compared(get_discrepancy_report('2026-02-20', '2026-02-20', line_filter='Line 30A')) == 12
+
+    # Cả hai lần sửa cùng đánh dấu ngày cũ: lần thứ hai không được làm lỗi transaction
+    for handover_id in handover_ids:
+        assert ops.delete_receive(handover_id)[0]
+        version = ops.get_handover_by_id(handover_id)['version']
+        assert ops.update_handover(handover_id, {'ngay': '2026-02-21'}, expected_version=version)[0]
+    with get_connection() as conn:
+        assert conn.execute(DiscrepancyDirtyDay.__table__.select()).all() != []
+
+    refresh_discrepancy_summary()
+    assert _compared(get_discrepancy_report('2026-02-20', '2026-02-20', line_filter='Line 30A')) == 0
+    with get_connection() as conn:
+        assert conn.execute(DiscrepancyDirtyDay.__table__.select()).all() == []
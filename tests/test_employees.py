@@ -0,0 +1,38 @@
+"""Danh bạ nhân viên: import CSV (upsert) và tra cứu mã NV / tên từ bộ nhớ"""
+import pytest
+
+from database import get_connection, Employee
+from db_operations import _notify_employees_changed, import_employees_csv, is_known_employee, lookup_employee_name
+
+
+@pytest.fixture
+def directory():
+    yield
+    # Các test khác dùng mã NV tự do: xóa danh bạ sau test (chưa có danh bạ = chấp nhận mọi mã)
+    with get_connection() as conn:
+        with conn.begin():
+            conn.execute(Employee.__table__.delete())
+    _notify_employees_changed()
+
+
+def test_invalid_row_rejects_whole_file(directory):
+    success, message = import_employees_csv('ma_nv,ten_nv\n100001,Nguyen Van A\n12AB,Tran Thi B\n')
+    assert not success and message.startswith('Dòng 3')
+    assert lookup_employee_name('100001') is None
+    assert is_known_employee('999999')
+
+
+def test_import_upserts_and_lookup_sees_changes(directory):
+    csv_data = 'Mã NV,Tên NV,Đang làm việc\n100001,Nguyen Van A,1\n100002,Tran Thi B,1\n100003,Le Van C,0\n'
+    success, message = import_employees_csv(csv_data.encode('utf-8-sig'))
+    assert success, message
+    assert lookup_employee_name(' 100001 ') == 'Nguyen Van A'
+    assert is_known_employee('100002')
+    # Nhân viên đã nghỉ và mã lạ không được chấp nhận
+    assert not is_known_employee('100003')
+    assert not is_known_employee('999999')
+
+    success, message = import_employees_csv('ma_nv,ten_nv\n100001,Nguyen Van An\n100003,Le Van C\n')
+    assert success and 'cập nhật 2' in message
+    assert lookup_employee_name('100001') == 'Nguyen Van An'
+    assert is_known_employee('100003')
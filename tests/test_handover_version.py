@@ -0,0 +1,41 @@
+"""Mốc version của bàn giao: sửa/xóa đồng thời bị từ chối khi bàn giao đã thay đổi"""
+from conftest import handover_data, receive_data
+from db_operations import (
+    HANDOVER_CHANGED_MESSAGE,
+    delete_handover,
+    get_handover_by_id,
+    restore_handover,
+    save_handover_safe,
+    save_receive_safe,
+    update_handover
+)
+
+
+def test_delete_rejects_handover_received_after_confirmation():
+    success, handover_id = save_handover_safe(handover_data(ngay='2026-03-01'))
+    assert success
+    shown = get_handover_by_id(handover_id)
+    assert 'updated_at' not in shown
+
+    # Người khác nhận ca trong lúc admin đang xem hộp xác nhận xóa
+    assert save_receive_safe(receive_data(ngay='2026-03-01'), handover_id)[0]
+    assert delete_handover(handover_id, expected_version=shown['version']) == (False, HANDOVER_CHANGED_MESSAGE)
+
+    current = get_handover_by_id(handover_id)
+    assert current['version'] == shown['version'] + 1
+    assert delete_handover(handover_id, expected_version=current['version'])[0]
+
+
+def test_edit_rejected_after_delete_and_restore():
+    success, handover_id = save_handover_safe(handover_data(ngay='2026-03-02'))
+    assert success
+    # Admin mở form sửa
+    opened = get_handover_by_id(handover_id)
+
+    # Người khác xóa rồi khôi phục bàn giao trong lúc form đang mở
+    assert delete_handover(handover_id, expected_version=opened['version'])[0]
+    assert restore_handover(handover_id)[0]
+
+    assert update_handover(handover_id, {'ten_nv': 'Le Van C'}, expected_version=opened['version']) == \
+        (False, HANDOVER_CHANGED_MESSAGE)
+    assert get_handover_by_id(handover_id)['ten_nv'] == opened['ten_nv']
@@ -0,0 +1,57 @@
+"""Các truy vấn đọc nóng dựng sẵn: kết quả đúng và câu lệnh compile được dùng lại từ cache"""
+from datetime import date, datetime
+
+from sqlalchemy import event
+from sqlalchemy.engine.default import CACHE_HIT
+
+from conftest import handover_data, receive_data
+from database import get_engine
+from db_operations import (
+    check_handover_received,
+    delete_handover,
+    get_handover_by_id,
+    get_latest_handover,
+    get_receive_by_handover_id,
+    save_handover_safe,
+    save_receive_safe
+)
+
+
+def test_latest_pending_handover_and_receive_status():
+    day = date(2026, 6, 5)
+    success, older_id = save_handover_safe(handover_data(line='Line 30B', ngay='2026-06-05'),
+                                           submitted_at=datetime(2026, 6, 5, 7, 0))
+    assert success
+    success, newer_id = save_handover_safe(handover_data(line='Line 30B', ngay='2026-06-05'),
+                                           submitted_at=datetime(2026, 6, 5, 19, 0))
+    assert success
+    assert get_latest_handover('Line 30B', day)['ID Giao Ca'] == newer_id
+
+    assert check_handover_received(newer_id) == (False, None)
+    assert save_receive_safe(receive_data(line='Line 30B', ngay='2026-06-05'), newer_id)[0]
+    received, info = check_handover_received(newer_id)
+    assert received and (info['ma_nv'], info['ten_nv']) == ('234567', 'Tran Thi B')
+    assert get_receive_by_handover_id(newer_id)['handover_id'] == newer_id
+    # Bàn giao mới nhất đã nhận: còn lại bàn giao chưa nhận trước đó
+    assert get_latest_handover('Line 30B', day)['ID Giao Ca'] == older_id
+
+    assert delete_handover(older_id)[0]
+    assert get_handover_by_id(older_id) is None
+    assert get_latest_handover('Line 30B', day) is None
+
+
+def test_repeated_lookup_reuses_compiled_statement():
+    success, handover_id = save_handover_safe(handover_data(ngay='2026-06-06'))
+    assert success
+    cache_hits = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        cache_hits.append(context.cache_hit == CACHE_HIT)
+
+    get_handover_by_id(handover_id)
+    event.listen(get_engine(), 'before_cursor_execute', record)
+    try:
+        get_handover_by_id(handover_id)
+    finally:
+        event.remove(get_engine(), 'before_cursor_execute', record)
+    assert cache_hits and all(cache_hits)
@@ -0,0 +1,32 @@
+"""Gửi lại form giao ca cùng request_key không tạo bàn giao mới"""
+from sqlalchemy import func, select
+
+from conftest import handover_data
+from database import get_connection, Handover
+from db_operations import get_handover_by_id, save_handover_safe
+
+
+def _count_by_request_key(request_key):
+    with get_connection() as conn:
+        return conn.execute(
+            select(func.count()).where(Handover.__table__.c.request_key == request_key)
+        ).scalar()
+
+
+def test_resubmitted_request_key_returns_original_handover():
+    success, handover_id = save_handover_safe(handover_data(ngay='2026-05-01'), request_key='form-0001')
+    assert success
+
+    # Double-click / gửi lại sau khi mất phản hồi, dữ liệu form có thể đã bị sửa
+    resubmitted = handover_data(ngay='2026-05-01', ten_nv='Nguyen Van Khac')
+    assert save_handover_safe(resubmitted, request_key='form-0001') == (True, handover_id)
+
+    assert _count_by_request_key('form-0001') == 1
+    assert get_handover_by_id(handover_id)['ten_nv'] == 'Nguyen Van A'
+
+
+def test_different_request_keys_create_separate_handovers():
+    first = save_handover_safe(handover_data(ngay='2026-05-01'), request_key='form-0002')
+    second = save_handover_safe(handover_data(ngay='2026-05-01'), request_key='form-0003')
+    assert first[0] and second[0]
+    assert first[1] != second[1]
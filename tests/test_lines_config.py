@@ -0,0 +1,32 @@
+"""Đổi tên line: chỉ sửa danh mục lines, lịch sử hiển thị và lọc được theo tên mới qua line_id"""
+from conftest import handover_data
+from db_operations import get_all_lines, get_handover_by_id, save_handover_safe, save_lines_config, search_handovers
+from database import get_connection, Handover
+
+
+def _stored(handover_id):
+    with get_connection() as conn:
+        return conn.execute(
+            Handover.__table__.select().where(Handover.__table__.c.handover_id == handover_id)
+        ).first()
+
+
+def test_rename_keeps_history_untouched():
+    lines = get_all_lines()
+    old_name = lines[-1]['line_name']
+    success, handover_id = save_handover_safe(handover_data(line=old_name, ngay='2026-04-01'))
+    assert success
+    before = _stored(handover_id)
+
+    renamed = [{**line, 'line_name': 'Renamed'} if line is lines[-1] else line for line in lines]
+    try:
+        assert save_lines_config(renamed)
+        assert get_handover_by_id(handover_id)['line'] == 'Renamed'
+        found = search_handovers(from_date='2026-04-01', to_date='2026-04-01', line='Renamed')
+        assert [item['ID Giao Ca'] for item in found] == [handover_id]
+        assert search_handovers(from_date='2026-04-01', to_date='2026-04-01', line=old_name) == []
+
+        after = _stored(handover_id)
+        assert (after.line, after.updated_at, after.version) == (old_name, before.updated_at, before.version)
+    finally:
+        assert save_lines_config(lines)
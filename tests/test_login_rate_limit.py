@@ -0,0 +1,14 @@
+"""Giới hạn đăng nhập sai theo cả tài khoản lẫn client"""
+from auth import LOGIN_MAX_ATTEMPTS
+from db_operations import check_login
+
+
+def test_client_locked_out_after_trying_many_usernames():
+    # Mỗi username chỉ sai 1 lần (dưới giới hạn theo tài khoản) nhưng cùng một client
+    for attempt in range(LOGIN_MAX_ATTEMPTS):
+        assert check_login(f'guess{attempt}', 'wrong', client_key='ip:10.0.0.9') == (False, None)
+
+    # Client bị khóa kể cả với tài khoản và mật khẩu đúng
+    assert check_login('admin', 'admin123', client_key='ip:10.0.0.9') == (False, None)
+    # Client khác không bị ảnh hưởng
+    assert check_login('admin', 'admin123', client_key='ip:10.0.0.10')[0]
@@ -0,0 +1,56 @@
+"""Migration theo version: chạy một lần, các bước idempotent trên database cũ"""
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from auth import is_password_hash, verify_password
+from migrations import MigrationContext, _0005_hash_user_passwords, get_pending_migrations, upgrade
+
+
+@pytest.fixture
+def old_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    yield engine
+    engine.dispose()
+
+
+def _column_type(engine, table_name, column_name):
+    column = next(c for c in inspect(engine).get_columns(table_name) if c['name'] == column_name)
+    return column['type'].compile(dialect=engine.dialect)
+
+
+def test_upgrade_after_init_has_nothing_to_apply():
+    assert get_pending_migrations() == []
+    assert upgrade(verbose=False) == []
+
+
+def test_hash_user_passwords_on_old_schema(old_engine):
+    with old_engine.begin() as conn:
+        conn.exec_driver_sql(
+            'CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(50) NOT NULL, '
+            'password VARCHAR(100) NOT NULL, full_name VARCHAR(200), created_at DATETIME)'
+        )
+        conn.exec_driver_sql("INSERT INTO users (id, username, password) VALUES (1, 'admin', 'admin123')")
+    ctx = MigrationContext(old_engine)
+
+    _0005_hash_user_passwords(ctx)
+    assert _column_type(old_engine, 'users', 'password') == 'VARCHAR(255)'
+    [(stored,)] = ctx.execute('SELECT password FROM users')
+    assert is_password_hash(stored) and verify_password('admin123', stored)[0]
+
+    # Chạy lại: cột đã đúng kiểu thì không dựng lại bảng, mật khẩu đã hash giữ nguyên
+    assert ctx.alter_column_type('users', 'password') is False
+    _0005_hash_user_passwords(ctx)
+    assert ctx.execute('SELECT password FROM users') == [(stored,)]
+
+
+def test_index_steps_are_idempotent(old_engine):
+    ctx = MigrationContext(old_engine)
+    assert ctx.create_table('handovers')
+    assert not ctx.create_table('handovers')
+
+    assert ctx.drop_index('handovers', 'ix_handovers_trend_counts')
+    assert not ctx.drop_index('handovers', 'ix_handovers_trend_counts')
+    assert ctx.create_index('handovers', 'ix_handovers_trend_counts')
+    assert not ctx.create_index('handovers', 'ix_handovers_trend_counts')
+    # Index đã bị thay thế (không còn trong model) thì bỏ qua
+    assert not ctx.create_index('handovers', 'ix_handovers_trend_cover_line_id')
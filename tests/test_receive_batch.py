@@ -0,0 +1,45 @@
+"""Nhận nhiều ca trong một transaction: lỗi giữa chừng hủy toàn bộ lô"""
+from conftest import handover_data, receive_data
+from db_operations import get_handover_by_id, get_receive_by_handover_id, save_handover_safe, save_receives_batch
+
+
+def _create_handovers(ngay, count):
+    handover_ids = []
+    for _ in range(count):
+        success, handover_id = save_handover_safe(handover_data(ngay=ngay))
+        assert success
+        handover_ids.append(handover_id)
+    return handover_ids
+
+
+def test_failed_row_rolls_back_whole_batch():
+    handover_ids = _create_handovers('2026-05-10', 3)
+    items = [{'handover_id': handover_id, 'data': receive_data(ngay='2026-05-10')} for handover_id in handover_ids]
+    # Phiếu nhận cuối vi phạm NOT NULL (ma_nv_nhan_ca) sau khi cả lô đã được claim
+    items[-1]['data']['ma_nv'] = None
+
+    success, results = save_receives_batch(items)
+    assert not success
+    assert all(not ok for ok, _ in results.values())
+    for handover_id in handover_ids:
+        assert get_handover_by_id(handover_id)['trang_thai'] == 'Chưa nhận'
+        assert get_receive_by_handover_id(handover_id) is None
+
+    # Gửi lại lô hợp lệ thì nhận được cả lô
+    items[-1]['data'] = receive_data(ngay='2026-05-10')
+    success, results = save_receives_batch(items)
+    assert success
+    assert all(ok for ok, _ in results.values())
+
+
+def test_already_received_handover_rejected_without_blocking_others():
+    handover_ids = _create_handovers('2026-05-11', 3)
+    assert save_receives_batch([{'handover_id': handover_ids[0], 'data': receive_data(ngay='2026-05-11')}])[0]
+
+    items = [{'handover_id': handover_id, 'data': receive_data(ngay='2026-05-11')}
+             for handover_id in handover_ids + ['HO-KHONG-CO']]
+    success, results = save_receives_batch(items)
+    assert success
+    assert results[handover_ids[0]] == (False, "Bàn giao đã được nhận bởi người khác")
+    assert results['HO-KHONG-CO'] == (False, "Không tìm thấy bàn giao")
+    assert results[handover_ids[1]] == results[handover_ids[2]] == (True, "Success")
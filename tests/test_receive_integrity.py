@@ -0,0 +1,59 @@
+"""Một bàn giao chỉ có một phiếu nhận; xóa hẳn bàn giao xóa luôn phiếu nhận (khóa ngoại)"""
+import threading
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from conftest import handover_data, receive_data
+from database import get_connection, Handover, Receive
+from db_operations import _build_receive_values, save_handover_safe, save_receive_safe
+
+
+def _receive_count(handover_id):
+    with get_connection() as conn:
+        return conn.execute(
+            select(func.count()).where(Receive.__table__.c.handover_id == handover_id)
+        ).scalar()
+
+
+def test_competing_receives_exactly_one_wins():
+    success, handover_id = save_handover_safe(handover_data(ngay='2026-05-20'))
+    assert success
+
+    workers = 4
+    barrier = threading.Barrier(workers)
+    results = []
+
+    def receive(index):
+        barrier.wait()
+        results.append(save_receive_safe(receive_data(ngay='2026-05-20', ma_nv=f'90000{index}'), handover_id))
+
+    threads = [threading.Thread(target=receive, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [(False, "Bàn giao đã được nhận bởi người khác")] * (workers - 1) + [(True, "Success")]
+    assert _receive_count(handover_id) == 1
+
+
+def test_receive_requires_existing_handover():
+    with pytest.raises(IntegrityError):
+        with get_connection() as conn:
+            with conn.begin():
+                conn.execute(Receive.__table__.insert().values(
+                    **_build_receive_values(receive_data(ngay='2026-05-21'), 'HO-KHONG-CO')
+                ))
+
+
+def test_hard_delete_of_handover_cascades_to_receive():
+    success, handover_id = save_handover_safe(handover_data(ngay='2026-05-21'))
+    assert success
+    assert save_receive_safe(receive_data(ngay='2026-05-21'), handover_id)[0]
+
+    with get_connection() as conn:
+        with conn.begin():
+            conn.execute(Handover.__table__.delete().where(Handover.__table__.c.handover_id == handover_id))
+    assert _receive_count(handover_id) == 0
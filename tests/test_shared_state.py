@@ -0,0 +1,46 @@
+"""Backend của shared state: giá trị lưu dạng JSON (không giải mã pickle), key hết hạn được dọn khi ghi"""
+import pickle
+import time
+from datetime import date, datetime
+
+from shared_state import MemoryBackend, SQLiteFileBackend
+
+
+def test_values_round_trip_as_json(tmp_path):
+    state = SQLiteFileBackend(str(tmp_path / 'state.db'))
+    value = [{'ID Giao Ca': 'H1', 'Thời Gian Giao': datetime(2026, 1, 5, 7, 30), 'Ngày': date(2026, 1, 5), 'OK': 6}]
+    state.set('dashboard', value)
+    assert state.get('dashboard') == value
+    assert state.incr('counter') == 1
+    assert state.incr('counter') == 2
+
+
+class _Exploit:
+    def __reduce__(self):
+        return (exec, ("raise SystemExit('pickle executed')",))
+
+
+def test_pickled_value_is_not_loaded(tmp_path):
+    state = SQLiteFileBackend(str(tmp_path / 'state.db'))
+    with state._transaction() as conn:
+        conn.execute("INSERT INTO shared_state (key, value) VALUES ('key', ?)", (pickle.dumps(_Exploit()),))
+    assert state.get('key') is None
+
+
+def _write_versions(state, versions=200):
+    """Mỗi lần ghi dữ liệu tăng version: snapshot của version cũ không bao giờ được đọc lại"""
+    for version in range(versions):
+        state.set(f'dashboard:{version}:2026-01-05', [{'ID Giao Ca': f'H{version}'}], ttl=0.001)
+        time.sleep(0.002)
+
+
+def test_memory_backend_sweeps_expired_versions():
+    state = MemoryBackend(sweep_interval=0)
+    _write_versions(state)
+    assert len(state._data) <= 2
+
+
+def test_sqlite_backend_sweeps_expired_versions(tmp_path):
+    state = SQLiteFileBackend(str(tmp_path / 'state.db'), sweep_interval=0)
+    _write_versions(state)
+    assert state._connect().execute("SELECT COUNT(*) FROM shared_state").fetchone()[0] <= 2
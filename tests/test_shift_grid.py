@@ -0,0 +1,37 @@
+"""Lịch ca dự kiến: ca thiếu bàn giao (anti-join) và lưới line × ca của một ngày"""
+from datetime import date, timedelta
+
+from conftest import handover_data, receive_data
+from db_operations import delete_handover, get_missing_handovers, get_shift_grid, save_handover_safe, save_receive_safe
+
+MORNING, NIGHT = 'Ca Sáng (7h-19h)', 'Ca Tối (19h-7h)'
+LINES = ['Line 30A', 'Line 30B']
+
+
+def test_day_with_one_shift_missing_per_line():
+    day = '2026-05-26'
+    success, received_id = save_handover_safe(handover_data(line='Line 30A', ngay=day, ca=MORNING))
+    assert success
+    assert save_receive_safe(receive_data(line='Line 30A', ngay=day), received_id)[0]
+    assert save_handover_safe(handover_data(line='Line 30B', ngay=day, ca=NIGHT))[0]
+    # Bàn giao đã xóa không được tính là đã nộp
+    success, deleted_id = save_handover_safe(handover_data(line='Line 30A', ngay=day, ca=NIGHT))
+    assert success
+    assert delete_handover(deleted_id)[0]
+
+    assert get_missing_handovers(day, day, LINES) == [
+        {'ngay': day, 'line': 'Line 30A', 'ca': NIGHT},
+        {'ngay': day, 'line': 'Line 30B', 'ca': MORNING},
+    ]
+
+    grid = get_shift_grid(day, LINES)
+    assert grid['shifts'] == [MORNING, NIGHT]
+    assert grid['rows'] == [
+        {'line': 'Line 30A', 'cells': {MORNING: 'received', NIGHT: 'missing'}},
+        {'line': 'Line 30B', 'cells': {MORNING: 'missing', NIGHT: 'pending'}},
+    ]
+
+
+def test_future_days_are_not_missing():
+    tomorrow = date.today() + timedelta(days=1)
+    assert get_missing_handovers(tomorrow, tomorrow + timedelta(days=7), LINES) == []
@@ -0,0 +1,43 @@
+"""Thời gian chờ nhận ca (phân vị tính trong SQL) và cảnh báo SLA"""
+from datetime import datetime, timedelta
+
+from conftest import handover_data, receive_data
+from db_analytics import get_receive_latency_stats
+from db_operations import delete_receive, save_handover_safe, save_receive_safe
+from sla_monitor import evaluate_sla_breaches, get_open_sla_alerts
+
+
+def test_latency_percentiles_per_line_and_shift():
+    given_at = datetime(2026, 6, 2, 7, 0)
+    for minutes in (40, 10, 30, 20):
+        success, handover_id = save_handover_safe(handover_data(line='Line 20B', ngay='2026-06-02'), submitted_at=given_at)
+        assert success
+        received_at = given_at + timedelta(minutes=minutes)
+        assert save_receive_safe(receive_data(line='Line 20B', ngay='2026-06-02'), handover_id, submitted_at=received_at)[0]
+
+    stats = get_receive_latency_stats('2026-06-02', '2026-06-02', line_filter='Line 20B')
+    assert len(stats) == 1
+    row = stats[0]
+    assert (row['Line'], row['Số Lượt Nhận'], row['Trung Bình (phút)']) == ('Line 20B', 4, 25.0)
+    assert (row['P50 (phút)'], row['P90 (phút)'], row['P95 (phút)'], row['Tối Đa (phút)']) == (20.0, 40.0, 40.0, 40.0)
+
+
+def test_alert_opens_closes_and_reopens_with_receive_state():
+    now = datetime.now()
+    success, late_id = save_handover_safe(handover_data(ngay='2026-06-01'), submitted_at=now - timedelta(hours=2))
+    assert success
+    assert save_handover_safe(handover_data(ngay='2026-06-01'), submitted_at=now)[0]
+
+    evaluate_sla_breaches(sla_minutes=60)
+    assert set(get_open_sla_alerts('2026-06-01', 'Line 20A')) == {late_id}
+    # Chạy lại không tạo cảnh báo trùng
+    assert evaluate_sla_breaches(sla_minutes=60)['new'] == 0
+
+    assert save_receive_safe(receive_data(ngay='2026-06-01'), late_id)[0]
+    evaluate_sla_breaches(sla_minutes=60)
+    assert get_open_sla_alerts('2026-06-01', 'Line 20A') == {}
+
+    # Phiếu nhận bị xóa: bàn giao quay về 'Chưa nhận', cảnh báo mở lại
+    assert delete_receive(late_id)[0]
+    assert evaluate_sla_breaches(sla_minutes=60)['reopened'] == 1
+    assert set(get_open_sla_alerts('2026-06-01', 'Line 20A')) == {late_id}
@@ -0,0 +1,63 @@
+"""Xóa mềm vào thùng rác, khôi phục, và job purge xóa hẳn sau thời gian lưu trữ"""
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from conftest import handover_data, receive_data
+from data_purge import purge_deleted_records
+from database import get_connection, Handover, Receive
+from db_operations import (
+    delete_handover,
+    get_deleted_items,
+    get_handover_by_id,
+    get_receive_by_handover_id,
+    restore_handover,
+    save_handover_safe,
+    save_receive_safe
+)
+
+
+def _received_handover(ngay):
+    success, handover_id = save_handover_safe(handover_data(ngay=ngay))
+    assert success
+    assert save_receive_safe(receive_data(ngay=ngay), handover_id)[0]
+    return handover_id
+
+
+def _row_count(table, handover_id):
+    with get_connection() as conn:
+        return conn.execute(select(func.count()).where(table.c.handover_id == handover_id)).scalar()
+
+
+def test_delete_moves_handover_and_receive_to_trash_until_restored():
+    handover_id = _received_handover('2026-06-10')
+
+    assert delete_handover(handover_id)[0]
+    assert get_handover_by_id(handover_id) is None
+    assert get_receive_by_handover_id(handover_id) is None
+    assert handover_id in [item['ID Giao Ca'] for item in get_deleted_items()['handovers']]
+
+    assert restore_handover(handover_id)[0]
+    assert get_handover_by_id(handover_id)['trang_thai'] == 'Đã nhận'
+    assert get_receive_by_handover_id(handover_id)['handover_id'] == handover_id
+    assert handover_id not in [item['ID Giao Ca'] for item in get_deleted_items()['handovers']]
+
+
+def test_purge_removes_only_records_past_retention():
+    expired_id = _received_handover('2026-06-11')
+    recent_id = _received_handover('2026-06-11')
+    assert delete_handover(expired_id)[0]
+    assert delete_handover(recent_id)[0]
+
+    # Bàn giao bị xóa từ 40 ngày trước (quá hạn lưu trữ 30 ngày)
+    old = datetime.now() - timedelta(days=40)
+    with get_connection() as conn:
+        with conn.begin():
+            for table in (Handover.__table__, Receive.__table__):
+                conn.execute(table.update().where(table.c.handover_id == expired_id).values(deleted_at=old))
+
+    assert purge_deleted_records(retention_days=30, force=True)['handovers'] >= 1
+    assert _row_count(Handover.__table__, expired_id) == 0
+    assert _row_count(Receive.__table__, expired_id) == 0
+    assert _row_count(Handover.__table__, recent_id) == 1
+    assert _row_count(Receive.__table__, recent_id) == 1
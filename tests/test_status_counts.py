@@ -0,0 +1,41 @@
+"""Số hạng mục OK/NOK/NA lưu khi ghi, dùng cho danh sách bàn giao khẩn cấp (có NOK)"""
+from datetime import date
+
+from sqlalchemy import select
+
+from conftest import handover_data
+from database import get_connection, Handover
+from db_operations import get_pending_handovers, save_handover_safe, update_handover
+
+
+def _counts(handover_id):
+    table = Handover.__table__
+    with get_connection() as conn:
+        return tuple(conn.execute(
+            select(table.c.ok_count, table.c.nok_count, table.c.na_count).where(table.c.handover_id == handover_id)
+        ).one())
+
+
+def _urgent_ids(day):
+    return {item['ID Giao Ca'] for item in get_pending_handovers(day, ['Line 30A'], urgent_only=True)}
+
+
+def test_counts_follow_status_edits_and_drive_urgent_list():
+    day = date(2026, 6, 20)
+    statuses = {'5S - Tình Trạng': 'NOK', 'An Toàn - Tình Trạng': 'NOK', 'Khác - Tình Trạng': 'NA'}
+    success, urgent_id = save_handover_safe(handover_data(line='Line 30A', ngay='2026-06-20', **statuses))
+    assert success
+    success, normal_id = save_handover_safe(handover_data(line='Line 30A', ngay='2026-06-20'))
+    assert success
+
+    assert _counts(urgent_id) == (3, 2, 1)
+    assert _counts(normal_id) == (6, 0, 0)
+    assert _urgent_ids(day) == {urgent_id}
+
+    assert update_handover(urgent_id, {'5S - Tình Trạng': 'OK', 'An Toàn - Tình Trạng': 'OK'})[0]
+    assert _counts(urgent_id) == (5, 0, 1)
+    assert _urgent_ids(day) == set()
+
+    assert update_handover(normal_id, {'Thiết Bị - Tình Trạng': 'NOK'})[0]
+    assert _counts(normal_id) == (5, 1, 0)
+    assert _urgent_ids(day) == {normal_id}
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+from conftest import handover_data, receive_data
+
+
+@pytest.fixture
+def outage(monkeypatch):
+    """Database chính không kết nối được (engine trỏ tới đường dẫn không tồn tại)"""
+    import database
+    import write_spool
+    monkeypatch.setattr(database, '_engine', create_engine('sqlite:////nonexistent/dir/handover.db'))
+    yield
+    monkeypatch.undo()
+    write_spool._close_breaker()
+    write_spool._connect().execute('DELETE FROM write_spool')
+
+
+def test_replay_keeps_submission_time(outage, monkeypatch):
+    import database
+    import db_operations as ops
+    import write_spool
+
+    submitted = datetime.now()
+    assert write_spool.submit_handover(handover_data(line='Line 40B', ngay='2026-03-01'), request_key='spool-time') == (True, None, True)
+
+    monkeypatch.undo()
+    write_spool._close_breaker()
+    # Phát lại muộn: thời gian giao ca vẫn là lúc gửi form
+    real_now = datetime.now() + timedelta(minutes=20)
+    monkeypatch.setattr(ops, 'datetime', type('LateDatetime', (datetime,), {'now': classmethod(lambda cls: real_now)}))
+    assert write_spool.replay_spool()['replayed'] == 1
+    monkeypatch.undo()
+
+    ok, handover_id = ops.save_handover_safe(handover_data(line='Line 40B', ngay='2026-03-01'), request_key='spool-time')
+    assert ok
+    with database.get_connection() as conn:
+        saved_at = conn.exec_driver_sql(
+            'SELECT thoi_gian_giao_ca FROM handovers WHERE handover_id = ?', (handover_id,)
+        ).scalar()
+    assert abs((datetime.fromisoformat(str(saved_at)) - submitted).total_seconds()) < 5
+
+
+def test_outage_spools_without_running_the_save_retry_loop(outage, monkeypatch):
+    import write_spool
+
+    def slow_save(*args, **kwargs):
+        raise AssertionError("save_handover_safe không được chạy khi database mất kết nối")
+
+    monkeypatch.setattr(write_spool, 'save_handover_safe', slow_save)
+    assert write_spool.submit_handover(handover_data(), request_key='spool-fast') == (True, None, True)
+    assert write_spool.breaker_open()
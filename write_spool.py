@@ -0,0 +1,348 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+from database import get_engine, DATABASE_URL, is_postgresql
+from db_operations import save_handover_safe, save_receive_safe
+from background_jobs import start_periodic_job
+
+# ===== WRITE SPOOL (OUTBOX) =====
+# Khi database chính không kết nối được (Postgres khởi động lại, free tier đang ngủ),
+# form giao/nhận ca không báo lỗi mà ghi bản ghi vào outbox SQLite cục bộ
+# (WRITE_SPOOL_PATH, commit với synchronous=FULL). Job nền phát lại theo đúng thứ tự
+# ghi khi kết nối trở lại:
+#   - bàn giao phát lại qua save_handover_safe với request_key của form: đã lưu
+#     rồi thì trả về handover_id cũ, không tạo trùng
+#   - phiếu nhận phát lại qua save_receive_safe: bàn giao đã được nhận thì bị từ chối
+#   - thời gian giao/nhận ca là thời điểm người dùng gửi form (lưu trong payload), không
+#     phải thời điểm phát lại, để SLA, thống kê thời gian nhận và thứ tự dashboard đúng
+# Bản ghi bị database từ chối (không phải lỗi kết nối) chuyển sang 'failed' để admin xem.
+#
+# Trước khi ghi, kiểm tra kết nối bằng một connection riêng có timeout ngắn
+# (WRITE_SPOOL_PROBE_TIMEOUT_SECONDS) thay vì để vòng retry của save_* chờ hết
+# connect_timeout của pool chính. Circuit breaker: sau một lần phát hiện mất kết nối,
+# trong WRITE_SPOOL_BREAKER_SECONDS các lần ghi đi thẳng vào outbox, không kiểm tra lại.
+
+# File SQLite chứa outbox (dùng chung cho các worker trên cùng máy)
+WRITE_SPOOL_PATH = os.getenv('WRITE_SPOOL_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'write_spool.db'))
+
+# Thời gian ghi thẳng vào outbox sau khi phát hiện mất kết nối (giây)
+WRITE_SPOOL_BREAKER_SECONDS = int(os.getenv('WRITE_SPOOL_BREAKER_SECONDS', '30'))
+
+# Timeout kết nối khi kiểm tra database có kết nối được không (giây)
+WRITE_SPOOL_PROBE_TIMEOUT_SECONDS = int(os.getenv('WRITE_SPOOL_PROBE_TIMEOUT_SECONDS', '2'))
+
+# Chu kỳ phát lại (giây)
+WRITE_SPOOL_REPLAY_INTERVAL_SECONDS = int(os.getenv('WRITE_SPOOL_REPLAY_INTERVAL_SECONDS', '15'))
+
+# Bản ghi 'replaying' quá thời gian này (worker chết giữa chừng) được phát lại lần nữa (giây)
+WRITE_SPOOL_CLAIM_TIMEOUT_SECONDS = 300
+
+JOB_NAME = 'write_spool_replay'
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+_breaker_lock = threading.Lock()
+_breaker_open_until = 0.0
+
+_probe_engine = None
+_probe_engine_lock = threading.Lock()
+
+
+def _connect():
+    """Connection tới file outbox, mỗi thread một connection (autocommit, WAL)"""
+    global _schema_ready
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(WRITE_SPOOL_PATH, timeout=10, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Bản ghi trong outbox là dữ liệu duy nhất của ca làm việc: fsync mỗi commit
+        conn.execute('PRAGMA synchronous=FULL')
+        _local.conn = conn
+    if not _schema_ready:
+        with _schema_lock:
+            if not _schema_ready:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS write_spool ("
+                    "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                    "kind TEXT NOT NULL, "
+                    "payload TEXT NOT NULL, "
+                    "request_key TEXT, "
+                    "handover_id TEXT, "
+                    "status TEXT NOT NULL DEFAULT 'pending', "
+                    "attempts INTEGER NOT NULL DEFAULT 0, "
+                    "last_error TEXT, "
+                    "created_at REAL NOT NULL, "
+                    "claimed_at REAL)"
+                )
+                conn.execute("CREATE INDEX IF NOT EXISTS ix_write_spool_status_id ON write_spool (status, id)")
+                _schema_ready = True
+    return conn
+
+
+def _get_probe_engine():
+    """
+    Engine dùng để kiểm tra kết nối: PostgreSQL dùng connection mới (không pool) với
+    connect_timeout ngắn; SQLite là file cục bộ, dùng engine chính
+    """
+    global _probe_engine
+    if not is_postgresql:
+        return get_engine()
+    if _probe_engine is None:
+        with _probe_engine_lock:
+            if _probe_engine is None:
+                _probe_engine = create_engine(
+                    DATABASE_URL,
+                    poolclass=NullPool,
+                    connect_args={'connect_timeout': WRITE_SPOOL_PROBE_TIMEOUT_SECONDS}
+                )
+    return _probe_engine
+
+
+def database_available():
+    """Database chính có kết nối được không (SELECT 1, chờ tối đa WRITE_SPOOL_PROBE_TIMEOUT_SECONDS)"""
+    try:
+        with _get_probe_engine().connect() as conn:
+            conn.exec_driver_sql('SELECT 1')
+        return True
+    except Exception as e:
+        print(f"Database unavailable: {e}")
+        return False
+
+
+def breaker_open():
+    """Đang trong thời gian ghi thẳng vào outbox sau khi mất kết nối"""
+    return time.monotonic() < _breaker_open_until
+
+
+def _open_breaker():
+    global _breaker_open_until
+    with _breaker_lock:
+        _breaker_open_until = time.monotonic() + WRITE_SPOOL_BREAKER_SECONDS
+
+
+def _close_breaker():
+    global _breaker_open_until
+    with _breaker_lock:
+        _breaker_open_until = 0.0
+
+
+def _enqueue(kind, data, submitted_at, request_key=None, handover_id=None):
+    """Ghi một bản ghi vào outbox (kèm thời điểm gửi form). Returns: id trong outbox"""
+    payload = {'data': data, 'submitted_at': submitted_at.isoformat()}
+    cursor = _connect().execute(
+        "INSERT INTO write_spool (kind, payload, request_key, handover_id, created_at) VALUES (?, ?, ?, ?, ?)",
+        (kind, json.dumps(payload, ensure_ascii=False, default=str), request_key, handover_id, time.time())
+    )
+    print(f"Spooled {kind} #{cursor.lastrowid} while database is unavailable")
+    return cursor.lastrowid
+
+
+def _submit(kind, save, data, request_key=None, handover_id=None):
+    """Ghi vào database; mất kết nối thì ghi vào outbox. Returns: (success, result, spooled)"""
+    submitted_at = datetime.now()
+    if breaker_open():
+        _enqueue(kind, data, submitted_at, request_key, handover_id)
+        return True, None, True
+
+    # Kiểm tra nhanh trước: mất kết nối thì không chạy vòng retry của save_*
+    if database_available():
+        success, result = save(submitted_at)
+        if success or database_available():
+            # Lỗi nghiệp vụ (đã được nhận, không tìm thấy...) trả về cho form như cũ
+            return success, result, False
+
+    _open_breaker()
+    _enqueue(kind, data, submitted_at, request_key, handover_id)
+    return True, None, True
+
+
+def submit_handover(data, request_key=None, max_retries=10):
+    """
+    Lưu bàn giao, tự chuyển sang outbox khi database không kết nối được
+
+    Args:
+        data: dict dữ liệu bàn giao (cùng định dạng với save_handover_safe)
+        request_key: khóa idempotency của form (None = tạo mới, cần để phát lại không trùng)
+        max_retries: số lần thử của save_handover_safe
+
+    Returns:
+        (success: bool, result: handover_id hoặc thông báo lỗi (None nếu vào outbox), spooled: bool)
+    """
+    request_key = request_key or uuid.uuid4().hex
+    return _submit(
+        'handover',
+        lambda submitted_at: save_handover_safe(
+            data, max_retries=max_retries, request_key=request_key, submitted_at=submitted_at
+        ),
+        data, request_key=request_key
+    )
+
+
+def submit_receive(data, handover_id):
+    """
+    Lưu phiếu nhận ca, tự chuyển sang outbox khi database không kết nối được
+
+    Returns:
+        (success: bool, message: str (None nếu vào outbox), spooled: bool)
+    """
+    return _submit(
+        'receive', lambda submitted_at: save_receive_safe(data, handover_id, submitted_at=submitted_at),
+        data, handover_id=handover_id
+    )
+
+
+def _replay_entry(kind, payload, request_key, handover_id):
+    """Ghi lại một bản ghi trong outbox vào database với thời điểm gửi gốc. Returns: (success, message)"""
+    payload = json.loads(payload)
+    data = payload['data']
+    submitted_at = datetime.fromisoformat(payload['submitted_at'])
+    if kind == 'handover':
+        return save_handover_safe(data, request_key=request_key, submitted_at=submitted_at)
+    return save_receive_safe(data, handover_id, submitted_at=submitted_at)
+
+
+def replay_spool():
+    """
+    Phát lại các bản ghi 'pending' theo thứ tự ghi vào outbox; dừng ở bản ghi đầu tiên
+    gặp lỗi kết nối để giữ thứ tự
+
+    Returns: dict {'replayed', 'failed', 'pending'} (None nếu database vẫn chưa kết nối được)
+    """
+    conn = _connect()
+    if not conn.execute("SELECT 1 FROM write_spool WHERE status IN ('pending', 'replaying') LIMIT 1").fetchone():
+        return {'replayed': 0, 'failed': 0, 'pending': 0}
+
+    if not database_available():
+        _open_breaker()
+        return None
+    _close_breaker()
+
+    conn.execute(
+        "UPDATE write_spool SET status = 'pending' WHERE status = 'replaying' AND claimed_at < ?",
+        (time.time() - WRITE_SPOOL_CLAIM_TIMEOUT_SECONDS,)
+    )
+
+    replayed = failed = 0
+    entries = conn.execute(
+        "SELECT id, kind, payload, request_key, handover_id FROM write_spool WHERE status = 'pending' ORDER BY id"
+    ).fetchall()
+    for entry in entries:
+        entry_id = entry[0]
+        # Nhận quyền phát lại (worker khác dùng chung file có thể đang chạy cùng lúc)
+        claimed = conn.execute(
+            "UPDATE write_spool SET status = 'replaying', claimed_at = ?, attempts = attempts + 1 "
+            "WHERE id = ? AND status = 'pending'",
+            (time.time(), entry_id)
+        ).rowcount
+        if not claimed:
+            continue
+
+        success, message = _replay_entry(*entry[1:])
+        if success:
+            conn.execute("DELETE FROM write_spool WHERE id = ?", (entry_id,))
+            replayed += 1
+        elif database_available():
+            conn.execute("UPDATE write_spool SET status = 'failed', last_error = ? WHERE id = ?", (message, entry_id))
+            failed += 1
+        else:
+            conn.execute("UPDATE write_spool SET status = 'pending', last_error = ? WHERE id = ?", (message, entry_id))
+            _open_breaker()
+            break
+
+    pending = conn.execute("SELECT COUNT(*) FROM write_spool WHERE status IN ('pending', 'replaying')").fetchone()[0]
+    if replayed or failed:
+        print(f"Write spool: replayed {replayed}, failed {failed}, {pending} pending")
+    return {'replayed': replayed, 'failed': failed, 'pending': pending}
+
+
+def get_spool_status():
+    """
+    Độ sâu hàng đợi outbox cho trang quản trị
+
+    Returns: dict {'pending': int, 'failed': int, 'oldest': datetime hoặc None, 'breaker_open': bool}
+    """
+    try:
+        counts = dict(_connect().execute(
+            "SELECT CASE WHEN status = 'failed' THEN 'failed' ELSE 'pending' END, COUNT(*) "
+            "FROM write_spool GROUP BY 1"
+        ).fetchall())
+        oldest = _connect().execute(
+            "SELECT MIN(created_at) FROM write_spool WHERE status != 'failed'"
+        ).fetchone()[0]
+        return {
+            'pending': counts.get('pending', 0),
+            'failed': counts.get('failed', 0),
+            'oldest': datetime.fromtimestamp(oldest) if oldest else None,
+            'breaker_open': breaker_open()
+        }
+    except Exception as e:
+        print(f"Error getting spool status: {e}")
+        return {'pending': 0, 'failed': 0, 'oldest': None, 'breaker_open': breaker_open()}
+
+
+def get_failed_spool_entries(limit=100):
+    """
+    Các bản ghi bị database từ chối khi phát lại
+
+    Returns: list of dict
+    """
+    try:
+        rows = _connect().execute(
+            "SELECT id, kind, payload, handover_id, attempts, last_error, created_at "
+            "FROM write_spool WHERE status = 'failed' ORDER BY id LIMIT ?",
+            (limit,)
+        ).fetchall()
+        results = []
+        for entry_id, kind, payload, handover_id, attempts, last_error, created_at in rows:
+            data = json.loads(payload)['data']
+            results.append({
+                'ID': entry_id,
+                'Loại': 'Giao ca' if kind == 'handover' else 'Nhận ca',
+                'ID Giao Ca': handover_id or '',
+                'Line': data.get('line', ''),
+                'Ca': data.get('ca', ''),
+                'Nhân Viên': f"{data.get('ma_nv', '')} - {data.get('ten_nv', '')}",
+                'Lỗi': last_error or '',
+                'Số Lần Thử': attempts,
+                'Thời Gian Ghi': datetime.fromtimestamp(created_at)
+            })
+        return results
+    except Exception as e:
+        print(f"Error getting failed spool entries: {e}")
+        return []
+
+
+def retry_spool_entries(entry_ids):
+    """Đưa các bản ghi 'failed' về hàng đợi để phát lại. Returns: số bản ghi"""
+    conn = _connect()
+    return sum(
+        conn.execute("UPDATE write_spool SET status = 'pending' WHERE id = ? AND status = 'failed'", (entry_id,)).rowcount
+        for entry_id in entry_ids
+    )
+
+
+def discard_spool_entries(entry_ids):
+    """Bỏ các bản ghi 'failed' khỏi outbox. Returns: số bản ghi"""
+    conn = _connect()
+    return sum(
+        conn.execute("DELETE FROM write_spool WHERE id = ? AND status = 'failed'", (entry_id,)).rowcount
+        for entry_id in entry_ids
+    )
+
+
+def start_spool_replay_job(interval_seconds=None, initial_delay=0):
+    """Khởi động job phát lại outbox chạy nền (mỗi process chỉ một lần)"""
+    return start_periodic_job(
+        JOB_NAME,
+        replay_spool,
+        interval_seconds or WRITE_SPOOL_REPLAY_INTERVAL_SECONDS,
+        initial_delay=initial_delay
+    )